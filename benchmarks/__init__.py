@@ -0,0 +1,9 @@
+"""
+Reproducible API benchmarks.
+
+``benchmarks.seed`` fills the database at a scale factor with
+deterministic, bulk-loaded data. ``benchmarks.load`` drives the real API
+routes with concurrent clients and summarises throughput, latency
+percentiles and queries per request. ``benchmarks.compare`` checks a run
+against a stored baseline. ``manage.py benchmark`` wires them together.
+"""
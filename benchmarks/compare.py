@@ -0,0 +1,48 @@
+"""
+Regression checks of a benchmark run against a stored baseline.
+
+Per endpoint, a run regresses when any of these hold:
+- throughput drops by more than ``tolerance``
+- a latency percentile rises by more than ``tolerance``
+- it makes more queries per request
+- it has more errors
+Latency is only comparable between runs on the same machine with the same
+settings, so runs at a different scale or concurrency are refused.
+"""
+
+LATENCIES = ("p50_ms", "p95_ms", "p99_ms")
+# Queries per request is an average over a random mix of paths, so allow rounding
+QUERY_SLACK = 0.5
+
+
+class NotComparable(ValueError):
+    pass
+
+
+def compare(results, baseline, tolerance=0.10):
+    """Regressions of ``results`` against ``baseline``, as readable lines; empty if none"""
+    for setting in ("scale", "seed", "concurrency"):
+        if results["meta"].get(setting) != baseline["meta"].get(setting):
+            raise NotComparable(
+                f"The baseline ran with {setting}={baseline['meta'].get(setting)!r}, "
+                f"this run with {results['meta'].get(setting)!r}"
+            )
+
+    problems = []
+    for name, base in baseline["endpoints"].items():
+        current = results["endpoints"].get(name)
+        if current is None:
+            problems.append(f"{name}: not part of this run")
+            continue
+        if base["rps"] and current["rps"] < base["rps"] * (1 - tolerance):
+            problems.append(f"{name}: {current['rps']} req/s, baseline {base['rps']}")
+        for metric in LATENCIES:
+            if base[metric] is not None and current[metric] is not None \
+                    and current[metric] > base[metric] * (1 + tolerance):
+                problems.append(f"{name}: {metric} {current[metric]}, baseline {base[metric]}")
+        base_queries, queries = base.get("queries_per_request"), current.get("queries_per_request")
+        if base_queries is not None and queries is not None and queries > base_queries + QUERY_SLACK:
+            problems.append(f"{name}: {queries} queries per request, baseline {base_queries}")
+        if current["errors"] > base["errors"]:
+            problems.append(f"{name}: {current['errors']} errors, baseline {base['errors']}")
+    return problems
@@ -0,0 +1,132 @@
+"""
+Concurrent load against the real API routes.
+
+``run_load`` spreads ``concurrency`` threads over a weighted mix of
+endpoints for ``duration`` seconds. Each thread has its own keep-alive
+session. The result summarises every endpoint and the whole run:
+requests/s, p50/p95/p99 latency and errors. It also gives the queries per
+request, read from the Server-Timing header ecommerce.instrumentation
+adds; that figure is None when instrumentation is off.
+"""
+import random
+import re
+import statistics
+import threading
+import time
+from collections import defaultdict, namedtuple
+
+import requests
+
+from .seed import bench_id, plan
+
+QUERIES = re.compile(r'db;[^,]*desc="(\d+) queries"')
+
+# ``paths`` are picked at random; ``auth`` endpoints get a bearer token
+Endpoint = namedtuple("Endpoint", ["name", "weight", "paths", "auth"])
+
+
+def percentile(samples, fraction):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def summarise(samples, errors, elapsed):
+    """``samples`` are ``(seconds, queries or None)`` of successful requests"""
+    latencies = [latency for latency, _ in samples]
+    queries = [count for _, count in samples if count is not None]
+
+    def ms(value):
+        return round(value * 1000, 2) if value is not None else None
+
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / elapsed, 2) if elapsed else 0,
+        "mean_ms": ms(statistics.fmean(latencies)) if latencies else None,
+        "p50_ms": ms(percentile(latencies, 0.50)),
+        "p95_ms": ms(percentile(latencies, 0.95)),
+        "p99_ms": ms(percentile(latencies, 0.99)),
+        "queries_per_request": round(statistics.fmean(queries), 2) if queries else None,
+    }
+
+
+def api_endpoints(scale, seed=1, sample=200):
+    """The request mix over the benchmark data seeded at ``scale`` with ``seed``"""
+    counts = plan(scale)
+    rng = random.Random(f"{seed}:paths")
+    products = [bench_id("p", rng.randrange(counts["products"])) for _ in range(sample)]
+    categories = [bench_id("c", rng.randrange(counts["categories"])) for _ in range(min(sample, 20))]
+    return [
+        Endpoint("products-list", 20, [
+            "/api/products/", "/api/products/?ordering=price", "/api/products/?ordering=-price&count=false",
+        ], False),
+        Endpoint("products-by-category", 10, [f"/api/products/?category={pk}" for pk in categories], False),
+        Endpoint("products-detail", 25, [f"/api/products/{pk}/" for pk in products], False),
+        Endpoint("reviews-list", 10, ["/api/reviews/"], False),
+        Endpoint("orders-list", 10, ["/api/orders/"], True),
+        Endpoint("carts-list", 10, ["/api/carts/"], True),
+        Endpoint("order-items-list", 10, ["/api/order-items/"], True),
+    ]
+
+
+def run_load(base_url, endpoints, concurrency, duration, tokens=(), seed=0, timeout=30):
+    """
+    Hit ``base_url`` with the ``endpoints`` mix from ``concurrency`` threads
+    for ``duration`` seconds. Thread ``i`` authenticates with
+    ``tokens[i % len(tokens)]``; without tokens the ``auth`` endpoints are
+    left out. Returns ``{"endpoints": {name: summary}, "total": summary}``.
+    """
+    endpoints = [endpoint for endpoint in endpoints if tokens or not endpoint.auth]
+    if not endpoints:
+        raise ValueError("No endpoints to run")
+    base_url = base_url.rstrip("/")
+    weights = [endpoint.weight for endpoint in endpoints]
+    samples, errors = defaultdict(list), defaultdict(int)
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker(number):
+        rng = random.Random(f"{seed}:{number}")
+        session = requests.Session()
+        token_headers = {"Authorization": f"Bearer {tokens[number % len(tokens)]}"} if tokens else {}
+        local, failed = defaultdict(list), defaultdict(int)
+        while time.perf_counter() < deadline:
+            endpoint = rng.choices(endpoints, weights)[0]
+            headers = token_headers if endpoint.auth else None
+            start = time.perf_counter()
+            try:
+                response = session.get(base_url + rng.choice(endpoint.paths), headers=headers, timeout=timeout)
+            except requests.RequestException:
+                failed[endpoint.name] += 1
+                continue
+            latency = time.perf_counter() - start
+            if response.status_code != 200:
+                failed[endpoint.name] += 1
+                continue
+            match = QUERIES.search(response.headers.get("Server-Timing", ""))
+            local[endpoint.name].append((latency, int(match.group(1)) if match else None))
+        with lock:
+            for name, values in local.items():
+                samples[name].extend(values)
+            for name, count in failed.items():
+                errors[name] += count
+
+    threads = [threading.Thread(target=worker, args=(number,)) for number in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    return {
+        "endpoints": {
+            endpoint.name: summarise(samples[endpoint.name], errors[endpoint.name], elapsed)
+            for endpoint in endpoints
+        },
+        "total": summarise(
+            [sample for values in samples.values() for sample in values], sum(errors.values()), elapsed
+        ),
+    }
@@ -0,0 +1,198 @@
+"""
+Deterministic benchmark data at a scale factor.
+
+``seed("10k", seed=1)`` loads 10,000 products plus proportional
+categories, users, reviews, carts and orders (see ``plan``). Products,
+reviews, carts, orders and order items are streamed in with COPY in
+chunks; categories and users go through ``bulk_create``. Every id,
+timestamp and value is derived from the seed and the row number, so the
+same arguments always produce the same rows. Ids start with ``bench`` and
+users live at @bench.invalid, which is how ``clear`` finds them without
+touching real data.
+"""
+import csv
+import io
+import random
+import uuid
+from datetime import datetime, timedelta, timezone
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+
+from login.models import CustomUser
+from products.cache import bump_generation
+from products.importer import copy_rows
+from products.models import Cart, Category, CategoryStats, Order, OrderItem, Product, Review
+from products.navigation import rebuild_category_stats
+from products.search import search_vector_sql
+
+ID_PREFIX = "bench"
+EMAIL_DOMAIN = "bench.invalid"
+USER_NAMESPACE = uuid.UUID("6f1d3c1e-8f0b-4a53-9b5e-0c1d2e3f4a5b")
+EPOCH = datetime(2025, 1, 1, tzinfo=timezone.utc)
+COPY_CHUNK = 50000
+REVIEWS_PER_USER = 20
+CARTS_PER_USER = 2
+ORDERS_PER_USER = 2
+ITEMS_PER_ORDER = 3
+SUFFIXES = {"k": 1000, "m": 1000 * 1000}
+WORDS = ["lamp", "desk", "chair", "kettle", "mug", "notebook", "cable", "speaker", "jacket", "boots",
+         "backpack", "monitor", "keyboard", "pillow", "blanket", "bottle", "charger", "headphones"]
+
+
+def parse_scale(scale):
+    """``"10k"`` -> 10000 products; plain numbers are taken as they are"""
+    text = str(scale).strip().lower()
+    multiplier = SUFFIXES.get(text[-1:], 1)
+    try:
+        products = int(float(text[:-1] if text[-1:] in SUFFIXES else text) * multiplier)
+    except ValueError:
+        raise ValueError(f"Scale must look like 10k, 1m or 5000, got {scale!r}")
+    if products < 1:
+        raise ValueError("Scale must be at least one product")
+    return products
+
+
+def plan(scale):
+    """Rows per table at ``scale``"""
+    products = parse_scale(scale)
+    users = max(10, products // 10)
+    return {
+        "categories": max(5, products // 2000),
+        "products": products,
+        "users": users,
+        "reviews": users * min(REVIEWS_PER_USER, products),
+        "carts": users * min(CARTS_PER_USER, products),
+        "orders": users * ORDERS_PER_USER,
+        "order_items": users * ORDERS_PER_USER * min(ITEMS_PER_ORDER, products),
+    }
+
+
+def bench_id(kind, number):
+    """A 22-character id such as ``benchp0000000000000042``, shaped like the ShortUUID ones"""
+    return f"{ID_PREFIX}{kind}{number:016d}"
+
+
+def user_id(number):
+    return uuid.uuid5(USER_NAMESPACE, str(number))
+
+
+def marker(scale, seed):
+    """Stored as the description of every benchmark category"""
+    return f"Benchmark data, {parse_scale(scale)} products, seed {seed}"
+
+
+def is_seeded(scale, seed):
+    return Category.all_objects.filter(pk=bench_id("c", 0), description=marker(scale, seed)).exists()
+
+
+def timestamp(number, step_seconds=30):
+    return (EPOCH + timedelta(seconds=number * step_seconds)).isoformat()
+
+
+def money(cents):
+    return f"{cents // 100}.{cents % 100:02d}"
+
+
+def copy_into(model, columns, rows):
+    """COPY ``rows`` (tuples in ``columns`` order) into ``model``'s table, COPY_CHUNK at a time"""
+    rows = iter(rows)
+    with connection.cursor() as cursor:
+        while chunk := list(islice(rows, COPY_CHUNK)):
+            buffer = io.StringIO()
+            csv.writer(buffer).writerows(chunk)
+            buffer.seek(0)
+            copy_rows(cursor, model._meta.db_table, columns, buffer)
+
+
+def seed(scale, seed=1, log=None):
+    """Load the benchmark data for ``scale``; returns the rows per table"""
+    if connection.vendor != "postgresql":
+        raise RuntimeError("Seeding benchmark data needs PostgreSQL (COPY)")
+    log = log or (lambda message: None)
+    counts = plan(scale)
+    # One generator per table, so changing one table's recipe leaves the others alone
+    rng = {table: random.Random(f"{seed}:{table}") for table in counts}
+
+    with transaction.atomic():
+        categories = [bench_id("c", n) for n in range(counts["categories"])]
+        Category.objects.bulk_create([
+            Category(id=pk, name=f"Bench category {n:05d}", description=marker(scale, seed))
+            for n, pk in enumerate(categories)
+        ])
+
+        prices = [rng["products"].randint(100, 50000) for _ in range(counts["products"])]
+        copy_into(Product, ["id", "name", "description", "price", "stock", "category_id", "is_active",
+                            "created_at", "updated_at"], (
+            (bench_id("p", n), f"Bench {rng['products'].choice(WORDS)} {n}", None, money(prices[n]),
+             rng["products"].randint(0, 200), rng["products"].choice(categories), True, timestamp(n), timestamp(n))
+            for n in range(counts["products"])
+        ))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {Product._meta.db_table} AS p "
+                f"SET search_vector = {search_vector_sql('p.name', 'c.name', 'p.description')} "
+                f"FROM {Category._meta.db_table} AS c WHERE c.id = p.category_id AND p.id LIKE %s",
+                [f"{ID_PREFIX}%"],
+            )
+        log(f"{counts['products']} products in {counts['categories']} categories")
+
+        password = make_password(f"bench-{seed}")
+        CustomUser.objects.bulk_create([
+            CustomUser(id=user_id(n), username=f"bench-{n:07d}", email=f"bench-{n:07d}@{EMAIL_DOMAIN}",
+                       password=password, date_joined=EPOCH)
+            for n in range(counts["users"])
+        ], batch_size=5000)
+        log(f"{counts['users']} users")
+
+        copy_into(Review, ["id", "user_id", "product_id", "rating", "comment", "created_at"], (
+            (bench_id("r", u * REVIEWS_PER_USER + i), user_id(u), bench_id("p", product),
+             rng["reviews"].randint(1, 5), f"Bench review {i}", timestamp(u * REVIEWS_PER_USER + i))
+            for u in range(counts["users"])
+            for i, product in enumerate(rng["reviews"].sample(range(counts["products"]),
+                                                              min(REVIEWS_PER_USER, counts["products"])))
+        ))
+        copy_into(Cart, ["id", "user_id", "product_id", "quantity"], (
+            (bench_id("k", u * CARTS_PER_USER + i), user_id(u), bench_id("p", product), rng["carts"].randint(1, 3))
+            for u in range(counts["users"])
+            for i, product in enumerate(rng["carts"].sample(range(counts["products"]),
+                                                            min(CARTS_PER_USER, counts["products"])))
+        ))
+        log(f"{counts['reviews']} reviews, {counts['carts']} cart lines")
+
+        # Orders need their items' total, items need the order id: derive
+        # each order's lines from its own generator and walk them twice
+        def lines(number):
+            order_rng = random.Random(f"{seed}:order:{number}")
+            products = order_rng.sample(range(counts["products"]), min(ITEMS_PER_ORDER, counts["products"]))
+            return [(product, order_rng.randint(1, 3)) for product in products]
+
+        orders = range(counts["orders"])
+        copy_into(Order, ["id", "customer_id", "created_at", "total_price"], (
+            (bench_id("o", n), user_id(n // ORDERS_PER_USER), timestamp(n, 60),
+             money(sum(prices[product] * quantity for product, quantity in lines(n))))
+            for n in orders
+        ))
+        copy_into(OrderItem, ["id", "order_id", "product_id", "quantity", "price"], (
+            (bench_id("i", n * ITEMS_PER_ORDER + i), bench_id("o", n), bench_id("p", product), quantity,
+             money(prices[product]))
+            for n in orders
+            for i, (product, quantity) in enumerate(lines(n))
+        ))
+        log(f"{counts['orders']} orders with {counts['order_items']} items")
+
+    rebuild_category_stats()
+    bump_generation()
+    return counts
+
+
+def clear():
+    """Delete every benchmark row; real data is left alone"""
+    pattern = f"{ID_PREFIX}%"
+    with transaction.atomic(), connection.cursor() as cursor:
+        for model, column in [(OrderItem, "order_id"), (Order, "id"), (Cart, "id"), (Review, "id"),
+                              (CategoryStats, "category_id"), (Product, "id"), (Category, "id")]:
+            cursor.execute(f"DELETE FROM {model._meta.db_table} WHERE {column} LIKE %s", [pattern])
+        cursor.execute(f"DELETE FROM {CustomUser._meta.db_table} WHERE email LIKE %s", [f"%@{EMAIL_DOMAIN}"])
+    bump_generation()
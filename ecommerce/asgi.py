@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ecommerce.settings')
+# Serve the catalog read endpoints from products.async_views
+os.environ.setdefault('ASYNC_READ_VIEWS', '1')
 
 application = get_asgi_application()
@@ -0,0 +1,270 @@
+"""
+Two-tier cache: a small in-process LRU (L1) in front of a shared cache (L2).
+
+L2 is any configured cache alias, normally Redis, so every worker and node
+shares one copy of a cached page. L1 saves the network round trip for hot
+keys. Its entries live at most ``L1_TIMEOUT`` seconds, which bounds how
+long another node's write can go unseen. Keys that must always be read
+fresh (the catalog generation counter, for instance) are listed in
+``L1_BYPASS``.
+
+Values are serialized here (pickle or msgpack) and zlib-compressed once
+they reach ``COMPRESS_MIN_BYTES``, before they are handed to L2. Plain ints
+are passed through untouched so ``incr()`` keeps working on Redis.
+"""
+import pickle
+import threading
+import time
+import uuid
+import zlib
+from collections import Counter, OrderedDict
+from datetime import date, datetime
+from decimal import Decimal
+
+from asgiref.sync import sync_to_async
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.exceptions import ImproperlyConfigured
+
+RAW = b"r"
+COMPRESSED = b"z"
+
+
+class PickleSerializer:
+    def dumps(self, value):
+        return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+    def loads(self, data):
+        return pickle.loads(data)
+
+
+class MsgpackSerializer:
+    """
+    Decimals, dates, datetimes and UUIDs (model values cached straight from
+    ``values()``) travel as msgpack extension types and come back as the
+    same types. Anything else msgpack can't pack raises TypeError.
+    """
+    # Extension type code -> (type, how it is written, how it is read back);
+    # datetime goes before date, its base class
+    EXTENSIONS = {
+        1: (Decimal, str, Decimal),
+        2: (datetime, datetime.isoformat, datetime.fromisoformat),
+        3: (date, date.isoformat, date.fromisoformat),
+        4: (uuid.UUID, str, uuid.UUID),
+    }
+
+    def __init__(self):
+        try:
+            import msgpack
+        except ImportError:
+            raise ImproperlyConfigured("SERIALIZER 'msgpack' needs the msgpack package")
+        self.msgpack = msgpack
+
+    def encode(self, value):
+        for code, (kind, write, _) in self.EXTENSIONS.items():
+            if isinstance(value, kind):
+                return self.msgpack.ExtType(code, write(value).encode())
+        raise TypeError(f"Can't cache {type(value).__name__} values with msgpack")
+
+    def decode(self, code, data):
+        if code not in self.EXTENSIONS:
+            return self.msgpack.ExtType(code, data)
+        return self.EXTENSIONS[code][2](data.decode())
+
+    def dumps(self, value):
+        return self.msgpack.packb(value, use_bin_type=True, default=self.encode)
+
+    def loads(self, data):
+        return self.msgpack.unpackb(data, raw=False, ext_hook=self.decode)
+
+
+SERIALIZERS = {
+    "pickle": PickleSerializer,
+    "msgpack": MsgpackSerializer,
+}
+
+
+class LocalLRU:
+    """Thread-safe, size-bounded dict with per-entry expiry"""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key):
+        with self.lock:
+            item = self.data.get(key)
+            if item is None:
+                return None
+            value, expires = item
+            if expires <= time.monotonic():
+                del self.data[key]
+                return None
+            self.data.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout):
+        with self.lock:
+            self.data[key] = (value, time.monotonic() + timeout)
+            self.data.move_to_end(key)
+            while len(self.data) > self.max_entries:
+                self.data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self.lock:
+            return self.data.pop(key, None) is not None
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+    def __len__(self):
+        return len(self.data)
+
+
+class TieredCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get("OPTIONS", {})
+        self.l2_alias = options.get("L2", "shared")
+        self.l1 = LocalLRU(options.get("L1_MAX_ENTRIES", 1000))
+        self.l1_timeout = options.get("L1_TIMEOUT", 5)
+        self.l1_bypass = tuple(options.get("L1_BYPASS", ()))
+        try:
+            self.serializer = SERIALIZERS[options.get("SERIALIZER", "pickle")]()
+        except KeyError:
+            raise ImproperlyConfigured(f"SERIALIZER must be one of {', '.join(SERIALIZERS)}")
+        self.compress_min_bytes = options.get("COMPRESS_MIN_BYTES", 16 * 1024)
+        self.compress_level = options.get("COMPRESS_LEVEL", 6)
+        self._metrics = Counter()
+        self._metrics_lock = threading.Lock()
+
+    @property
+    def l2(self):
+        return caches[self.l2_alias]
+
+    def _count(self, name, amount=1):
+        with self._metrics_lock:
+            self._metrics[name] += amount
+
+    def _use_l1(self, key):
+        return not key.startswith(self.l1_bypass) if self.l1_bypass else True
+
+    def _l1_timeout(self, timeout):
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        if timeout is None:
+            return self.l1_timeout
+        return min(timeout, self.l1_timeout)
+
+    def _encode(self, value):
+        """Return ``(l1 value, l2 value)``; L1 keeps the uncompressed bytes"""
+        if type(value) is int:
+            return value, value
+        data = self.serializer.dumps(value)
+        self._count("bytes_serialized", len(data))
+        if len(data) >= self.compress_min_bytes:
+            compressed = zlib.compress(data, self.compress_level)
+            self._count("compressed")
+            self._count("bytes_saved", len(data) - len(compressed))
+            return data, COMPRESSED + compressed
+        return data, RAW + data
+
+    def _decode_l2(self, blob):
+        if type(blob) is int:
+            return blob
+        flag, data = blob[:1], blob[1:]
+        return zlib.decompress(data) if flag == COMPRESSED else data
+
+    def _load(self, data):
+        return data if type(data) is int else self.serializer.loads(data)
+
+    def get(self, key, default=None, version=None):
+        l1_key = self.make_and_validate_key(key, version=version)
+        use_l1 = self._use_l1(key)
+        if use_l1:
+            data = self.l1.get(l1_key)
+            if data is not None:
+                self._count("l1_hits")
+                return self._load(data)
+            self._count("l1_misses")
+
+        blob = self.l2.get(key, version=version)
+        if blob is None:
+            self._count("l2_misses")
+            return default
+        self._count("l2_hits")
+        data = self._decode_l2(blob)
+        if use_l1:
+            self.l1.set(l1_key, data, self.l1_timeout)
+        return self._load(data)
+
+    async def aget(self, key, default=None, version=None):
+        # An L1 hit is answered in the event loop; only L2 is awaited
+        l1_key = self.make_and_validate_key(key, version=version)
+        use_l1 = self._use_l1(key)
+        if use_l1:
+            data = self.l1.get(l1_key)
+            if data is not None:
+                self._count("l1_hits")
+                return self._load(data)
+            self._count("l1_misses")
+
+        blob = await self.l2.aget(key, version=version)
+        if blob is None:
+            self._count("l2_misses")
+            return default
+        self._count("l2_hits")
+        data = self._decode_l2(blob)
+        if use_l1:
+            self.l1.set(l1_key, data, self.l1_timeout)
+        return self._load(data)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        l1_key = self.make_and_validate_key(key, version=version)
+        data, blob = self._encode(value)
+        self.l2.set(key, blob, timeout=timeout, version=version)
+        l1_timeout = self._l1_timeout(timeout)
+        if self._use_l1(key) and l1_timeout > 0:
+            self.l1.set(l1_key, data, l1_timeout)
+        else:
+            self.l1.delete(l1_key)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        # Goes straight to L2: add() is used for locks and must be shared
+        self.l1.delete(self.make_and_validate_key(key, version=version))
+        return self.l2.add(key, self._encode(value)[1], timeout=timeout, version=version)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        self.l1.delete(self.make_and_validate_key(key, version=version))
+        return self.l2.touch(key, timeout=timeout, version=version)
+
+    def delete(self, key, version=None):
+        self.l1.delete(self.make_and_validate_key(key, version=version))
+        return self.l2.delete(key, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        self.l1.delete(self.make_and_validate_key(key, version=version))
+        return self.l2.incr(key, delta, version=version)
+
+    async def aincr(self, key, delta=1, version=None):
+        # BaseCache.aincr is a get followed by a set; keep incr() atomic on L2
+        return await sync_to_async(self.incr, thread_sensitive=True)(key, delta, version)
+
+    def has_key(self, key, version=None):
+        l1_key = self.make_and_validate_key(key, version=version)
+        return self.l1.get(l1_key) is not None or self.l2.has_key(key, version=version)
+
+    def clear(self):
+        self.l1.clear()
+        self.l2.clear()
+
+    def metrics(self):
+        """Per-tier counters for this process"""
+        with self._metrics_lock:
+            metrics = dict(self._metrics)
+        metrics.update(l1_entries=len(self.l1), l1_evictions=self.l1.evictions)
+        return metrics
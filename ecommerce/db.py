@@ -0,0 +1,44 @@
+"""
+Statement timeouts for maintenance work.
+
+Every Postgres connection starts with statement_timeout =
+DB_STATEMENT_TIMEOUT_MS (see settings), so a runaway query can't hold a
+request's connection for long. Migrations and the bulk management commands
+(import_catalog, rebuild_category_stats, export_data, benchmark) run
+statements that legitimately take longer on a large catalog, so they lift
+it: migrate between the ``lift_for_migrations`` (pre_migrate) and
+``restore_after_migrations`` (post_migrate) receivers, and the commands
+inside ``no_statement_timeout()``. Other long-running scripts
+should do the same.
+"""
+from contextlib import contextmanager
+
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+def _set_timeout(connection, statement):
+    if connection.vendor == "postgresql":
+        with connection.cursor() as cursor:
+            cursor.execute(statement)
+
+
+@contextmanager
+def no_statement_timeout(using=DEFAULT_DB_ALIAS):
+    """Run the block without a statement timeout on ``using``'s connection"""
+    connection = connections[using]
+    _set_timeout(connection, "SET statement_timeout = 0")
+    try:
+        yield
+    finally:
+        # Back to the value the connection started with
+        _set_timeout(connection, "RESET statement_timeout")
+
+
+def lift_for_migrations(using=DEFAULT_DB_ALIAS, **kwargs):
+    """pre_migrate receiver, sent for every app before the first migration runs"""
+    _set_timeout(connections[using], "SET statement_timeout = 0")
+
+
+def restore_after_migrations(using=DEFAULT_DB_ALIAS, **kwargs):
+    """post_migrate receiver, so the test runner doesn't keep the lifted timeout"""
+    _set_timeout(connections[using], "RESET statement_timeout")
@@ -0,0 +1,171 @@
+"""
+Read replicas.
+
+``ReplicaRouter`` keeps every write, and by default every read, on the
+``default`` database. Views with ``ReplicaReadsMixin`` (the catalog
+viewsets) send their reads to one of DB_REPLICAS instead, picked once per
+request. They still read from ``default`` when:
+
+- the request is not a GET, HEAD or OPTIONS
+- the request has already written something, or the code runs under
+  ``primary()``
+- the user, or this browser, wrote something in the last
+  DB_REPLICA_STICKY_SECONDS, so people see their own writes while the
+  replicas catch up
+- the view or ``@action`` sets ``replica_reads = False``
+
+``ReplicaMiddleware`` holds the routing state of each request. After a
+write, it records the stickiness in the cache for the user and in a cookie
+for the browser. Without replicas the middleware removes itself and every
+query goes to ``default``, as before.
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework.permissions import SAFE_METHODS
+
+STICKY_COOKIE = "db_primary"
+
+_current = ContextVar("db_routing", default=None)
+_primary = ContextVar("db_primary", default=False)
+
+
+class RoutingState:
+    __slots__ = ("replica", "wrote")
+
+    def __init__(self):
+        self.replica = None  # Set by ReplicaReadsMixin when the view may use one
+        self.wrote = False
+
+
+def replicas():
+    return getattr(settings, "DB_REPLICAS", [])
+
+
+def sticky_seconds():
+    return getattr(settings, "DB_REPLICA_STICKY_SECONDS", 5)
+
+
+def sticky_key(user_id):
+    return f"db:primary:{user_id}"
+
+
+@contextmanager
+def primary():
+    """Read from ``default`` inside the block, whatever the view allows"""
+    token = _primary.set(True)
+    try:
+        yield
+    finally:
+        _primary.reset(token)
+
+
+def is_sticky(request):
+    """Whether ``request`` comes from someone who wrote within the sticky window"""
+    if STICKY_COOKIE in request.COOKIES:
+        return True
+    user = getattr(request, "user", None)
+    return user is not None and user.is_authenticated and cache.get(sticky_key(user.pk)) is not None
+
+
+def allow_replica(request):
+    """Let the rest of ``request`` read from a replica, if nothing rules it out"""
+    state = _current.get()
+    if state is None or state.wrote or request.method not in SAFE_METHODS:
+        return
+    aliases = replicas()
+    if aliases and not is_sticky(request):
+        state.replica = random.choice(aliases)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _current.get()
+        if state is None:
+            return None
+        if state.replica is None or state.wrote or _primary.get():
+            return DEFAULT_DB_ALIAS
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = _current.get()
+        if state is not None:
+            state.wrote = True
+        # Never the instance's own alias: objects read from a replica are saved to the primary
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema from the primary
+        return False if db in replicas() else None
+
+
+class ReplicaReadsMixin:
+    """
+    Let a DRF view read from the replicas. Set ``replica_reads = False`` on
+    a subclass, or pass it to ``@action``, to keep a view on the primary.
+    """
+    replica_reads = True
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        # After authentication, so a token user's sticky window is known
+        if self.replica_reads:
+            allow_replica(request)
+
+
+class ReplicaMiddleware:
+    """Place it before anything that may write, such as SessionMiddleware"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not replicas():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        state = RoutingState()
+        token = _current.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        if state.wrote:
+            self.stick(request, response)
+        return response
+
+    async def __acall__(self, request):
+        state = RoutingState()
+        token = _current.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        if state.wrote:
+            # A session user may still have to be loaded
+            await sync_to_async(self.stick)(request, response)
+        return response
+
+    def stick(self, request, response):
+        seconds = sticky_seconds()
+        user = getattr(request, "user", None)
+        if user is not None and user.is_authenticated:
+            cache.set(sticky_key(user.pk), True, timeout=seconds)
+        response.set_cookie(STICKY_COOKIE, "1", max_age=seconds, httponly=True, samesite="Lax")
@@ -0,0 +1,264 @@
+"""
+Per-request instrumentation.
+
+``InstrumentationMiddleware`` records, for every request, the number of SQL
+queries and the time spent in them, the product cache hits and misses
+(products.cache) and the time spent producing serializer output. The
+figures are sent back in a ``Server-Timing`` header and added to per-route
+histograms served by ``MetricsView``. A statement that runs
+N_PLUS_ONE_THRESHOLD times or more in one request is logged as a likely
+N+1 query.
+
+The work per request is a few ``perf_counter`` calls per query and one
+locked dictionary update. Set INSTRUMENTATION_ENABLED = False and the
+middleware removes itself (``MiddlewareNotUsed``); the query hook is then
+never installed.
+"""
+import logging
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from rest_framework import status
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the histogram buckets; anything above lands in "+Inf"
+DURATION_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+_current = ContextVar("request_metrics", default=None)
+_routes = {}
+_routes_lock = threading.Lock()
+
+
+class RequestMetrics:
+    __slots__ = (
+        "started", "queries", "db_time", "cache_hits", "cache_misses", "serializer_time", "serializing",
+        "statements",
+    )
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.serializer_time = 0.0
+        self.serializing = False
+        self.statements = Counter()
+
+    def repeated(self, threshold):
+        """Statements that ran at least ``threshold`` times, with their counts"""
+        return {sql: count for sql, count in self.statements.items() if count >= threshold}
+
+
+def current_metrics():
+    """The metrics of the request being handled, or None outside one"""
+    return _current.get()
+
+
+def _record_query(execute, sql, params, many, context):
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.db_time += time.perf_counter() - start
+        metrics.queries += 1
+        # Parameters are kept apart from the SQL, so repeats of one statement
+        # with different ids share a key
+        metrics.statements[sql] += 1
+
+
+def install_query_hook(connection, **kwargs):
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+def record_cache(hit):
+    metrics = _current.get()
+    if metrics is not None:
+        if hit:
+            metrics.cache_hits += 1
+        else:
+            metrics.cache_misses += 1
+
+
+class TimedSerializerMixin:
+    """Add the time spent in the outermost ``to_representation`` to the request metrics"""
+
+    def to_representation(self, instance):
+        metrics = _current.get()
+        if metrics is None or metrics.serializing:
+            return super().to_representation(instance)
+        metrics.serializing = True
+        start = time.perf_counter()
+        try:
+            return super().to_representation(instance)
+        finally:
+            metrics.serializer_time += time.perf_counter() - start
+            metrics.serializing = False
+
+
+def _bucket(value, bounds):
+    for index, bound in enumerate(bounds):
+        if value <= bound:
+            return index
+    return len(bounds)
+
+
+def observe(route, metrics, duration, n_plus_one):
+    """Add one finished request to the histograms of ``route``"""
+    duration_ms = duration * 1000
+    with _routes_lock:
+        stats = _routes.get(route)
+        if stats is None:
+            stats = _routes[route] = {
+                "count": 0, "total_ms": 0.0, "db_ms": 0.0, "serializer_ms": 0.0, "queries": 0,
+                "cache_hits": 0, "cache_misses": 0, "n_plus_one": 0,
+                "duration_buckets": [0] * (len(DURATION_BUCKETS_MS) + 1),
+                "query_buckets": [0] * (len(QUERY_BUCKETS) + 1),
+            }
+        stats["count"] += 1
+        stats["total_ms"] += duration_ms
+        stats["db_ms"] += metrics.db_time * 1000
+        stats["serializer_ms"] += metrics.serializer_time * 1000
+        stats["queries"] += metrics.queries
+        stats["cache_hits"] += metrics.cache_hits
+        stats["cache_misses"] += metrics.cache_misses
+        stats["n_plus_one"] += n_plus_one
+        stats["duration_buckets"][_bucket(duration_ms, DURATION_BUCKETS_MS)] += 1
+        stats["query_buckets"][_bucket(metrics.queries, QUERY_BUCKETS)] += 1
+
+
+def _labelled(counts, bounds):
+    return dict(zip([str(bound) for bound in bounds] + ["+Inf"], counts))
+
+
+def route_metrics():
+    """Per-route totals and histograms of this process"""
+    with _routes_lock:
+        routes = {route: dict(stats) for route, stats in _routes.items()}
+    for stats in routes.values():
+        count = stats["count"]
+        stats["mean_ms"] = stats["total_ms"] / count
+        stats["mean_queries"] = stats["queries"] / count
+        stats["duration_buckets"] = _labelled(stats["duration_buckets"], DURATION_BUCKETS_MS)
+        stats["query_buckets"] = _labelled(stats["query_buckets"], QUERY_BUCKETS)
+    return routes
+
+
+def reset_metrics():
+    with _routes_lock:
+        _routes.clear()
+
+
+def database_metrics():
+    """How each database alias holds its connections, with the pool's counters if it has one"""
+    databases = {}
+    for connection in connections.all():
+        pool = getattr(connection, "pool", None)
+        if pool is not None:
+            databases[connection.alias] = {"mode": "pool", **pool.get_stats()}
+        else:
+            persistent = connection.settings_dict["CONN_MAX_AGE"] != 0
+            databases[connection.alias] = {"mode": "persistent" if persistent else "per-request"}
+    return databases
+
+
+def server_timing(metrics, duration, repeated):
+    entries = [
+        f'db;dur={metrics.db_time * 1000:.1f};desc="{metrics.queries} queries"',
+        f"serializer;dur={metrics.serializer_time * 1000:.1f}",
+        f'cache;desc="hits={metrics.cache_hits} misses={metrics.cache_misses}"',
+        f"total;dur={duration * 1000:.1f}",
+    ]
+    if repeated:
+        entries.append(f'n-plus-one;desc="{len(repeated)} statements repeated"')
+    return ", ".join(entries)
+
+
+class InstrumentationMiddleware:
+    """Put it first in MIDDLEWARE so ``total`` covers the whole stack"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, "INSTRUMENTATION_ENABLED", True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.threshold = getattr(settings, "N_PLUS_ONE_THRESHOLD", 10)
+        self.server_timing = getattr(settings, "INSTRUMENTATION_SERVER_TIMING", True)
+        # Connections opened from now on get the hook as they connect; the
+        # ones this thread already holds get it here
+        connection_created.connect(install_query_hook, dispatch_uid="ecommerce.instrumentation")
+        for connection in connections.all(initialized_only=True):
+            install_query_hook(connection)
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics)
+
+    def finish(self, request, response, metrics):
+        duration = time.perf_counter() - metrics.started
+        match = request.resolver_match
+        route = f"{request.method} {match.route if match else '<unmatched>'}"
+        repeated = metrics.repeated(self.threshold)
+        for sql, count in repeated.items():
+            logger.warning("Possible N+1 query on %s: ran %d times: %s", route, count, sql)
+        observe(route, metrics, duration, bool(repeated))
+        if self.server_timing:
+            response.headers["Server-Timing"] = server_timing(metrics, duration, repeated)
+        return response
+
+
+class MetricsView(APIView):
+    """
+    GET: per-route request histograms and connection pool figures of this
+    process (each worker keeps its own). DELETE: start counting afresh.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response({
+            "enabled": getattr(settings, "INSTRUMENTATION_ENABLED", True),
+            "duration_buckets_ms": DURATION_BUCKETS_MS,
+            "query_buckets": QUERY_BUCKETS,
+            "routes": route_metrics(),
+            "databases": database_metrics(),
+        })
+
+    def delete(self, request):
+        reset_metrics()
+        return Response(status=status.HTTP_204_NO_CONTENT)
@@ -9,9 +9,12 @@ https://docs.djangoproject.com/en/5.1/topics/settings/
 For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
+import os
 from datetime import timedelta
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -37,6 +40,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     "django.contrib.sites",
     "login",
     "products",
@@ -59,6 +63,8 @@ AUTHENTICATION_BACKENDS = [
 ]
 
 MIDDLEWARE = [
+    'ecommerce.instrumentation.InstrumentationMiddleware',
+    'ecommerce.db_router.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -68,6 +74,7 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     "allauth.account.middleware.AccountMiddleware",
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'products.profiling.ProfilingMiddleware',
 
 
 ]
@@ -98,6 +105,29 @@ WSGI_APPLICATION = 'ecommerce.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
+# How each process holds its Postgres connections (DB_CONNECTIONS):
+#   pool         a psycopg 3 pool of DB_POOL_MIN_SIZE..DB_POOL_MAX_SIZE connections,
+#                checked on checkout (the default). Keep workers x max size under
+#                the server's max_connections.
+#   persistent   one connection per thread, reused for DB_CONN_MAX_AGE seconds
+#   per-request  a new connection for every request
+DB_CONNECTIONS = os.environ.get('DB_CONNECTIONS', 'pool')
+if DB_CONNECTIONS not in ('pool', 'persistent', 'per-request'):
+    raise ImproperlyConfigured("DB_CONNECTIONS must be pool, persistent or per-request")
+# Postgres cancels any statement running longer than this. migrate and the bulk
+# management commands lift it (ecommerce.db), their statements may run longer
+DB_STATEMENT_TIMEOUT_MS = int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', 30000))
+DB_POOL = {
+    'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', 2)),
+    'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', 10)),
+    # Seconds a request waits for a free connection before erroring
+    'timeout': float(os.environ.get('DB_POOL_TIMEOUT', 10)),
+    # Connections above min_size are closed after this long idle, and every
+    # connection is replaced after max_lifetime so reconnects are spread out
+    'max_idle': 300,
+    'max_lifetime': 3600,
+}
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.postgresql',
@@ -106,10 +136,66 @@ DATABASES = {
         'PASSWORD': '12344321',  # Replace with your database password
         'HOST': 'localhost',  # Change if your DB is hosted elsewhere
         'PORT': '5432',  # Default PostgreSQL port
+        # Pooling needs CONN_MAX_AGE = 0; the pool does the reusing
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 60)) if DB_CONNECTIONS == 'persistent' else 0,
+        'CONN_HEALTH_CHECKS': DB_CONNECTIONS != 'per-request',
+        'OPTIONS': {
+            'options': f'-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}',
+            **({'pool': DB_POOL} if DB_CONNECTIONS == 'pool' else {}),
+        },
     }
 }
+# Read replicas of 'default', as DB_REPLICA_HOSTS=host[:port],... Only views
+# with ecommerce.db_router.ReplicaReadsMixin read from them
+for number, address in enumerate(filter(None, os.environ.get('DB_REPLICA_HOSTS', '').split(',')), 1):
+    host, _, port = address.strip().partition(':')
+    DATABASES[f'replica{number}'] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'PORT': port or DATABASES['default']['PORT'],
+        'OPTIONS': dict(DATABASES['default']['OPTIONS']),
+        # Under the test runner a replica is the test database itself
+        'TEST': {'MIRROR': 'default'},
+    }
+DB_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['ecommerce.db_router.ReplicaRouter']
+# How long someone who wrote keeps reading from 'default', and how long after a
+# catalog change cache rebuilds do. Keep it above the replicas' usual lag
+DB_REPLICA_STICKY_SECONDS = int(os.environ.get('DB_REPLICA_STICKY_SECONDS', 5))
+
 
 
+# Cache
+# "default" is a two-tier cache: a small per-process LRU in front of the shared
+# "shared" cache. Set REDIS_URL to share it across workers and nodes; without
+# it a local-memory cache stands in, which is what tests use.
+
+REDIS_URL = os.environ.get('REDIS_URL')
+
+CACHES = {
+    'default': {
+        'BACKEND': 'ecommerce.cache_backends.TieredCache',
+        'OPTIONS': {
+            'L2': 'shared',
+            'L1_MAX_ENTRIES': 1000,
+            'L1_TIMEOUT': 5,
+            # Always read the catalog generation, change time and detail
+            # versions from the shared tier, or a worker could serve a stale
+            # list or ETag for up to L1_TIMEOUT after another one's write
+            'L1_BYPASS': ['products:generation', 'products:changed_at', 'detail:version:'],
+            'SERIALIZER': 'pickle',  # or 'msgpack' (needs the msgpack package)
+            'COMPRESS_MIN_BYTES': 16 * 1024,
+        },
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_URL,
+    } if REDIS_URL else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'shared',
+    },
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -173,3 +259,33 @@ REST_FRAMEWORK = {
     ]
 }
 
+
+# Cached product pages are invalidated by catalog signals, so they can live long
+PRODUCT_LIST_CACHE_TIMEOUT = 60 * 60 * 6
+# Expired product pages are served for this long while one worker rebuilds them
+PRODUCT_CACHE_STALE_GRACE = 60 * 5
+# Seconds a cart reservation holds stock before it is released
+STOCK_RESERVATION_TTL = 60 * 15
+# Rows written per INSERT ... ON CONFLICT by the bulk product endpoint
+PRODUCT_BULK_CHUNK_SIZE = 1000
+# Rows per server-side cursor fetch for streaming exports
+EXPORT_CHUNK_SIZE = 2000
+# The navigation menu is dropped whenever category stats change
+CATEGORY_NAVIGATION_TIMEOUT = 60 * 60
+# Route catalog GETs to products.async_views; on by default in ecommerce.asgi
+ASYNC_READ_VIEWS = os.environ.get('ASYNC_READ_VIEWS', '') == '1'
+# Google OAuth calls share a keep-alive pool and give up after these many seconds
+GOOGLE_OAUTH_CONNECT_TIMEOUT = 3
+GOOGLE_OAUTH_READ_TIMEOUT = 10
+GOOGLE_OAUTH_POOL_SIZE = 20
+# Per-request query, cache and serializer metrics (ecommerce.instrumentation);
+# INSTRUMENTATION=0 takes the middleware out entirely
+INSTRUMENTATION_ENABLED = os.environ.get('INSTRUMENTATION', '1') == '1'
+INSTRUMENTATION_SERVER_TIMING = True
+# Log a likely N+1 when one SQL statement runs this many times in a request
+N_PLUS_ONE_THRESHOLD = 10
+# Staff can profile an API request by sending "X-Profile: 1"; this fraction of
+# all API requests is profiled as well (products.profiling)
+PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE', 0))
+# Fleet-wide cap on profiles captured per minute, whatever triggered them
+PROFILING_MAX_PER_MINUTE = 6
@@ -18,9 +18,12 @@ from django.contrib import admin
 
 from django.urls import path, include
 
+from ecommerce.instrumentation import MetricsView
+
 urlpatterns = [
        path('admin/', admin.site.urls),
     path("",include("login.urls")),
     path("",include("products.urls")),
+    path('api/metrics/', MetricsView.as_view(), name='metrics'),
 ]
 
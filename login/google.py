@@ -0,0 +1,197 @@
+"""
+HTTP client for the Google OAuth code exchange used by the login views.
+
+Every callback in a process shares one keep-alive ``requests.Session``, so
+a warm pool skips the TCP and TLS handshakes. Each call has a connect and a
+read timeout, so a slow Google answer can't hold a worker indefinitely. The
+async variants do the same with an ``httpx.AsyncClient`` per event loop.
+
+The Google ``SocialApp`` credentials are cached in-process. A version in
+the shared cache is bumped whenever the app is saved or deleted
+(login.signals), so every worker picks up an edit on its next login.
+"""
+import asyncio
+import threading
+import time
+import weakref
+from collections import namedtuple
+
+import requests
+from allauth.socialaccount.models import SocialApp
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from requests.adapters import HTTPAdapter
+
+APP_VERSION_KEY = "login:google-app:version"
+
+GoogleApp = namedtuple("GoogleApp", ["client_id", "secret"])
+
+_app = None  # (version, GoogleApp)
+_session = None
+_session_lock = threading.Lock()
+_async_clients = weakref.WeakKeyDictionary()
+
+
+class GoogleOAuthError(Exception):
+    def __init__(self, message, details=None, status=400):
+        super().__init__(message)
+        self.message = message
+        self.details = details
+        self.status = status
+
+    def as_dict(self):
+        return {"error": self.message, "details": self.details}
+
+
+def token_url():
+    return getattr(settings, "GOOGLE_TOKEN_URL", "https://oauth2.googleapis.com/token")
+
+
+def userinfo_url():
+    return getattr(settings, "GOOGLE_USERINFO_URL", "https://www.googleapis.com/oauth2/v2/userinfo")
+
+
+def redirect_uri():
+    return getattr(settings, "GOOGLE_REDIRECT_URI", "http://127.0.0.1:8000/accounts/google/login/callback/")
+
+
+def timeouts():
+    """``(connect, read)`` seconds for calls to Google"""
+    return (
+        getattr(settings, "GOOGLE_OAUTH_CONNECT_TIMEOUT", 3),
+        getattr(settings, "GOOGLE_OAUTH_READ_TIMEOUT", 10),
+    )
+
+
+def pool_size():
+    return getattr(settings, "GOOGLE_OAUTH_POOL_SIZE", 20)
+
+
+def google_app():
+    """Client id and secret of the Google ``SocialApp``, cached in this process"""
+    global _app
+    version = cache.get(APP_VERSION_KEY)
+    if version is None:
+        cache.add(APP_VERSION_KEY, time.time(), timeout=None)
+        version = cache.get(APP_VERSION_KEY)
+    if _app is not None and _app[0] == version:
+        return _app[1]
+    # Version first, row second: an edit landing in between is refetched next time
+    app = SocialApp.objects.get(provider="google")
+    _app = (version, GoogleApp(app.client_id, app.secret))
+    return _app[1]
+
+
+async def agoogle_app():
+    global _app
+    version = await cache.aget(APP_VERSION_KEY)
+    if version is None:
+        await cache.aadd(APP_VERSION_KEY, time.time(), timeout=None)
+        version = await cache.aget(APP_VERSION_KEY)
+    if _app is not None and _app[0] == version:
+        return _app[1]
+    app = await SocialApp.objects.aget(provider="google")
+    _app = (version, GoogleApp(app.client_id, app.secret))
+    return _app[1]
+
+
+def invalidate_google_app():
+    global _app
+    _app = None
+    cache.set(APP_VERSION_KEY, time.time(), timeout=None)
+
+
+def token_request(app, code):
+    return {
+        "code": code,
+        "client_id": app.client_id,
+        "client_secret": app.secret,
+        "redirect_uri": redirect_uri(),
+        "grant_type": "authorization_code",
+    }
+
+
+def check_tokens(payload):
+    if not isinstance(payload, dict) or "access_token" not in payload:
+        raise GoogleOAuthError("Failed to get access token", payload)
+    return payload
+
+
+def check_userinfo(payload):
+    if not isinstance(payload, dict) or not payload.get("email"):
+        raise GoogleOAuthError("Failed to get user info", payload)
+    return payload
+
+
+def get_session():
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size())
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+
+def _call(method, url, **kwargs):
+    try:
+        response = get_session().request(method, url, timeout=timeouts(), **kwargs)
+        return response.json()
+    except requests.Timeout:
+        raise GoogleOAuthError("Google did not answer in time", status=504)
+    except (requests.RequestException, ValueError) as exc:
+        raise GoogleOAuthError("Could not reach Google", str(exc), status=502)
+
+
+def exchange_code(code):
+    """Trade an authorization code for Google tokens"""
+    return check_tokens(_call("POST", token_url(), data=token_request(google_app(), code)))
+
+
+def fetch_userinfo(access_token):
+    return check_userinfo(_call("GET", userinfo_url(), headers={"Authorization": f"Bearer {access_token}"}))
+
+
+def get_async_client():
+    """The ``httpx.AsyncClient`` of the running event loop"""
+    try:
+        import httpx
+    except ImportError:
+        raise ImproperlyConfigured("The async Google callback needs the httpx package")
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        connect, read = timeouts()
+        client = httpx.AsyncClient(
+            timeout=httpx.Timeout(read, connect=connect),
+            limits=httpx.Limits(max_connections=pool_size(), max_keepalive_connections=pool_size()),
+        )
+        _async_clients[loop] = client
+    return client
+
+
+async def _acall(method, url, **kwargs):
+    client = get_async_client()
+    import httpx
+
+    try:
+        response = await client.request(method, url, **kwargs)
+        return response.json()
+    except httpx.TimeoutException:
+        raise GoogleOAuthError("Google did not answer in time", status=504)
+    except (httpx.HTTPError, ValueError) as exc:
+        raise GoogleOAuthError("Could not reach Google", str(exc), status=502)
+
+
+async def aexchange_code(code):
+    return check_tokens(await _acall("POST", token_url(), data=token_request(await agoogle_app(), code)))
+
+
+async def afetch_userinfo(access_token):
+    return check_userinfo(
+        await _acall("GET", userinfo_url(), headers={"Authorization": f"Bearer {access_token}"})
+    )
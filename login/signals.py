@@ -0,0 +1,10 @@
+from allauth.socialaccount.models import SocialApp
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .google import invalidate_google_app
+
+
+@receiver([post_save, post_delete], sender=SocialApp)
+def invalidate_cached_google_app(sender, **kwargs):
+    invalidate_google_app()
@@ -1,3 +1,119 @@
-from django.test import TestCase
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
 
-# Create your tests here.
+from allauth.socialaccount.models import SocialApp
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from login.models import CustomUser
+
+
+class StubGoogleHandler(BaseHTTPRequestHandler):
+    """Token and userinfo endpoints standing in for Google"""
+    protocol_version = "HTTP/1.1"  # keep-alive, so connection reuse can be observed
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        form = parse_qs(self.rfile.read(int(self.headers["Content-Length"])).decode())
+        if self.path == "/slow-token":
+            time.sleep(1)
+        if form.get("code") == ["good"] and form.get("client_secret") == ["secret-1"]:
+            self.send_json(200, {"access_token": "stub-token", "expires_in": 3600})
+        else:
+            self.send_json(400, {"error": "invalid_grant"})
+
+    def do_GET(self):
+        if self.headers.get("Authorization") == "Bearer stub-token":
+            self.send_json(200, {"id": "g-1", "email": "ada@example.com", "locale": "en"})
+        else:
+            self.send_json(401, {"error": "invalid_token"})
+
+    def log_message(self, *args):
+        pass
+
+
+class GoogleCallbackTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), StubGoogleHandler)
+        cls.server.connections = 0
+        # The timeout test hangs up on the slow endpoint mid-response
+        cls.server.handle_error = lambda request, client_address: None
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base_url = f"http://127.0.0.1:{cls.server.server_port}"
+        cls.stub_settings = override_settings(
+            GOOGLE_TOKEN_URL=f"{cls.base_url}/token",
+            GOOGLE_USERINFO_URL=f"{cls.base_url}/userinfo",
+            GOOGLE_OAUTH_READ_TIMEOUT=0.3,
+        )
+        cls.stub_settings.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.stub_settings.disable()
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        self.app = SocialApp.objects.create(provider="google", name="Google", client_id="client-1", secret="secret-1")
+
+    def test_callback_creates_user_and_returns_tokens(self):
+        response = self.client.get("/google/callback/", {"code": "good"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["user"]["email"], "ada@example.com")
+        self.assertTrue(response.json()["access_token"])
+        self.assertEqual(CustomUser.objects.get(email="ada@example.com").google_id, "g-1")
+
+    def test_connections_are_kept_alive(self):
+        before = self.server.connections
+        for _ in range(3):
+            self.assertEqual(self.client.get("/google/callback/", {"code": "good"}).status_code, 200)
+        # Six calls to Google; at most one new connection if the pool was cold
+        self.assertLessEqual(self.server.connections - before, 1)
+
+    def test_rejected_code_returns_400(self):
+        response = self.client.get("/google/callback/", {"code": "bad"})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["details"], {"error": "invalid_grant"})
+
+    def test_slow_or_unreachable_google(self):
+        with override_settings(GOOGLE_TOKEN_URL=f"{self.base_url}/slow-token"):
+            start = time.monotonic()
+            self.assertEqual(self.client.get("/google/callback/", {"code": "good"}).status_code, 504)
+            self.assertLess(time.monotonic() - start, 1)
+        with override_settings(GOOGLE_TOKEN_URL="http://127.0.0.1:9/token"):
+            self.assertEqual(self.client.get("/google/callback/", {"code": "good"}).status_code, 502)
+
+    def test_social_app_is_cached_until_edited(self):
+        self.assertIn("client_id=client-1", self.client.get("/google/login/")["Location"])
+        with self.assertNumQueries(0):
+            self.client.get("/google/login/")
+        self.app.client_id = "client-2"
+        self.app.save()
+        self.assertIn("client_id=client-2", self.client.get("/google/login/")["Location"])
+
+    async def test_async_callback(self):
+        response = await self.async_client.get("/google/callback/async/", {"code": "good"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["user"]["email"], "ada@example.com")
+        self.assertTrue(await CustomUser.objects.filter(email="ada@example.com").aexists())
+
+        response = await self.async_client.get("/google/callback/async/", {"code": "bad"})
+        self.assertEqual(response.status_code, 400)
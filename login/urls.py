@@ -1,10 +1,11 @@
 from django.urls import path, re_path
 
-from .views import GoogleLoginUrlView, GoogleCallbackView
+from .views import AsyncGoogleCallbackView, GoogleLoginUrlView, GoogleCallbackView
 
 urlpatterns = [
     path('google/login/', GoogleLoginUrlView.as_view(), name='google-login-url'),
     path('google/callback/', GoogleCallbackView.as_view(), name='google-callback'),
+    path('google/callback/async/', AsyncGoogleCallbackView.as_view(), name='google-callback-async'),
 
 
 ]
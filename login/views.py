@@ -1,11 +1,14 @@
+from django.http import JsonResponse
 from django.shortcuts import render, redirect
+from django.views import View
 
-import requests
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from allauth.socialaccount.models import SocialApp
 from rest_framework_simplejwt.tokens import RefreshToken
 
+from login.google import (
+    GoogleOAuthError, aexchange_code, afetch_userinfo, exchange_code, fetch_userinfo, google_app, redirect_uri,
+)
 from login.models import CustomUser
 from login.serializers import  AuthSerializer
 
@@ -15,15 +18,14 @@ from django.shortcuts import render
 
 class GoogleLoginUrlView(APIView):
     def get(self, request):
-        client_id = SocialApp.objects.get(provider='google').client_id
-        redirect_uri = 'http://127.0.0.1:8000/accounts/google/login/callback/'
+        client_id = google_app().client_id
         scope = 'openid email profile'
 
         params = (
             "https://accounts.google.com/o/oauth2/v2/auth"
             "?response_type=code"
             f'&client_id={client_id}'
-            f'&redirect_uri={redirect_uri}'
+            f'&redirect_uri={redirect_uri()}'
             f'&scope={scope}'
             '&access_type=offline'
             '&prompt=consent'
@@ -34,57 +36,55 @@ class GoogleLoginUrlView(APIView):
         return redirect(params)
 
 
+def user_defaults(user_info):
+    return {
+        'username': user_info['email'].split("@")[0],
+        'google_id': user_info.get('id'),
+        'picture': user_info.get('picture'),
+        'locale': user_info.get('locale'),
+    }
 
-class GoogleCallbackView(APIView):
-
-    def get(self, request):
-        code = request.GET.get('code')
-
-        app = SocialApp.objects.get(provider='google')
-        token_url = 'https://oauth2.googleapis.com/token'
-        redirect_uri = 'http://127.0.0.1:8000/accounts/google/login/callback/'
-
-        data = {
-            "code": code,
-            'client_id': app.client_id,
-            'client_secret': app.secret,
-            'redirect_uri': redirect_uri,
-            'grant_type': 'authorization_code'
-        }
-
-        token_response = requests.post(token_url, data=data)
-        token_json = token_response.json()
 
-        if "access_token" not in token_json:
-            return Response({'error': 'Failed to get access token', 'details': token_json}, status=400)
+def auth_payload(user):
+    refresh = RefreshToken.for_user(user)
+    serializer = AuthSerializer({
+        'access_token': str(refresh.access_token),
+        'refresh_token': str(refresh),
+        'user': user
+    })
+    return serializer.data
 
 
-        access_token = token_json['access_token']
+class GoogleCallbackView(APIView):
 
-        userinfo_response = requests.get(
-            'https://www.googleapis.com/oauth2/v2/userinfo',
-            headers={'Authorization': f'Bearer {access_token}'}
-        )
-        user_info = userinfo_response.json()
-        email = user_info.get('email')
+    def get(self, request):
+        code = request.GET.get('code')
+        try:
+            tokens = exchange_code(code)
+            user_info = fetch_userinfo(tokens['access_token'])
+        except GoogleOAuthError as exc:
+            return Response(exc.as_dict(), status=exc.status)
 
         user, created = CustomUser.objects.get_or_create(
-            email=email,
-            defaults={
-                'username': email.split("@")[0],
-                'google_id': user_info.get('id'),
-                'picture': user_info.get('picture'),
-                'locale': user_info.get('locale'),
-            }
+            email=user_info['email'],
+            defaults=user_defaults(user_info),
         )
-        user.save()
+        return Response(auth_payload(user))
 
-        refresh = RefreshToken.for_user(user)
 
-        serializer = AuthSerializer({
-            'access_token': str(refresh.access_token),
-            'refresh_token': str(refresh),
-            'user': user
-        })
+class AsyncGoogleCallbackView(View):
+    """Same as GoogleCallbackView, without holding a thread while Google answers"""
 
-        return Response(serializer.data)
+    async def get(self, request):
+        code = request.GET.get('code')
+        try:
+            tokens = await aexchange_code(code)
+            user_info = await afetch_userinfo(tokens['access_token'])
+        except GoogleOAuthError as exc:
+            return JsonResponse(exc.as_dict(), status=exc.status)
+
+        user, created = await CustomUser.objects.aget_or_create(
+            email=user_info['email'],
+            defaults=user_defaults(user_info),
+        )
+        return JsonResponse(auth_payload(user))
@@ -1,29 +1,117 @@
 from django.contrib import admin
-from .models import Product, Category, Order, OrderItem, Cart
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import path, reverse
+from django.utils.html import format_html
+
+from .models import Product, Category, Order, OrderItem, Cart, StockReservation, RequestProfile, SoftDeleteModel
+from .services import set_active
+
+
+class ModelAdmin(admin.ModelAdmin):
+    """
+    Foreign key choices include deactivated rows, so a row pointing at one
+    can still be edited and saved
+    """
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        related = db_field.related_model
+        if 'queryset' not in kwargs and issubclass(related, SoftDeleteModel):
+            kwargs['queryset'] = related.all_objects.all()
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
+
+class SoftDeleteAdmin(ModelAdmin):
+    """Lists deactivated rows too, with actions to deactivate or restore them"""
+    actions = ['deactivate', 'restore']
+
+    def get_queryset(self, request):
+        queryset = self.model.all_objects.get_queryset()
+        ordering = self.get_ordering(request)
+        return queryset.order_by(*ordering) if ordering else queryset
+
+    @admin.action(description="Deactivate selected %(verbose_name_plural)s")
+    def deactivate(self, request, queryset):
+        self.message_user(request, f"Deactivated {len(set_active(queryset, False))} rows")
+
+    @admin.action(description="Restore selected %(verbose_name_plural)s")
+    def restore(self, request, queryset):
+        self.message_user(request, f"Restored {len(set_active(queryset, True))} rows")
 
 
 @admin.register(Product)
-class ProductAdmin(admin.ModelAdmin):
-    list_display = ("id",'name', 'price', 'stock', 'created_at')
+class ProductAdmin(SoftDeleteAdmin):
+    list_display = ("id",'name', 'price', 'stock', 'is_active', 'created_at')
     search_fields = ('name', 'description')
-    list_filter = ('created_at', 'updated_at')
+    list_filter = ('is_active', 'created_at', 'updated_at')
 
 
 @admin.register(Category)
-class CategoryAdmin(admin.ModelAdmin):
-    list_display = ('id', 'name', 'description')
+class CategoryAdmin(SoftDeleteAdmin):
+    list_display = ('id', 'name', 'description', 'is_active')
     search_fields = ('name', 'description')
+    list_filter = ('is_active',)
 
 @admin.register(Order)
-class OrderAdmin(admin.ModelAdmin):
+class OrderAdmin(ModelAdmin):
     list_display = ["customer","total_price"]
     search_fields = ["total_price","created_at","customer"]
 
 @admin.register(OrderItem)
-class OrderItemAdmin(admin.ModelAdmin):
+class OrderItemAdmin(ModelAdmin):
     list_display = ["order", "product", "quantity"]
     search_fields = ['price']
 
 @admin.register(Cart)
-class CartAdmin(admin.ModelAdmin):
-    list_display = ["product", "user", "quantity","total_price"]
\ No newline at end of file
+class CartAdmin(ModelAdmin):
+    list_display = ["product", "user", "quantity","total_price"]
+
+
+@admin.register(StockReservation)
+class StockReservationAdmin(ModelAdmin):
+    list_display = ["product", "user", "quantity", "status", "expires_at"]
+    list_filter = ["status"]
+
+
+@admin.register(RequestProfile)
+class RequestProfileAdmin(admin.ModelAdmin):
+    """Captures from products.profiling; read-only, each downloadable as .pstats"""
+    list_display = ["created_at", "method", "route", "status_code", "duration_ms", "trigger", "user", "download"]
+    list_filter = ["trigger", "method", "route"]
+    search_fields = ["route", "path"]
+    date_hierarchy = "created_at"
+    fields = ["route", "method", "path", "status_code", "duration_ms", "trigger", "user", "created_at", "download",
+              "summary_text"]
+    readonly_fields = fields
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related("user").defer("stats")
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def get_urls(self):
+        download = self.admin_site.admin_view(self.download_view)
+        return [
+            path("<str:pk>/download/", download, name="products_requestprofile_download"),
+        ] + super().get_urls()
+
+    def download_view(self, request, pk):
+        if not self.has_view_permission(request):
+            return HttpResponse(status=403)
+        profile = get_object_or_404(RequestProfile, pk=pk)
+        response = HttpResponse(bytes(profile.stats), content_type="application/octet-stream")
+        response["Content-Disposition"] = f'attachment; filename="{profile.filename}"'
+        return response
+
+    @admin.display(description="pstats")
+    def download(self, obj):
+        url = reverse("admin:products_requestprofile_download", args=[obj.pk])
+        return format_html('<a href="{}">{}</a>', url, obj.filename)
+
+    @admin.display(description="Summary")
+    def summary_text(self, obj):
+        return format_html("<pre>{}</pre>", obj.summary)
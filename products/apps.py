@@ -1,6 +1,15 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate, pre_migrate
 
 
 class ProductsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'products'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from ecommerce.db import lift_for_migrations, restore_after_migrations
+
+        # Backfills and index builds outlast DB_STATEMENT_TIMEOUT_MS on a big catalog
+        pre_migrate.connect(lift_for_migrations, dispatch_uid="ecommerce.db.lift_for_migrations")
+        post_migrate.connect(restore_after_migrations, dispatch_uid="ecommerce.db.restore_after_migrations")
@@ -0,0 +1,136 @@
+"""
+Async versions of the catalog read endpoints, for ASGI deployments.
+
+GET requests to the product list and detail, the category list and the
+review list are answered with the async ORM and cache API instead of
+holding a worker thread each. Every other method falls through to the DRF
+viewset. The viewsets' querysets, filters, permissions, serializers and
+cache entries are reused, so both paths return the same payloads. Wired up
+in products.urls when ASYNC_READ_VIEWS is on (the default under ASGI).
+"""
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.exceptions import NotFound
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from ecommerce.instrumentation import record_cache
+
+from . import cache as product_cache
+from .views import CategoryViewSet, ProductViewSet, ReviewViewSet
+
+LIST_ACTIONS = {'get': 'list', 'post': 'create'}
+DETAIL_ACTIONS = {'get': 'retrieve', 'put': 'update', 'patch': 'partial_update', 'delete': 'destroy'}
+
+
+def make_view(viewset_class, request, action_map, kwargs):
+    """Set up a viewset instance the way ``as_view()`` would for one request"""
+    view = viewset_class(action_map=action_map, args=(), kwargs=kwargs, format_kwarg=None)
+    # The browsable API renders forms from the database; JSON only here
+    view.renderer_classes = [JSONRenderer]
+    view.headers = view.default_response_headers
+    view.request = view.initialize_request(request, **kwargs)
+    return view
+
+
+async def initial(view):
+    # Without a token JWTAuthentication returns before touching the database,
+    # so anonymous requests are checked in the event loop. With one, the
+    # user row is loaded, which needs a thread.
+    if 'HTTP_AUTHORIZATION' in view.request.META:
+        await sync_to_async(view.initial)(view.request)
+    else:
+        view.initial(view.request)
+
+
+async def filtered_queryset(view):
+    queryset = view.get_queryset()
+    if getattr(view, 'filterset_fields', None) or getattr(view, 'filterset_class', None):
+        # django-filter validates some values against the database (a
+        # category filter looks the category up), so run it in a thread
+        return await sync_to_async(view.filter_queryset)(queryset)
+    return view.filter_queryset(queryset)
+
+
+async def paginated_data(view):
+    queryset = await filtered_queryset(view)
+    page = await view.paginator.apaginate_queryset(queryset, view.request, view)
+    return view.paginator.get_paginated_data(view.get_serializer(page, many=True).data)
+
+
+async def cached_list(view):
+    """``CachedListMixin.list``, sharing its cache entries"""
+    key = await product_cache.alist_cache_key(view.cache_prefix, view.request.query_params)
+    data = await product_cache.aget_or_rebuild(
+        key, lambda: paginated_data(view), timeout=view.cache_timeout, grace=view.cache_grace,
+    )
+    return Response(data)
+
+
+async def cached_detail(view):
+    """``CachedDetailMixin.retrieve``, sharing its cache entries"""
+    label, pk = view.detail_cache_label, view.kwargs['pk']
+    entry_key = product_cache.detail_cache_key(label, pk)
+    entry = await cache.aget(entry_key)
+    if entry is not None and await product_cache.aobject_versions(list(entry['versions'])) != entry['versions']:
+        entry = None
+    record_cache(hit=entry is not None)
+    if entry is None:
+        own_version = await product_cache.aobject_versions([product_cache.object_version_key(label, pk)])
+        with await product_cache.afresh_reads():
+            queryset = await filtered_queryset(view)
+            try:
+                instance = await queryset.aget(pk=pk)
+            except queryset.model.DoesNotExist:
+                raise NotFound(f"No {queryset.model._meta.object_name} matches the given query.")
+            view.check_object_permissions(view.request, instance)
+            data = view.get_serializer(instance).data
+        keys = [product_cache.object_version_key(*dependency) for dependency in view.get_cache_dependencies(instance)]
+        versions = {**await product_cache.aobject_versions(keys), **own_version}
+        entry = product_cache.detail_entry(versions, data)
+        await cache.aset(entry_key, entry, timeout=product_cache.PRODUCT_LIST_TIMEOUT)
+
+    headers = product_cache.detail_headers(entry)
+    if product_cache.not_modified(view.request, entry):
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(entry['data'], headers=headers)
+
+
+async def cached_category_list(view):
+    response = await cached_list(view)
+    response['Cache-Control'] = 'public, max-age=3600'  # As CategoryViewSet.list
+    return response
+
+
+async def uncached_list(view):
+    return Response(await paginated_data(view))
+
+
+def async_read(viewset_class, actions, handler):
+    """
+    An async view answering GET and HEAD with ``handler(view)`` and handing
+    other methods to ``viewset_class.as_view(actions)`` in a thread.
+    """
+    fallback = sync_to_async(viewset_class.as_view(actions))
+    read_actions = {'get': actions['get'], 'head': actions['get']}
+
+    async def view(request, *args, **kwargs):
+        if request.method.lower() not in read_actions:
+            return await fallback(request, *args, **kwargs)
+        viewset = make_view(viewset_class, request, read_actions, kwargs)
+        try:
+            await initial(viewset)
+            response = await handler(viewset)
+        except Exception as exc:
+            response = viewset.handle_exception(exc)
+        return viewset.finalize_response(viewset.request, response).render()
+
+    view.csrf_exempt = True
+    return view
+
+
+product_list = async_read(ProductViewSet, LIST_ACTIONS, cached_list)
+product_detail = async_read(ProductViewSet, DETAIL_ACTIONS, cached_detail)
+category_list = async_read(CategoryViewSet, LIST_ACTIONS, cached_category_list)
+review_list = async_read(ReviewViewSet, LIST_ACTIONS, uncached_list)
@@ -0,0 +1,428 @@
+import asyncio
+import hashlib
+import time
+import uuid
+from contextlib import nullcontext
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.utils.http import http_date, parse_etags, parse_http_date_safe, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+from ecommerce.db_router import primary, replicas, sticky_seconds
+from ecommerce.instrumentation import record_cache
+
+GENERATION_KEY = "products:generation"
+# When the catalog last changed; cache rebuilds read the primary for a while after
+CHANGED_KEY = "products:changed_at"
+STATS_KEYS = {
+    "hits": "products:stats:hits",
+    "misses": "products:stats:misses",
+    "invalidations": "products:stats:invalidations",
+    "stale": "products:stats:stale",
+    "rebuilds": "products:stats:rebuilds",
+}
+
+# Entries are invalidated by bumping the generation, so the TTL can be long
+PRODUCT_LIST_TIMEOUT = getattr(settings, "PRODUCT_LIST_CACHE_TIMEOUT", 60 * 60 * 6)
+# How long an expired entry may still be served while one worker rebuilds it
+STALE_GRACE = getattr(settings, "PRODUCT_CACHE_STALE_GRACE", 60 * 5)
+# Upper bound on a rebuild; the lock expires on its own if a worker dies
+REBUILD_LOCK_TIMEOUT = getattr(settings, "PRODUCT_CACHE_LOCK_TIMEOUT", 30)
+REBUILD_POLL_INTERVAL = 0.05
+CART_COUNT_TIMEOUT = 60 * 60 * 24
+
+
+def _incr(key, delta=1):
+    # incr() raises if the key is missing (e.g. evicted), so seed it first
+    cache.add(key, 0, timeout=None)
+    try:
+        return cache.incr(key, delta)
+    except ValueError:
+        cache.set(key, delta, timeout=None)
+        return delta
+
+
+async def _aincr(key, delta=1):
+    await cache.aadd(key, 0, timeout=None)
+    try:
+        return await cache.aincr(key, delta)
+    except ValueError:
+        await cache.aset(key, delta, timeout=None)
+        return delta
+
+
+def _count(name):
+    """Bump a shared cache statistic and note hits/misses on the request's metrics"""
+    _incr(STATS_KEYS[name])
+    record_cache(hit=name != "misses")
+
+
+async def _acount(name):
+    await _aincr(STATS_KEYS[name])
+    record_cache(hit=name != "misses")
+
+
+def get_generation():
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        # Seed from the clock so an evicted counter never restarts at a
+        # generation whose entries may still be cached
+        cache.add(GENERATION_KEY, int(time.time() * 1000), timeout=None)
+        generation = cache.get(GENERATION_KEY)
+    return generation
+
+
+async def aget_generation():
+    generation = await cache.aget(GENERATION_KEY)
+    if generation is None:
+        await cache.aadd(GENERATION_KEY, int(time.time() * 1000), timeout=None)
+        generation = await cache.aget(GENERATION_KEY)
+    return generation
+
+
+def _mark_changed():
+    cache.set(CHANGED_KEY, time.time(), timeout=None)
+
+
+def _lagging(changed):
+    return changed is None or time.time() - changed < sticky_seconds()
+
+
+def fresh_reads():
+    """
+    ``primary()`` while the replicas may not have caught up with the last
+    catalog change, so a rebuilt entry never stores rows older than its
+    generation or version. Does nothing otherwise.
+    """
+    if not replicas():
+        return nullcontext()
+    changed = cache.get(CHANGED_KEY)
+    if changed is None:
+        # Unknown (never set or evicted) counts as changed now
+        cache.add(CHANGED_KEY, time.time(), timeout=None)
+    return primary() if _lagging(changed) else nullcontext()
+
+
+async def afresh_reads():
+    if not replicas():
+        return nullcontext()
+    changed = await cache.aget(CHANGED_KEY)
+    if changed is None:
+        await cache.aadd(CHANGED_KEY, time.time(), timeout=None)
+    return primary() if _lagging(changed) else nullcontext()
+
+
+def _repeat_on_commit(func):
+    """
+    Run ``func`` again once the current transaction commits. Until then
+    other workers still read the old rows, and one that rebuilt an entry in
+    between would have stored them under the new generation or version.
+    """
+    if connection.in_atomic_block:
+        transaction.on_commit(func)
+
+
+def _bump_generation():
+    get_generation()
+    _mark_changed()
+    return _incr(GENERATION_KEY)
+
+
+def bump_generation():
+    _incr(STATS_KEYS["invalidations"])
+    _repeat_on_commit(_bump_generation)
+    return _bump_generation()
+
+
+def _list_key(prefix, generation, query_params):
+    params_hash = hashlib.md5(query_params.urlencode().encode("utf-8")).hexdigest()
+    return f"{prefix}:v{generation}:{params_hash}"
+
+
+def list_cache_key(prefix, query_params):
+    """Build a versioned key from the request query params"""
+    return _list_key(prefix, get_generation(), query_params)
+
+
+async def alist_cache_key(prefix, query_params):
+    return _list_key(prefix, await aget_generation(), query_params)
+
+
+def _acquire_lock(key, lock_timeout):
+    token = uuid.uuid4().hex
+    if cache.add(f"{key}:lock", token, timeout=lock_timeout):
+        return token
+    return None
+
+
+def _release_lock(key, token):
+    if cache.get(f"{key}:lock") == token:
+        cache.delete(f"{key}:lock")
+
+
+def _store(key, data, timeout, grace):
+    entry = {"data": data, "fresh_until": time.time() + timeout}
+    cache.set(key, entry, timeout=timeout + grace)
+
+
+async def _aacquire_lock(key, lock_timeout):
+    token = uuid.uuid4().hex
+    if await cache.aadd(f"{key}:lock", token, timeout=lock_timeout):
+        return token
+    return None
+
+
+async def _arelease_lock(key, token):
+    if await cache.aget(f"{key}:lock") == token:
+        await cache.adelete(f"{key}:lock")
+
+
+async def _astore(key, data, timeout, grace):
+    entry = {"data": data, "fresh_until": time.time() + timeout}
+    await cache.aset(key, entry, timeout=timeout + grace)
+
+
+def get_or_rebuild(key, rebuild, timeout=PRODUCT_LIST_TIMEOUT, grace=STALE_GRACE,
+                   lock_timeout=REBUILD_LOCK_TIMEOUT):
+    """
+    Return the cached value for ``key``, calling ``rebuild()`` in at most one
+    worker at a time when it is missing or expired.
+
+    Expired entries are kept for ``grace`` seconds and served to everyone
+    but the worker holding the rebuild lock. On a cold miss the other
+    workers wait for that rebuild instead of running the same query.
+    """
+    entry = cache.get(key)
+    if entry is not None and entry["fresh_until"] > time.time():
+        _count("hits")
+        return entry["data"]
+
+    deadline = time.time() + lock_timeout
+    while True:
+        token = _acquire_lock(key, lock_timeout)
+        if token is not None:
+            try:
+                # Another worker may have finished while we were waiting
+                latest = cache.get(key)
+                if latest is not None and latest["fresh_until"] > time.time():
+                    _count("hits")
+                    return latest["data"]
+                _count("misses")
+                _incr(STATS_KEYS["rebuilds"])
+                with fresh_reads():
+                    data = rebuild()
+                _store(key, data, timeout, grace)
+                return data
+            finally:
+                _release_lock(key, token)
+
+        if entry is not None:
+            _count("stale")
+            return entry["data"]
+
+        time.sleep(REBUILD_POLL_INTERVAL)
+        entry = cache.get(key)
+        if entry is not None and entry["fresh_until"] > time.time():
+            _count("hits")
+            return entry["data"]
+        if time.time() >= deadline:
+            # The lock holder is stuck; don't keep the request hanging
+            _count("misses")
+            return rebuild()
+
+
+async def aget_or_rebuild(key, rebuild, timeout=PRODUCT_LIST_TIMEOUT, grace=STALE_GRACE,
+                          lock_timeout=REBUILD_LOCK_TIMEOUT):
+    """``get_or_rebuild`` for async views; ``rebuild`` is a coroutine function"""
+    entry = await cache.aget(key)
+    if entry is not None and entry["fresh_until"] > time.time():
+        await _acount("hits")
+        return entry["data"]
+
+    deadline = time.time() + lock_timeout
+    while True:
+        token = await _aacquire_lock(key, lock_timeout)
+        if token is not None:
+            try:
+                latest = await cache.aget(key)
+                if latest is not None and latest["fresh_until"] > time.time():
+                    await _acount("hits")
+                    return latest["data"]
+                await _acount("misses")
+                await _aincr(STATS_KEYS["rebuilds"])
+                with await afresh_reads():
+                    data = await rebuild()
+                await _astore(key, data, timeout, grace)
+                return data
+            finally:
+                await _arelease_lock(key, token)
+
+        if entry is not None:
+            await _acount("stale")
+            return entry["data"]
+
+        await asyncio.sleep(REBUILD_POLL_INTERVAL)
+        entry = await cache.aget(key)
+        if entry is not None and entry["fresh_until"] > time.time():
+            await _acount("hits")
+            return entry["data"]
+        if time.time() >= deadline:
+            await _acount("misses")
+            return await rebuild()
+
+
+class CachedListMixin:
+    """
+    Cache ``list`` responses under a generation-versioned key with
+    single-flight rebuilds. Set ``cache_prefix`` on the viewset.
+    """
+    cache_prefix = None
+    cache_timeout = PRODUCT_LIST_TIMEOUT
+    cache_grace = STALE_GRACE
+
+    def list(self, request, *args, **kwargs):
+        cache_key = list_cache_key(self.cache_prefix, request.query_params)
+        data = get_or_rebuild(
+            cache_key,
+            lambda: super(CachedListMixin, self).list(request, *args, **kwargs).data,
+            timeout=self.cache_timeout,
+            grace=self.cache_grace,
+        )
+        return Response(data)
+
+
+def detail_cache_key(label, pk):
+    return f"detail:{label}:{pk}"
+
+
+def object_version_key(label, pk):
+    # Under its own prefix, so L1_BYPASS can name it while bodies stay in L1
+    return f"detail:version:{label}:{pk}"
+
+
+def bump_object_versions(label, pks):
+    """Mark objects as changed; the version doubles as their Last-Modified"""
+    keys = [object_version_key(label, pk) for pk in pks]
+
+    def bump():
+        # Marked first: whoever sees the new version also sees the change
+        _mark_changed()
+        now = time.time()
+        cache.set_many({key: now for key in keys}, timeout=None)
+
+    _repeat_on_commit(bump)
+    bump()
+
+
+def object_versions(keys):
+    versions = cache.get_many(keys)
+    missing = [key for key in keys if key not in versions]
+    if missing:
+        # Unknown (never bumped or evicted) counts as changed now
+        now = time.time()
+        for key in missing:
+            cache.add(key, now, timeout=None)
+        versions.update(cache.get_many(missing))
+    return versions
+
+
+async def aobject_versions(keys):
+    versions = await cache.aget_many(keys)
+    missing = [key for key in keys if key not in versions]
+    if missing:
+        now = time.time()
+        for key in missing:
+            await cache.aadd(key, now, timeout=None)
+        versions.update(await cache.aget_many(missing))
+    return versions
+
+
+def detail_entry(versions, data):
+    """Cache entry of one serialized object built from ``versions``"""
+    return {
+        'versions': versions,
+        'etag': quote_etag(hashlib.md5(repr(sorted(versions.items())).encode('utf-8')).hexdigest()),
+        'last_modified': int(max(versions.values())),
+        'data': data,
+    }
+
+
+def detail_headers(entry):
+    return {'ETag': entry['etag'], 'Last-Modified': http_date(entry['last_modified'])}
+
+
+def not_modified(request, entry):
+    """Whether the conditional headers of ``request`` match ``entry``"""
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match is not None:
+        etags = parse_etags(if_none_match)
+        return '*' in etags or entry['etag'] in etags
+    since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+    return since is not None and entry['last_modified'] <= since
+
+
+class CachedDetailMixin:
+    """
+    Cache serialized ``retrieve`` responses per object and answer conditional
+    GETs. Each entry records the versions of the objects it was built from
+    (see ``get_cache_dependencies``); it is reused while they are unchanged
+    and gives a strong ``ETag`` and a ``Last-Modified`` header. A matching
+    ``If-None-Match`` or ``If-Modified-Since`` gets a 304 without running
+    the query or the serializer.
+    """
+    detail_cache_label = None
+
+    def get_cache_dependencies(self, instance):
+        return [(self.detail_cache_label, instance.pk)]
+
+    def retrieve(self, request, *args, **kwargs):
+        pk = kwargs[self.lookup_url_kwarg or self.lookup_field]
+        entry_key = detail_cache_key(self.detail_cache_label, pk)
+        entry = cache.get(entry_key)
+        if entry is not None and object_versions(list(entry['versions'])) != entry['versions']:
+            entry = None
+        record_cache(hit=entry is not None)
+        if entry is None:
+            # Read the object's own version before the row, so a concurrent
+            # edit leaves the entry looking outdated rather than current
+            own_key = object_version_key(self.detail_cache_label, pk)
+            own_version = object_versions([own_key])
+            with fresh_reads():
+                instance = self.get_object()
+                data = self.get_serializer(instance).data
+            keys = [object_version_key(label, pk) for label, pk in self.get_cache_dependencies(instance)]
+            versions = {**object_versions(keys), **own_version}
+            entry = detail_entry(versions, data)
+            cache.set(entry_key, entry, timeout=PRODUCT_LIST_TIMEOUT)
+
+        if not_modified(request, entry):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=detail_headers(entry))
+        return Response(entry['data'], headers=detail_headers(entry))
+
+
+def cart_count_key(user_id):
+    return f"cart:count:{user_id}"
+
+
+def cart_count(user):
+    """Total quantity in the user's cart, cached until the cart changes"""
+    key = cart_count_key(user.pk)
+    count = cache.get(key)
+    if count is None:
+        count = user.cart.aggregate(count=Sum('quantity'))['count'] or 0
+        cache.set(key, count, timeout=CART_COUNT_TIMEOUT)
+    return count
+
+
+def invalidate_cart_count(user_id):
+    cache.delete(cart_count_key(user_id))
+
+
+def cache_stats():
+    stats = {name: cache.get(key) or 0 for name, key in STATS_KEYS.items()}
+    stats["generation"] = get_generation()
+    return stats
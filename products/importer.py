@@ -0,0 +1,217 @@
+import csv
+import io
+import json
+import os
+import time
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.db import connection, transaction
+
+from .cache import bump_generation, bump_object_versions
+from .models import Category, Product
+from .navigation import rebuild_category_stats
+from .search import search_vector_sql
+
+STAGING_TABLE = 'products_import_staging'
+STAGING_COLUMNS = ['seq', 'id', 'name', 'description', 'price', 'stock', 'category_id']
+MAX_PRICE = Decimal('99999999.99')  # Product.price is max_digits=10, decimal_places=2
+MAX_STOCK = 2147483647
+
+MERGE_SQL = f"""
+    INSERT INTO products_product
+        (id, name, description, price, stock, category_id, is_active, created_at, updated_at, search_vector)
+    SELECT DISTINCT ON (s.id)
+        s.id, s.name, s.description, s.price, s.stock, s.category_id, TRUE, now(), now(),
+        {search_vector_sql('s.name', 'c.name', 's.description')}
+    FROM {STAGING_TABLE} AS s
+    LEFT JOIN products_category AS c ON c.id = s.category_id
+    ORDER BY s.id, s.seq DESC
+    ON CONFLICT (id) DO UPDATE SET
+        name = EXCLUDED.name,
+        description = EXCLUDED.description,
+        price = EXCLUDED.price,
+        stock = EXCLUDED.stock,
+        category_id = EXCLUDED.category_id,
+        updated_at = EXCLUDED.updated_at,
+        search_vector = EXCLUDED.search_vector
+"""
+
+
+class InvalidRow(ValueError):
+    pass
+
+
+def read_rows(path, fmt=None):
+    """Yield dict rows from a CSV or NDJSON file, one line at a time"""
+    fmt = fmt or ('csv' if path.endswith('.csv') else 'ndjson')
+    with open(path, newline='', encoding='utf-8') as source:
+        if fmt == 'csv':
+            yield from csv.DictReader(source)
+        else:
+            for line in source:
+                if line.strip():
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        yield None
+
+
+def text(row, field):
+    """The stripped string in ``field``; '' when it is missing or null"""
+    value = row.get(field)
+    if value is None:
+        return ''
+    if not isinstance(value, str):
+        raise InvalidRow(f"{field} must be a string")
+    return value.strip()
+
+
+def whole_number(value):
+    """``value`` as an int; fractions are rejected rather than truncated"""
+    if isinstance(value, bool):
+        raise InvalidRow("stock is not an integer")
+    if isinstance(value, float):
+        if not value.is_integer():
+            raise InvalidRow("stock is not an integer")
+        return int(value)
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise InvalidRow("stock is not an integer")
+
+
+def clean_row(row):
+    """Validate one input row; returns ``(id, name, description, price, stock, category name)``"""
+    if not isinstance(row, dict):
+        raise InvalidRow("not a JSON object")
+    name = text(row, 'name')
+    if not name or len(name) > 255:
+        raise InvalidRow("name is required and at most 255 characters")
+    try:
+        price = Decimal(str(row.get('price'))).quantize(Decimal('0.01'))
+    except InvalidOperation:
+        raise InvalidRow("price is not a number")
+    if not price.is_finite() or not 0 <= price <= MAX_PRICE:
+        raise InvalidRow("price is out of range")
+    stock = whole_number(row.get('stock') or 0)
+    if not 0 <= stock <= MAX_STOCK:
+        raise InvalidRow("stock is out of range")
+    product_id = str(row.get('id') or Product._meta.pk.get_default())
+    if len(product_id) > 22:
+        raise InvalidRow("id is longer than 22 characters")
+    category = text(row, 'category') or None
+    if category is not None and len(category) > 255:
+        raise InvalidRow("category is longer than 255 characters")
+    description = row.get('description') or None
+    if description is not None and not isinstance(description, str):
+        raise InvalidRow("description must be a string")
+    return product_id, name, description, price, stock, category
+
+
+def resolve_categories(names):
+    """Map category names to ids, creating the missing ones in bulk"""
+    ids = dict(Category.all_objects.filter(name__in=names).values_list('name', 'id'))
+    missing = [name for name in names if name not in ids]
+    if missing:
+        Category.objects.bulk_create([Category(name=name) for name in missing], ignore_conflicts=True)
+        ids.update(Category.all_objects.filter(name__in=missing).values_list('name', 'id'))
+    return ids
+
+
+def copy_rows(cursor, table, columns, buffer):
+    sql = f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)"
+    raw = cursor.cursor
+    if hasattr(raw, 'copy_expert'):  # psycopg2
+        raw.copy_expert(sql, buffer)
+    else:  # psycopg 3
+        with raw.copy(sql) as copy:
+            copy.write(buffer.getvalue())
+
+
+class CatalogImporter:
+    """
+    Load products from a large CSV/NDJSON file in batches.
+
+    Each batch is validated in Python, its categories are resolved or
+    created with a couple of queries, and the rows are COPY'd into a staging
+    table and merged into ``products_product`` with one
+    ``INSERT ... SELECT ... ON CONFLICT``. After every committed batch the
+    number of input rows consumed is written to a checkpoint file, so a
+    rerun resumes where the last one stopped.
+    """
+
+    def __init__(self, path, fmt=None, batch_size=50000, checkpoint_path=None, log=None):
+        self.path = path
+        self.fmt = fmt
+        self.batch_size = batch_size
+        self.checkpoint_path = checkpoint_path or f"{path}.checkpoint"
+        self.log = log or (lambda message: None)
+        self.loaded = 0
+        self.rejected = []
+
+    def load_checkpoint(self):
+        if not os.path.exists(self.checkpoint_path):
+            return 0
+        with open(self.checkpoint_path) as checkpoint:
+            return json.load(checkpoint)['offset']
+
+    def save_checkpoint(self, offset):
+        tmp_path = f"{self.checkpoint_path}.tmp"
+        with open(tmp_path, 'w') as checkpoint:
+            json.dump({'offset': offset}, checkpoint)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def run(self):
+        if connection.vendor != 'postgresql':
+            raise RuntimeError("import_catalog needs PostgreSQL (COPY)")
+        offset = self.load_checkpoint()
+        if offset:
+            self.log(f"Resuming after row {offset}")
+        rows = islice(enumerate(read_rows(self.path, self.fmt)), offset, None)
+        start = time.perf_counter()
+
+        while batch := list(islice(rows, self.batch_size)):
+            self.load_batch(batch)
+            offset = batch[-1][0] + 1
+            self.save_checkpoint(offset)
+            elapsed = time.perf_counter() - start
+            self.log(f"{offset} rows read, {self.loaded} loaded, {self.loaded / elapsed:.0f} rows/s")
+
+        if self.loaded:
+            bump_generation()
+            # One GROUP BY over the catalog beats refreshing per batch
+            rebuild_category_stats()
+        if os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+        return self.loaded, self.rejected
+
+    @transaction.atomic
+    def load_batch(self, batch):
+        cleaned = []
+        for index, row in batch:
+            try:
+                cleaned.append((index, clean_row(row)))
+            except InvalidRow as exc:
+                self.rejected.append((index, str(exc)))
+        if not cleaned:
+            return
+
+        categories = resolve_categories({row[5] for _, row in cleaned if row[5]})
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for index, (product_id, name, description, price, stock, category) in cleaned:
+            writer.writerow([index, product_id, name, description, price, stock, categories.get(category)])
+        buffer.seek(0)
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE TEMP TABLE IF NOT EXISTS {STAGING_TABLE} ("
+                "seq bigint, id varchar(22), name varchar(255), description text, "
+                "price numeric(10, 2), stock integer, category_id varchar(22))"
+            )
+            cursor.execute(f"TRUNCATE {STAGING_TABLE}")
+            copy_rows(cursor, STAGING_TABLE, STAGING_COLUMNS, buffer)
+            cursor.execute(MERGE_SQL)
+        bump_object_versions('product', {row[0] for _, row in cleaned})
+        self.loaded += len(cleaned)
@@ -0,0 +1,47 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from login.models import CustomUser
+from products.models import Cart, Product
+
+
+class Command(BaseCommand):
+    help = "Compare placing an N-item order per line (orders/ + order-items/) with carts/checkout/"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--items", type=int, default=30)
+
+    def handle(self, *args, **options):
+        user, _ = CustomUser.objects.get_or_create(
+            username="bench-checkout", defaults={"email": "bench-checkout@example.com"}
+        )
+        products = [
+            Product.objects.create(name=f"bench checkout {i}", price=10 + i, stock=100)
+            for i in range(options["items"])
+        ]
+        client = APIClient(HTTP_HOST="localhost")
+        client.force_authenticate(user)
+        try:
+            self.report("per-line requests", lambda: self.per_line(client, products))
+            Cart.objects.bulk_create([Cart(user=user, product=product, quantity=2) for product in products])
+            self.report("carts/checkout/", lambda: client.post("/api/carts/checkout/"))
+        finally:
+            user.orders.all().delete()
+            Product.objects.filter(pk__in=[product.pk for product in products]).delete()
+            user.delete()
+
+    def per_line(self, client, products):
+        order = client.post("/api/orders/").data
+        for product in products:
+            client.post("/api/order-items/", {"order_id": order["id"], "product_id": product.id, "quantity": 2})
+
+    def report(self, name, run):
+        with CaptureQueriesContext(connection) as ctx:
+            start = time.perf_counter()
+            run()
+            elapsed = time.perf_counter() - start
+        self.stdout.write(f"{name:>18}: {len(ctx.captured_queries):5d} queries {elapsed * 1000:9.1f} ms")
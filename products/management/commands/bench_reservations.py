@@ -0,0 +1,78 @@
+import threading
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from login.models import CustomUser
+from products.models import Product, StockReservation
+from products.services import RESERVATION_TTL, InsufficientStock, reserve_stock
+
+
+def naive_reserve(user, product, quantity):
+    """Baseline: lock the product row, check and decrement in Python"""
+    with transaction.atomic():
+        locked = Product.objects.select_for_update().get(pk=product.pk)
+        if locked.stock < quantity:
+            raise InsufficientStock(locked)
+        Product.objects.filter(pk=product.pk).update(stock=locked.stock - quantity)
+        StockReservation.objects.create(
+            user=user, product=product, quantity=quantity,
+            expires_at=timezone.now() + timedelta(seconds=RESERVATION_TTL),
+        )
+
+
+class Command(BaseCommand):
+    help = "Benchmark reservations on one hot SKU: conditional UPDATE vs select_for_update"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=16)
+        parser.add_argument("--stock", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        user, _ = CustomUser.objects.get_or_create(
+            username="bench-reservations", defaults={"email": "bench-reservations@example.com"}
+        )
+        for name, reserve in [("select_for_update", naive_reserve), ("conditional update", reserve_stock)]:
+            product = Product.objects.create(name="bench hot sku", price=1, stock=options["stock"])
+            try:
+                elapsed, sold = self.run(reserve, user, product, options["workers"])
+                product.refresh_from_db()
+                self.stdout.write(
+                    f"{name:>18}: {sold / elapsed:8.0f} reservations/s "
+                    f"({sold} sold, {product.stock} left, {options['workers']} workers)"
+                )
+                if sold + product.stock != options["stock"]:
+                    self.stderr.write(self.style.ERROR(f"{name} oversold or lost stock"))
+            finally:
+                product.delete()
+        user.delete()
+
+    def run(self, reserve, user, product, workers):
+        sold = []
+        barrier = threading.Barrier(workers + 1)
+
+        def worker():
+            count = 0
+            barrier.wait()
+            try:
+                while True:
+                    try:
+                        reserve(user, product, 1)
+                    except InsufficientStock:
+                        break
+                    count += 1
+            finally:
+                sold.append(count)
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(workers)]
+        for thread in threads:
+            thread.start()
+        barrier.wait()
+        start = time.perf_counter()
+        for thread in threads:
+            thread.join()
+        return time.perf_counter() - start, sum(sold)
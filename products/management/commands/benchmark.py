@@ -0,0 +1,118 @@
+import json
+import platform
+import subprocess
+from datetime import datetime, timezone
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from benchmarks.compare import NotComparable, compare
+from benchmarks.load import api_endpoints, run_load
+from benchmarks.seed import clear, is_seeded, parse_scale, plan, seed, user_id
+from ecommerce.db import no_statement_timeout
+from login.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed deterministic benchmark data and load-test the API routes. Start the app first "
+        "(e.g. `gunicorn ecommerce.wsgi -w 4 -b :8000`), then run "
+        "`benchmark --scale 10k --target http://127.0.0.1:8000 --output results.json`. Add "
+        "`--baseline baseline.json` to fail on regressions, or `--results results.json --baseline "
+        "baseline.json` to compare two stored runs."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--scale", default="10k", help="Products to seed, e.g. 10k or 1m; other tables follow")
+        parser.add_argument("--seed", type=int, default=1)
+        parser.add_argument("--target", default="http://127.0.0.1:8000", help="Base URL of the running app")
+        parser.add_argument("--concurrency", type=int, default=16)
+        parser.add_argument("--duration", type=float, default=30, help="Measured seconds")
+        parser.add_argument("--warmup", type=float, default=5, help="Unmeasured seconds before the run")
+        parser.add_argument("--users", type=int, default=50, help="Benchmark users to spread the clients over")
+        parser.add_argument("--output", help="Write the results to this JSON file")
+        parser.add_argument("--baseline", help="Fail if the results regress against this JSON file")
+        parser.add_argument("--tolerance", type=float, default=0.10, help="Allowed slowdown, as a fraction")
+        parser.add_argument("--results", help="Compare this stored run with --baseline instead of running")
+        parser.add_argument("--seed-only", action="store_true", help="Seed the data and exit")
+        parser.add_argument("--cleanup", action="store_true", help="Delete the benchmark data and exit")
+
+    @no_statement_timeout()
+    def handle(self, *args, **options):
+        if options["cleanup"]:
+            clear()
+            return
+        if options["results"]:
+            if not options["baseline"]:
+                raise CommandError("--results needs --baseline")
+            self.check_baseline(self.load(options["results"]), options)
+            return
+        try:
+            counts = plan(options["scale"])
+        except ValueError as exc:
+            raise CommandError(exc)
+
+        if not is_seeded(options["scale"], options["seed"]):
+            clear()
+            self.stdout.write(f"Seeding {json.dumps(counts)}")
+            seed(options["scale"], options["seed"], log=self.stdout.write)
+        if options["seed_only"]:
+            return
+
+        users = CustomUser.objects.filter(pk__in=[user_id(n) for n in range(min(options["users"], counts["users"]))])
+        tokens = [str(RefreshToken.for_user(user).access_token) for user in users]
+        endpoints = api_endpoints(options["scale"], options["seed"])
+        run_load(options["target"], endpoints, options["concurrency"], options["warmup"], tokens)
+        results = {
+            "meta": {
+                "scale": parse_scale(options["scale"]),
+                "seed": options["seed"],
+                "concurrency": options["concurrency"],
+                "duration": options["duration"],
+                "target": options["target"],
+                "commit": self.commit(),
+                "python": platform.python_version(),
+                "created_at": datetime.now(timezone.utc).isoformat(),
+            },
+            **run_load(options["target"], endpoints, options["concurrency"], options["duration"], tokens),
+        }
+        self.report(results)
+        if options["output"]:
+            with open(options["output"], "w") as output:
+                json.dump(results, output, indent=2)
+        if options["baseline"]:
+            self.check_baseline(results, options)
+
+    def report(self, results):
+        rows = [*results["endpoints"].items(), ("total", results["total"])]
+        for name, summary in rows:
+            queries = summary["queries_per_request"]
+            self.stdout.write(
+                f"{name:>20}: {summary['rps']:8.1f} req/s  p50 {summary['p50_ms'] or 0:7.1f}  "
+                f"p95 {summary['p95_ms'] or 0:7.1f}  p99 {summary['p99_ms'] or 0:7.1f} ms  "
+                f"queries {queries if queries is not None else '-':>5}  errors {summary['errors']}"
+            )
+
+    def check_baseline(self, results, options):
+        try:
+            problems = compare(results, self.load(options["baseline"]), options["tolerance"])
+        except NotComparable as exc:
+            raise CommandError(exc)
+        if problems:
+            raise CommandError("Regressions against the baseline:\n  " + "\n  ".join(problems))
+        self.stdout.write("No regressions against the baseline")
+
+    def load(self, path):
+        try:
+            with open(path) as source:
+                return json.load(source)
+        except (OSError, ValueError) as exc:
+            raise CommandError(f"Can't read {path}: {exc}")
+
+    def commit(self):
+        try:
+            return subprocess.run(
+                ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
@@ -0,0 +1,147 @@
+import json
+import random
+import re
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from login.models import CustomUser
+from products.models import Category, Order, Product
+
+PREFIX = "bench-index"
+# Indexes added for these queries; they are dropped (and restored by a
+# rollback) to capture the "before" plans.
+HOT_INDEXES = [
+    "product_active_cat_price",
+    "product_active_cat_created",
+    "product_active_stock",
+    "order_customer_recent",
+]
+
+
+class Rollback(Exception):
+    pass
+
+
+def hot_queries(category, customer):
+    """The storefront and order-history queries the indexes are meant for"""
+    live = Product.objects  # the default manager only returns live products
+    return {
+        "category by price": live.filter(category=category).order_by("price", "id")[:20],
+        "category newest first": live.filter(category=category).order_by("-created_at", "-id")[:20],
+        "category price range": live.filter(category=category, price__gte=20, price__lte=80).order_by("price", "id")[:20],
+        "out of stock": live.filter(stock=0).order_by("pk")[:20],
+        "customer order history": Order.objects.filter(customer=customer).order_by("-created_at", "-id")[:20],
+    }
+
+
+def execution_time(plan):
+    match = re.search(r"Execution Time: ([\d.]+) ms", plan)
+    return float(match.group(1)) if match else None
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a realistic catalog and record EXPLAIN ANALYZE plans for the hot queries, "
+        "with and without the indexes from migration 0007"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--products", type=int, default=200000)
+        parser.add_argument("--categories", type=int, default=200)
+        parser.add_argument("--customers", type=int, default=2000)
+        parser.add_argument("--orders-per-customer", type=int, default=10)
+        parser.add_argument("--output", help="Write the plans and timings to this JSON file")
+        parser.add_argument("--cleanup", action="store_true", help="Delete the seeded rows and exit")
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            raise CommandError("explain_hot_queries needs PostgreSQL")
+        if options["cleanup"]:
+            self.cleanup()
+            return
+
+        if not Category.all_objects.filter(name__startswith=PREFIX).exists():
+            self.seed(options)
+        category = Category.objects.filter(name__startswith=PREFIX).order_by("name").first()
+        customer = CustomUser.objects.filter(username__startswith=PREFIX).order_by("username").first()
+
+        results = {}
+        for name, queryset in hot_queries(category, customer).items():
+            before = self.explain_without_indexes(queryset)
+            after = queryset.explain(analyze=True, buffers=True)
+            results[name] = {
+                "before_ms": execution_time(before),
+                "after_ms": execution_time(after),
+                "before": before,
+                "after": after,
+            }
+            self.stdout.write(f"{name:>24}: {results[name]['before_ms']:9.3f} ms -> {results[name]['after_ms']:9.3f} ms")
+
+        if options["output"]:
+            with open(options["output"], "w") as output:
+                json.dump(results, output, indent=2)
+            self.stdout.write(f"Plans written to {options['output']}")
+
+    def explain_without_indexes(self, queryset):
+        # DROP INDEX takes an exclusive lock on the table until the rollback,
+        # so only run this against a benchmark database.
+        try:
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    for index in HOT_INDEXES:
+                        cursor.execute(f'DROP INDEX IF EXISTS "{index}"')
+                plan = queryset.explain(analyze=True, buffers=True)
+                raise Rollback
+        except Rollback:
+            return plan
+
+    def seed(self, options):
+        rng = random.Random(16)
+        start = time.perf_counter()
+        categories = Category.objects.bulk_create(
+            [Category(name=f"{PREFIX} {i:04d}") for i in range(options["categories"])]
+        )
+        batch = []
+        for i in range(options["products"]):
+            batch.append(Product(
+                name=f"{PREFIX} product {i}",
+                category=rng.choice(categories),
+                price=round(rng.lognormvariate(3.5, 0.8), 2),
+                stock=0 if rng.random() < 0.05 else rng.randint(1, 500),
+                is_active=rng.random() >= 0.1,
+            ))
+            if len(batch) == 5000:
+                Product.objects.bulk_create(batch)
+                batch = []
+        Product.objects.bulk_create(batch)
+
+        customers = CustomUser.objects.bulk_create([
+            CustomUser(username=f"{PREFIX}-{i:05d}", email=f"{PREFIX}-{i}@example.com")
+            for i in range(options["customers"])
+        ])
+        Order.objects.bulk_create(
+            [Order(customer=customer) for customer in customers for _ in range(options["orders_per_customer"])],
+            batch_size=5000,
+        )
+
+        # auto_now_add stamps every row with the same time; spread them over a year
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "UPDATE products_product SET created_at = now() - random() * interval '365 days' "
+                "WHERE name LIKE %s", [f"{PREFIX}%"]
+            )
+            cursor.execute(
+                "UPDATE products_order SET created_at = now() - random() * interval '365 days' "
+                "WHERE customer_id IN (SELECT id FROM login_customuser WHERE username LIKE %s)", [f"{PREFIX}%"]
+            )
+            cursor.execute("ANALYZE products_product")
+            cursor.execute("ANALYZE products_order")
+        self.stdout.write(f"Seeded {options['products']} products in {time.perf_counter() - start:.1f}s")
+
+    def cleanup(self):
+        CustomUser.objects.filter(username__startswith=PREFIX).delete()
+        Product.all_objects.filter(name__startswith=PREFIX).delete()
+        Category.all_objects.filter(name__startswith=PREFIX).delete()
+        self.stdout.write("Removed the benchmark rows")
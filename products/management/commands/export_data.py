@@ -0,0 +1,28 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from ecommerce.db import no_statement_timeout
+from products.export import EXPORTS, FORMATS, stream_export
+
+
+class Command(BaseCommand):
+    help = "Stream products, orders (with items) or reviews as NDJSON or CSV"
+
+    def add_arguments(self, parser):
+        parser.add_argument("kind", choices=list(EXPORTS))
+        parser.add_argument("--output", choices=list(FORMATS), default="ndjson")
+        parser.add_argument("--gzip", action="store_true")
+        parser.add_argument("--file", help="Write here instead of stdout")
+
+    @no_statement_timeout()
+    def handle(self, *args, **options):
+        blocks = stream_export(options["kind"], options["output"], options["gzip"])
+        if options["file"]:
+            with open(options["file"], "wb") as out:
+                for block in blocks:
+                    out.write(block)
+        else:
+            for block in blocks:
+                sys.stdout.buffer.write(block)
+            sys.stdout.buffer.flush()
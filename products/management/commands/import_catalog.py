@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ecommerce.db import no_statement_timeout
+from products.importer import CatalogImporter
+
+
+class Command(BaseCommand):
+    help = "Bulk load products from a CSV or NDJSON file (columns: id, name, description, price, stock, category)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument("--format", dest="fmt", choices=["csv", "ndjson"],
+                            help="Defaults to csv for *.csv files, ndjson otherwise")
+        parser.add_argument("--batch-size", type=int, default=50000)
+        parser.add_argument("--checkpoint", help="Checkpoint file, defaults to <path>.checkpoint")
+
+    @no_statement_timeout()
+    def handle(self, *args, **options):
+        importer = CatalogImporter(
+            options["path"],
+            fmt=options["fmt"],
+            batch_size=options["batch_size"],
+            checkpoint_path=options["checkpoint"],
+            log=self.stdout.write,
+        )
+        try:
+            loaded, rejected = importer.run()
+        except (OSError, RuntimeError) as exc:
+            raise CommandError(exc)
+
+        for index, error in rejected[:20]:
+            self.stderr.write(f"row {index}: {error}")
+        if len(rejected) > 20:
+            self.stderr.write(f"... and {len(rejected) - 20} more rejected rows")
+        self.stdout.write(self.style.SUCCESS(f"Loaded {loaded} products, rejected {len(rejected)} rows"))
@@ -0,0 +1,89 @@
+import json
+import random
+
+from django.core.management.base import BaseCommand, CommandError
+
+from benchmarks.load import Endpoint, run_load
+from login.models import CustomUser
+from products.models import Category, Product, Review
+
+PREFIX = "loadtest"
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare requests/s and latency of the catalog read endpoints across servers. "
+        "Seed once, then start the app under both servers against the same database, e.g. "
+        "`gunicorn ecommerce.wsgi -w 4 --threads 8 -b :8000` and "
+        "`uvicorn ecommerce.asgi:application --workers 4 --port 8001`, and run "
+        "`loadtest_read_paths --target wsgi=http://127.0.0.1:8000 --target asgi=http://127.0.0.1:8001`."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--target", action="append", default=[], metavar="NAME=URL")
+        parser.add_argument("--products", type=int, default=5000, help="Products to seed if none are seeded yet")
+        parser.add_argument("--concurrency", type=int, default=32)
+        parser.add_argument("--duration", type=float, default=20, help="Seconds per target")
+        parser.add_argument("--warmup", type=float, default=3, help="Unmeasured seconds per target")
+        parser.add_argument("--output", help="Write the results to this JSON file")
+        parser.add_argument("--cleanup", action="store_true", help="Delete the seeded rows and exit")
+
+    def handle(self, *args, **options):
+        if options["cleanup"]:
+            CustomUser.objects.filter(username__startswith=PREFIX).delete()
+            Product.all_objects.filter(name__startswith=PREFIX).delete()
+            Category.all_objects.filter(name__startswith=PREFIX).delete()
+            return
+        targets = []
+        for target in options["target"]:
+            name, _, url = target.partition("=")
+            if not url:
+                raise CommandError(f"--target must look like NAME=URL, got {target!r}")
+            targets.append((name, url.rstrip("/")))
+        if not targets:
+            raise CommandError("Give at least one --target NAME=URL")
+
+        if not Product.all_objects.filter(name__startswith=PREFIX).exists():
+            self.seed(options["products"])
+        paths = self.paths()
+
+        results = {}
+        for name, base_url in targets:
+            endpoints = [Endpoint("read", 1, paths, False)]
+            run_load(base_url, endpoints, options["concurrency"], options["warmup"])
+            results[name] = run_load(base_url, endpoints, options["concurrency"], options["duration"])["total"]
+            summary = results[name]
+            self.stdout.write(
+                f"{name:>8}: {summary['rps']:8.1f} req/s  p50 {summary['p50_ms'] or 0:7.1f} ms  "
+                f"p99 {summary['p99_ms'] or 0:7.1f} ms  errors {summary['errors']}"
+            )
+
+        if options["output"]:
+            with open(options["output"], "w") as output:
+                json.dump(results, output, indent=2)
+
+    def seed(self, count):
+        rng = random.Random(19)
+        categories = Category.objects.bulk_create([Category(name=f"{PREFIX} {i:03d}") for i in range(50)])
+        products = Product.objects.bulk_create([
+            Product(name=f"{PREFIX} product {i}", price=round(rng.uniform(1, 500), 2),
+                    stock=rng.randint(0, 100), category=rng.choice(categories))
+            for i in range(count)
+        ], batch_size=5000)
+        users = CustomUser.objects.bulk_create([
+            CustomUser(username=f"{PREFIX}-{i}", email=f"{PREFIX}-{i}@example.com") for i in range(100)
+        ])
+        Review.objects.bulk_create([
+            Review(user=user, product=product, rating=rng.randint(1, 5), comment="")
+            for user in users for product in rng.sample(products, 10)
+        ])
+        self.stdout.write(f"Seeded {count} products")
+
+    def paths(self):
+        ids = list(Product.objects.filter(name__startswith=PREFIX).values_list("pk", flat=True)[:200])
+        categories = list(Category.objects.filter(name__startswith=PREFIX).values_list("pk", flat=True))
+        paths = ["/api/products/", "/api/products/?ordering=price", "/api/products/?ordering=-price&count=false",
+                 "/api/reviews/"]
+        paths += [f"/api/products/?category={pk}" for pk in categories[:10]]
+        paths += [f"/api/products/{pk}/" for pk in ids]
+        return paths
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from ecommerce.db import no_statement_timeout
+from products.navigation import rebuild_category_stats
+
+
+class Command(BaseCommand):
+    help = "Recompute the product counts and price range of every category"
+
+    @no_statement_timeout()
+    def handle(self, *args, **options):
+        count = rebuild_category_stats()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt stats for {count} categories"))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from products.services import release_expired_reservations
+
+
+class Command(BaseCommand):
+    help = "Return the stock of expired reservations (run from cron)"
+
+    def handle(self, *args, **options):
+        released = release_expired_reservations()
+        self.stdout.write(self.style.SUCCESS(f"Released {released} reservations"))
@@ -0,0 +1,42 @@
+# Generated by Django 5.1.7 on 2026-10-17 04:09
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import TrigramExtension
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0003_keyset_indexes'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='product',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='product_search_gin'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['name'], name='product_name_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.RunSQL(
+            # Same weights as products.search.product_search_vector
+            """
+            UPDATE products_product AS p SET search_vector =
+                setweight(to_tsvector('english', COALESCE(p.name, '')), 'A')
+                || setweight(to_tsvector('english', COALESCE(
+                    (SELECT c.name FROM products_category AS c WHERE c.id = p.category_id), ''
+                )), 'B')
+                || setweight(to_tsvector('english', COALESCE(p.description, '')), 'C')
+            """,
+            migrations.RunSQL.noop,
+        ),
+    ]
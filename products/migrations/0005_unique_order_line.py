@@ -0,0 +1,33 @@
+# Generated by Django 5.1.7 on 2026-10-17 04:11
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def merge_duplicate_lines(apps, schema_editor):
+    OrderItem = apps.get_model('products', 'OrderItem')
+    duplicates = (
+        OrderItem.objects.values('order_id', 'product_id')
+        .annotate(lines=Count('id'), quantity=Sum('quantity'), price=Sum('price'))
+        .filter(lines__gt=1)
+    )
+    for row in duplicates:
+        lines = OrderItem.objects.filter(order_id=row['order_id'], product_id=row['product_id'])
+        keep = lines.first()
+        lines.exclude(pk=keep.pk).delete()
+        lines.update(quantity=row['quantity'], price=row['price'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0004_product_search_vector'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_lines, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='orderitem',
+            constraint=models.UniqueConstraint(fields=('order', 'product'), name='unique_order_product'),
+        ),
+    ]
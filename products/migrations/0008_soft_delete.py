@@ -0,0 +1,50 @@
+# Generated by Django 5.1.7 on 2026-10-17 04:29
+
+from django.contrib.postgres.operations import AddIndexConcurrently, RemoveIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Concurrent index builds can't run in a transaction. The partial indexes
+    # are built before the full ones they replace are dropped.
+    atomic = False
+
+    dependencies = [
+        ('products', '0007_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='is_active',
+            field=models.BooleanField(default=True),
+        ),
+        AddIndexConcurrently(
+            model_name='category',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['name', 'id'], name='category_active_name'),
+        ),
+        AddIndexConcurrently(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['created_at', 'id'], name='product_active_created'),
+        ),
+        AddIndexConcurrently(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['price', 'id'], name='product_active_price'),
+        ),
+        AddIndexConcurrently(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['name', 'id'], name='product_active_name'),
+        ),
+        RemoveIndexConcurrently(
+            model_name='product',
+            name='product_created_id_idx',
+        ),
+        RemoveIndexConcurrently(
+            model_name='product',
+            name='product_price_id_idx',
+        ),
+        RemoveIndexConcurrently(
+            model_name='product',
+            name='product_name_id_idx',
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.1.7 on 2026-10-17 04:35
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+BACKFILL_SQL = """
+    INSERT INTO products_categorystats
+        (category_id, active_count, in_stock_count, min_price, max_price, updated_at)
+    SELECT c.id,
+           count(p.id),
+           count(p.id) FILTER (WHERE p.stock > 0),
+           min(p.price),
+           max(p.price),
+           now()
+    FROM products_category AS c
+    LEFT JOIN products_product AS p ON p.category_id = c.id AND p.is_active
+    GROUP BY c.id
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0008_soft_delete'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryStats',
+            fields=[
+                ('category', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='products.category')),
+                ('active_count', models.PositiveIntegerField(default=0)),
+                ('in_stock_count', models.PositiveIntegerField(default=0)),
+                ('min_price', models.DecimalField(decimal_places=2, max_digits=10, null=True)),
+                ('max_price', models.DecimalField(decimal_places=2, max_digits=10, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunSQL(BACKFILL_SQL, migrations.RunSQL.noop),
+    ]
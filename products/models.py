@@ -1,25 +1,108 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
+from django.core.exceptions import ValidationError
 from django.db import models
-from django.db.models import Avg
+from django.db.models import (
+    Avg, Count, DecimalField, ExpressionWrapper, F, OuterRef, Prefetch, Q, Subquery, Sum, Window,
+)
+from django.db.models.functions import Coalesce
+from django.utils.text import slugify
 from shortuuid.django_fields import ShortUUIDField
 
 from login.models import CustomUser
 
 
+class SoftDeleteQuerySet(models.QuerySet):
+    def active(self):
+        return self.filter(is_active=True)
+
+
+class ActiveManager(models.Manager):
+    """Default manager of soft-deletable models: only rows with ``is_active``"""
+
+    def get_queryset(self):
+        return super().get_queryset().filter(is_active=True)
+
+
 class SoftDeleteModel(models.Model):
     is_active = models.BooleanField(default=True)
 
+    # Deactivated rows are hidden everywhere the default manager is used;
+    # all_objects is the escape hatch for admin, exports and restores.
+    # Forward foreign keys (order item -> product) still resolve either way.
+    # Django's own unique checks and admin choices go through the default
+    # manager too; see validate_unique and products.admin. So does dumpdata:
+    # run it with --all (the base manager), or the dump leaves deactivated
+    # rows out and won't load back.
+    objects = ActiveManager.from_queryset(SoftDeleteQuerySet)()
+    all_objects = SoftDeleteQuerySet.as_manager()
+
     class Meta:
         abstract = True
 
+    def validate_unique(self, exclude=None):
+        # Model forms (the admin) would otherwise pass a name a deactivated
+        # row holds and fail on the database's unique constraint
+        errors = {}
+        for field in self._meta.local_fields:
+            if not field.unique or field.primary_key or field.name in (exclude or ()):
+                continue
+            value = getattr(self, field.attname)
+            taken = type(self).all_objects.filter(**{field.attname: value}).exclude(pk=self.pk)
+            if value is not None and taken.exists():
+                errors[field.name] = [self.unique_error_message(type(self), (field.name,))]
+        if errors:
+            raise ValidationError(errors)
+        super().validate_unique(exclude)
+
 
-class Category(models.Model):
+class Category(SoftDeleteModel):
     id = ShortUUIDField(primary_key=True)  # Use short UUIDs
     name = models.CharField(max_length=255, unique=True)
     description = models.TextField(blank=True)
 
+    class Meta:
+        indexes = [
+            # Keyset pages of CategoryViewSet, live categories only
+            models.Index(fields=['name', 'id'], name='category_active_name', condition=Q(is_active=True)),
+        ]
+
     def __str__(self):
         return self.name
 
+class CategoryStats(models.Model):
+    """
+    Navigation read model: live and in-stock product counts and the price
+    range of a category. Kept current by products.navigation.
+    """
+    category = models.OneToOneField(Category, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    active_count = models.PositiveIntegerField(default=0)
+    in_stock_count = models.PositiveIntegerField(default=0)
+    min_price = models.DecimalField(max_digits=10, decimal_places=2, null=True)
+    max_price = models.DecimalField(max_digits=10, decimal_places=2, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.category_id}: {self.active_count} live"
+
+
+class ProductQuerySet(SoftDeleteQuerySet):
+    def with_ratings(self):
+        """
+        Annotate rating aggregates so serializing a page costs no extra queries.
+
+        Correlated subqueries rather than a join on reviews: a GROUP BY over
+        products would aggregate the whole catalog before ORDER BY/LIMIT,
+        while these run once per row of the page and keep the (field, id)
+        indexes usable for the keyset pages.
+        """
+        reviews = Review.objects.filter(product=OuterRef('pk')).order_by().values('product')
+        return self.annotate(
+            rating_avg=Subquery(reviews.annotate(value=Avg('rating')).values('value')),
+            rating_count=Coalesce(Subquery(reviews.annotate(value=Count('pk')).values('value')), 0),
+        )
+
+
 class Product(SoftDeleteModel):
     id = ShortUUIDField(primary_key=True)  # Use short UUIDs
     name = models.CharField(max_length=255)
@@ -30,24 +113,95 @@ class Product(SoftDeleteModel):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='products', null=True, blank =True)
+    # Maintained by products.signals, see products.search
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    objects = ActiveManager.from_queryset(ProductQuerySet)()
+    all_objects = ProductQuerySet.as_manager()
+
+    class Meta:
+        # Back the (field, id) keyset cursors used by ProductViewSet. Lists only
+        # ever show live products, so deactivated rows are left out of the index.
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='product_active_created', condition=Q(is_active=True)),
+            models.Index(fields=['price', 'id'], name='product_active_price', condition=Q(is_active=True)),
+            models.Index(fields=['name', 'id'], name='product_active_name', condition=Q(is_active=True)),
+            GinIndex(fields=['search_vector'], name='product_search_gin'),
+            GinIndex(fields=['name'], name='product_name_trgm', opclasses=['gin_trgm_ops']),
+            # Storefront queries: live products of one category, by price or newest first
+            models.Index(fields=['category', 'price', 'id'], name='product_active_cat_price',
+                         condition=Q(is_active=True)),
+            models.Index(fields=['category', 'created_at', 'id'], name='product_active_cat_created',
+                         condition=Q(is_active=True)),
+            models.Index(fields=['stock'], name='product_active_stock', condition=Q(is_active=True)),
+        ]
 
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Lets the category stats signal apply just what a save changed
+        instance._loaded_stats = instance.stats_state()
+        return instance
+
+    def stats_state(self):
+        """
+        ``(category_id, is_active, stock, price)`` as products.navigation
+        counts it, or None if one of them is deferred.
+        """
+        if any(name not in self.__dict__ for name in ('category_id', 'is_active', 'stock', 'price')):
+            return None
+        price = self._meta.get_field('price').to_python(self.price)
+        return self.category_id, self.is_active, self.stock, price
+
     def average_rating(self):
+        # Use the value from ProductQuerySet.with_ratings() when it is there
+        if hasattr(self, "rating_avg"):
+            return self.rating_avg or 0
         return self.reviews.aggregate(Avg("rating"))["rating__avg"] or 0
 
     def review_count(self):
+        if hasattr(self, "rating_count"):
+            return self.rating_count
         return self.reviews.count()
 
 
 
+def products_for_serialization():
+    # all_objects: an order keeps showing a product after it is deactivated
+    return Product.all_objects.select_related('category').with_ratings()
+
+
+class OrderQuerySet(models.QuerySet):
+    def with_items(self):
+        """Load everything OrderSerializer renders in a fixed number of queries"""
+        return self.select_related('customer').prefetch_related(
+            'items',
+            Prefetch('items__product', queryset=products_for_serialization()),
+        )
+
+
+class OrderItemQuerySet(models.QuerySet):
+    def with_product(self):
+        return self.prefetch_related(Prefetch('product', queryset=products_for_serialization()))
+
+
 class Order(models.Model):
     id = ShortUUIDField(primary_key=True)  # Use short UUIDs
     customer = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name="orders")
     created_at = models.DateTimeField(auto_now_add=True)
     total_price = models.DecimalField(max_digits=10, decimal_places=2, default=0)
 
+    objects = OrderQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # A customer's order history, newest first (OrderViewSet)
+            models.Index(fields=['customer', '-created_at', '-id'], name='order_customer_recent'),
+        ]
+
     def __str__(self):
         return f"Order {self.id} by {self.customer.username}"
 
@@ -58,18 +212,46 @@ class OrderItem(models.Model):
     quantity = models.PositiveIntegerField()
     price = models.DecimalField(max_digits=10, decimal_places=2)
 
+    objects = OrderItemQuerySet.as_manager()
+
+    class Meta:
+        # One line per product; see products.services.add_order_item
+        constraints = [
+            models.UniqueConstraint(fields=['order', 'product'], name='unique_order_product'),
+        ]
+
     def __str__(self):
         return f"{self.quantity} x {self.product.name}"
 
 
+class CartQuerySet(models.QuerySet):
+    def with_totals(self):
+        """
+        Annotate each line with ``line_total`` and, through window
+        functions, the ``subtotal`` and ``item_count`` of the lines selected,
+        so a whole cart summary is one query.
+        """
+        line_total = ExpressionWrapper(
+            F('quantity') * F('product__price'), output_field=DecimalField(max_digits=12, decimal_places=2)
+        )
+        return self.select_related('product').annotate(line_total=line_total).annotate(
+            subtotal=Window(Sum('line_total')),
+            item_count=Window(Sum('quantity')),
+        )
+
+
 class Cart(models.Model):
     id = ShortUUIDField(primary_key=True, max_length=22)
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name="cart")
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField(default=1)
 
+    objects = CartQuerySet.as_manager()
+
     @property
     def total_price(self):
+        if hasattr(self, "line_total"):
+            return self.line_total
         return self.quantity * self.product.price
 
     def __str__(self):
@@ -89,9 +271,66 @@ class Review(models.Model):
 
     class Meta:
         unique_together = ('user', 'product')  # One review per user per product
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='review_created_id_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} rated {self.product.name} ({self.rating}⭐)"
 
 
+class StockReservation(models.Model):
+    """Stock held for a user's checkout; expired holds go back into stock"""
+    ACTIVE = 'active'
+    CONFIRMED = 'confirmed'
+    RELEASED = 'released'
+    STATUS_CHOICES = [(ACTIVE, 'Active'), (CONFIRMED, 'Confirmed'), (RELEASED, 'Released')]
 
+    id = ShortUUIDField(primary_key=True)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="reservations")
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name="reservations")
+    quantity = models.PositiveIntegerField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=ACTIVE)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            # Only live holds are ever scanned for expiry
+            models.Index(fields=['expires_at'], name='reservation_active_expiry', condition=Q(status='active')),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product.name} for {self.user.username} ({self.status})"
+
+
+class RequestProfile(models.Model):
+    """A cProfile capture of one request, taken by products.profiling"""
+    REQUESTED = 'requested'
+    SAMPLED = 'sampled'
+    TRIGGER_CHOICES = [(REQUESTED, 'Requested'), (SAMPLED, 'Sampled')]
+
+    id = ShortUUIDField(primary_key=True)
+    route = models.CharField(max_length=255)
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=2048)
+    status_code = models.PositiveSmallIntegerField()
+    duration_ms = models.FloatField()
+    trigger = models.CharField(max_length=10, choices=TRIGGER_CHOICES)
+    user = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+    summary = models.TextField()  # Top functions by cumulative time
+    stats = models.BinaryField()  # Marshalled pstats, as cProfile's dump_stats writes them
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['route', '-created_at'], name='profile_route_recent'),
+        ]
+
+    @property
+    def filename(self):
+        return f"{slugify(self.route.replace('/', ' ')) or 'unmatched'}-{self.created_at:%Y%m%dT%H%M%S}.pstats"
+
+    def __str__(self):
+        return f"{self.method} {self.route} at {self.created_at:%Y-%m-%d %H:%M:%S}"
@@ -0,0 +1,137 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, F, Max, Min, Q, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest, Least
+from django.utils import timezone
+
+from .models import Category, CategoryStats, Product
+
+NAVIGATION_KEY = "categories:navigation"
+NAVIGATION_TIMEOUT = getattr(settings, "CATEGORY_NAVIGATION_TIMEOUT", 60 * 60)
+STATS_FIELDS = ['active_count', 'in_stock_count', 'min_price', 'max_price', 'updated_at']
+LIVE = Q(products__is_active=True)
+
+
+def _save_stats(categories):
+    """Aggregate the live products of ``categories`` and upsert their stats rows"""
+    rows = categories.annotate(
+        live=Count('products', filter=LIVE),
+        in_stock=Count('products', filter=LIVE & Q(products__stock__gt=0)),
+        low=Min('products__price', filter=LIVE),
+        high=Max('products__price', filter=LIVE),
+    ).values_list('pk', 'live', 'in_stock', 'low', 'high')
+    stats = [
+        CategoryStats(category_id=pk, active_count=live, in_stock_count=in_stock, min_price=low, max_price=high)
+        for pk, live, in_stock, low, high in rows
+    ]
+    CategoryStats.objects.bulk_create(
+        stats, update_conflicts=True, unique_fields=['category'], update_fields=STATS_FIELDS,
+    )
+    return len(stats)
+
+
+def _live(state):
+    """``(category_id, in_stock, price)`` of a product state, or None if it doesn't count"""
+    if state is None:
+        return None
+    category_id, is_active, stock, price = state
+    if not category_id or not is_active:
+        return None
+    return category_id, stock > 0, price
+
+
+def apply_product_changes(changes):
+    """
+    Update category stats for products that went from one state to another.
+
+    ``changes`` holds ``(before, after)`` pairs of ``(category_id,
+    is_active, stock, price)`` tuples, None for a product that didn't exist
+    before or doesn't any more. The counts move by ``F()`` deltas and a new
+    price widens the range, one UPDATE per category, whatever its size. Only
+    a product leaving the price range's boundary makes the min and max be
+    looked up again, through the ``(category, price, id)`` index. A
+    category without a stats row yet is recounted. ``rebuild_category_stats``
+    corrects any drift.
+    """
+    deltas = defaultdict(lambda: {'active': 0, 'in_stock': 0, 'added': [], 'left': set()})
+    for before, after in changes:
+        old, new = _live(before), _live(after)
+        if old == new:
+            continue
+        if old:
+            delta = deltas[old[0]]
+            delta['active'] -= 1
+            delta['in_stock'] -= old[1]
+            if not new or new[0] != old[0] or new[2] != old[2]:
+                delta['left'].add(old[2])
+        if new:
+            delta = deltas[new[0]]
+            delta['active'] += 1
+            delta['in_stock'] += new[1]
+            delta['added'].append(new[2])
+    if not deltas:
+        return
+
+    missing = set()
+    for category_id, delta in deltas.items():
+        stats = CategoryStats.objects.filter(category_id=category_id)
+        # Never below zero, should the row have drifted
+        update = {
+            'active_count': Greatest(F('active_count') + delta['active'], 0),
+            'in_stock_count': Greatest(F('in_stock_count') + delta['in_stock'], 0),
+            'updated_at': timezone.now(),
+        }
+        if delta['added']:
+            low, high = Value(min(delta['added'])), Value(max(delta['added']))
+            update['min_price'] = Least(Coalesce('min_price', low), low)
+            update['max_price'] = Greatest(Coalesce('max_price', high), high)
+        if not stats.update(**update):
+            missing.add(category_id)
+        elif delta['left']:
+            prices = Product.objects.filter(category_id=category_id).values('price')
+            stats.filter(Q(min_price__in=delta['left']) | Q(max_price__in=delta['left'])).update(
+                min_price=Subquery(prices.order_by('price')[:1]),
+                max_price=Subquery(prices.order_by('-price')[:1]),
+            )
+    if missing:
+        _save_stats(Category.all_objects.filter(pk__in=missing))
+    cache.delete(NAVIGATION_KEY)
+
+
+def refresh_category_stats(category_ids):
+    """
+    Recount the stats of ``category_ids`` with one aggregate query and one
+    upsert, and drop the cached navigation menu. This costs a pass over
+    each category's products, so it is for writes whose previous state is
+    unknown; the others go through ``apply_product_changes``.
+    """
+    category_ids = {pk for pk in category_ids if pk}
+    if category_ids:
+        _save_stats(Category.all_objects.filter(pk__in=category_ids))
+        cache.delete(NAVIGATION_KEY)
+
+
+def rebuild_category_stats():
+    """Recompute every category's stats; returns the number of categories"""
+    count = _save_stats(Category.all_objects.all())
+    cache.delete(NAVIGATION_KEY)
+    return count
+
+
+def navigation():
+    """Live categories with their stats, for the storefront menu. One cached query."""
+    menu = cache.get(NAVIGATION_KEY)
+    if menu is None:
+        menu = list(
+            Category.objects.order_by('name').values(
+                'id', 'name',
+                active_count=Coalesce('stats__active_count', Value(0)),
+                in_stock_count=Coalesce('stats__in_stock_count', Value(0)),
+                min_price=F('stats__min_price'),
+                max_price=F('stats__max_price'),
+            )
+        )
+        cache.set(NAVIGATION_KEY, menu, NAVIGATION_TIMEOUT)
+    return menu
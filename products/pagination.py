@@ -0,0 +1,188 @@
+import base64
+import datetime
+import json
+from collections import OrderedDict
+
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    # DjangoJSONEncoder drops microseconds, which would skip rows on seek
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset (seek) pagination over a ``(field, pk)`` ordering.
+
+    Pages are fetched with ``WHERE (field, pk) > (last_field, last_pk)``
+    instead of ``OFFSET``, so deep pages cost the same as the first one when
+    a matching ``(field, id)`` index exists. The field comes from
+    ``?ordering=`` restricted to ``view.ordering_fields``, then the
+    ``search_rank`` annotation of a search, then ``view.ordering``. Pass
+    ``?count=false`` to skip the ``COUNT(*)``.
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    ordering_param = api_settings.ORDERING_PARAM
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        page = self.seek(queryset, request, view)
+        # count() leaves out annotations the filters don't use, so keep
+        # per-row values such as the ratings to subqueries, not GROUP BY
+        self.count = queryset.count() if self.wants_count(request) else None
+        return self.set_page(list(page))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """``paginate_queryset`` for async views, on the async ORM"""
+        page = self.seek(queryset, request, view)
+        self.count = await queryset.acount() if self.wants_count(request) else None
+        return self.set_page([row async for row in page])
+
+    def seek(self, queryset, request, view):
+        """Return the (unevaluated) queryset of the requested page plus one row"""
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.field, self.descending = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request, queryset)
+
+        self.reverse = bool(self.cursor and self.cursor['r'])
+        if self.cursor is not None:
+            # Rows after the cursor in the direction we are walking
+            lookup = 'lt' if self.descending != self.reverse else 'gt'
+            position = Q(**{f'pk__{lookup}': self.cursor['pk']})
+            if self.field != 'pk':
+                position = Q(**{f'{self.field}__{lookup}': self.cursor['v']}) | (
+                    Q(**{self.field: self.cursor['v']}) & position
+                )
+            queryset = queryset.filter(position)
+
+        descending = self.descending != self.reverse
+        keys = ['pk'] if self.field == 'pk' else [self.field, 'pk']
+        queryset = queryset.order_by(*[('-' if descending else '') + key for key in keys])
+        return queryset[:self.page_size + 1]
+
+    def set_page(self, rows):
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if self.reverse:
+            rows.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, self.cursor is not None
+        self.page = rows
+        return rows
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def get_ordering(self, request, queryset, view):
+        allowed = getattr(view, 'ordering_fields', None) or []
+        requested = request.query_params.get(self.ordering_param, '').split(',')[0].strip()
+        if requested and requested.lstrip('-') in allowed:
+            term = requested
+        elif 'search_rank' in queryset.query.annotations:
+            # Ranked search results, best match first
+            term = '-search_rank'
+        else:
+            default = getattr(view, 'ordering', None) or ['-pk']
+            term = default if isinstance(default, str) else default[0]
+        field = term.lstrip('-')
+        return ('pk' if field == 'id' else field), term.startswith('-')
+
+    def wants_count(self, request):
+        value = request.query_params.get(self.count_query_param, 'true')
+        return value.lower() not in ('0', 'false', 'no')
+
+    def decode_cursor(self, request, queryset):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')))
+            if cursor['f'] != self.field or cursor['d'] != self.descending:
+                raise ValueError
+            cursor['pk'] = self.to_python(queryset, 'pk', cursor['pk'])
+            if self.field != 'pk':
+                cursor['v'] = self.to_python(queryset, self.field, cursor['v'])
+            cursor['r']
+        except (TypeError, ValueError, KeyError, UnicodeError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        return cursor
+
+    def to_python(self, queryset, name, value):
+        """Check a cursor value against the field it seeks on, before it reaches filter()"""
+        if value is None or isinstance(value, (list, dict)):
+            raise ValueError
+        if name in queryset.query.annotations:
+            field = queryset.query.annotations[name].output_field
+        else:
+            field = queryset.model._meta.pk if name == 'pk' else queryset.model._meta.get_field(name)
+        return field.to_python(value)
+
+    def encode_cursor(self, obj, reverse):
+        cursor = {
+            'f': self.field,
+            'd': self.descending,
+            'v': None if self.field == 'pk' else getattr(obj, self.field),
+            'pk': obj.pk,
+            'r': reverse,
+        }
+        encoded = base64.urlsafe_b64encode(json.dumps(cursor, cls=CursorEncoder).encode('ascii'))
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, encoded.decode('ascii'))
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.request.build_absolute_uri(), self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_data(self, data):
+        body = OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+        ])
+        if self.count is not None:
+            body['count'] = self.count
+        body['results'] = data
+        return body
+
+    def get_paginated_response(self, data):
+        return Response(self.get_paginated_data(data))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'count': {'type': 'integer'},
+                'results': schema,
+            },
+        }
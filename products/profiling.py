@@ -0,0 +1,197 @@
+"""
+On-demand cProfile captures of live API requests.
+
+``ProfilingMiddleware`` profiles a request when a staff user (session or
+JWT) sends ``X-Profile: 1``, or when it is picked at random with
+probability PROFILING_SAMPLE_RATE (0, i.e. never, by default). Each
+capture is stored as a ``RequestProfile``: the marshalled pstats and a
+text summary, indexed by route and time. They are browsable in the admin,
+and each one downloads as a .pstats file for snakeviz, flameprof (flame
+graphs) or ``python -m pstats``. The response carries ``X-Profile-Id``.
+
+Both triggers draw on one fleet-wide budget of PROFILING_MAX_PER_MINUTE
+captures, counted in the shared cache, and a process profiles a single
+request at a time. Turning sampling on therefore slows a handful of
+requests a minute at most.
+
+cProfile only traces the thread that enables it. Under WSGI that thread
+runs the whole request. Under ASGI a sync view runs in a worker thread, so
+the middleware profiles just the view, in that thread, from
+``process_view``. The profile of an async view also includes whatever
+else ran on the event loop meanwhile.
+"""
+import cProfile
+import io
+import marshal
+import pstats
+import random
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from .models import RequestProfile
+
+PROFILING_HEADER = getattr(settings, "PROFILING_HEADER", "HTTP_X_PROFILE")
+PROFILING_PATH_PREFIXES = tuple(getattr(settings, "PROFILING_PATH_PREFIXES", ("/api/",)))
+SUMMARY_LINES = getattr(settings, "PROFILING_SUMMARY_LINES", 40)
+
+# One capture at a time per process keeps the slowdown to a single request.
+# Under ASGI the lock is taken on the event loop and may be released there
+# after the view ran in another thread, so it is a plain Lock
+_profiling = threading.Lock()
+
+
+def budget_key(now=None):
+    return f"profiling:budget:{int((now or time.time()) // 60)}"
+
+
+def take_budget():
+    """Count one capture against this minute's fleet-wide budget; False once it's spent"""
+    key = budget_key()
+    cache.add(key, 0, timeout=120)
+    try:
+        return cache.incr(key) <= getattr(settings, "PROFILING_MAX_PER_MINUTE", 6)
+    except ValueError:
+        return False
+
+
+def requesting_staff(request):
+    """The staff user asking for a profile with the header, or None"""
+    if request.META.get(PROFILING_HEADER) != "1":
+        return None
+    user = getattr(request, "user", None)
+    if user is None or not user.is_authenticated:
+        # API clients authenticate per view with a bearer token
+        try:
+            authenticated = JWTAuthentication().authenticate(request)
+        except AuthenticationFailed:
+            return None
+        user = authenticated[0] if authenticated else None
+    return user if user is not None and user.is_staff else None
+
+
+def choose(request):
+    """``(trigger, user)`` if this request should be profiled, else None"""
+    if not request.path.startswith(PROFILING_PATH_PREFIXES):
+        return None
+    user = requesting_staff(request)
+    if user is not None:
+        return RequestProfile.REQUESTED, user
+    rate = getattr(settings, "PROFILING_SAMPLE_RATE", 0)
+    if rate and random.random() < rate:
+        return RequestProfile.SAMPLED, None
+    return None
+
+
+def save_profile(profiler, request, response, duration, trigger, user):
+    summary = io.StringIO()
+    stats = pstats.Stats(profiler, stream=summary)
+    stats.sort_stats("cumulative").print_stats(SUMMARY_LINES)
+    match = request.resolver_match
+    return RequestProfile.objects.create(
+        route=match.route if match else "<unmatched>",
+        method=request.method,
+        path=request.get_full_path()[:2048],
+        status_code=response.status_code,
+        duration_ms=duration * 1000,
+        trigger=trigger,
+        user=user,
+        summary=summary.getvalue(),
+        stats=marshal.dumps(stats.stats),
+    )
+
+
+class ProfilingMiddleware:
+    """Goes after AuthenticationMiddleware, so session staff can ask for profiles"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+            # Only under ASGI, so WSGI requests don't pay for the hook
+            self.process_view = self.aprocess_view
+
+    def reserve(self, chosen):
+        """Claim the process's profiler and a slot in the budget for ``chosen``"""
+        if chosen is None or not _profiling.acquire(blocking=False):
+            return None
+        if not take_budget():
+            _profiling.release()
+            return None
+        return chosen
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        chosen = self.reserve(choose(request))
+        if chosen is None:
+            return self.get_response(request)
+        profiler = cProfile.Profile()
+        try:
+            started = time.perf_counter()
+            profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.disable()
+            duration = time.perf_counter() - started
+        finally:
+            _profiling.release()
+        profile = save_profile(profiler, request, response, duration, *chosen)
+        response["X-Profile-Id"] = profile.pk
+        return response
+
+    async def __acall__(self, request):
+        if request.META.get(PROFILING_HEADER) == "1":
+            # Checking the user may load it from the database
+            chosen = await sync_to_async(choose)(request)
+        else:
+            chosen = choose(request)
+        if chosen is not None:
+            chosen = await sync_to_async(self.reserve)(chosen)
+        if chosen is None:
+            return await self.get_response(request)
+        # Enabled by aprocess_view in whichever thread runs the view
+        profiler = request._profiler = cProfile.Profile()
+        try:
+            started = time.perf_counter()
+            response = await self.get_response(request)
+            duration = time.perf_counter() - started
+        finally:
+            _profiling.release()
+        profile = await sync_to_async(save_profile)(profiler, request, response, duration, *chosen)
+        response["X-Profile-Id"] = profile.pk
+        return response
+
+    async def aprocess_view(self, request, view_func, view_args, view_kwargs):
+        """
+        Run the view of a profiled request under the profiler. The response
+        returned here stands in for the view's, so Django doesn't call it
+        again.
+        """
+        profiler = getattr(request, "_profiler", None)
+        if profiler is None:
+            return None
+        if iscoroutinefunction(view_func):
+            profiler.enable()
+            try:
+                return await view_func(request, *view_args, **view_kwargs)
+            finally:
+                profiler.disable()
+
+        def profiled():
+            profiler.enable()
+            try:
+                return view_func(request, *view_args, **view_kwargs)
+            finally:
+                profiler.disable()
+
+        return await sync_to_async(profiled)()
@@ -0,0 +1,83 @@
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, TrigramSimilarity
+from django.db.models import F, FloatField, Q, Value
+from django.db.models.functions import Cast
+from rest_framework import filters
+
+SEARCH_CONFIG = 'english'
+AUTOCOMPLETE_LIMIT = 10
+
+
+def product_search_vector(category_name):
+    """Weighted vector: name (A) > category name (B) > description (C)"""
+    return (
+        SearchVector('name', weight='A', config=SEARCH_CONFIG)
+        + SearchVector(Value(category_name or ''), weight='B', config=SEARCH_CONFIG)
+        + SearchVector('description', weight='C', config=SEARCH_CONFIG)
+    )
+
+
+def search_vector_sql(name, category_name, description):
+    """
+    Raw SQL equivalent of ``product_search_vector`` for set-based loads.
+    Arguments are SQL expressions, e.g. column references.
+    """
+    return ' || '.join(
+        f"setweight(to_tsvector('{SEARCH_CONFIG}', COALESCE({column}, '')), '{weight}')"
+        for column, weight in ((name, 'A'), (category_name, 'B'), (description, 'C'))
+    )
+
+
+def update_search_vectors(queryset, category_name):
+    """Refresh the stored vector for products that share ``category_name``"""
+    return queryset.update(search_vector=product_search_vector(category_name))
+
+
+def prefix_query(text):
+    """Match every word, treating the last one as a prefix (``wire:*``)"""
+    words = [re.sub(r'\W+', '', word) for word in text.split()]
+    words = [word for word in words if word]
+    if not words:
+        return None
+    words[-1] += ':*'
+    return SearchQuery(' & '.join(words), search_type='raw', config=SEARCH_CONFIG)
+
+
+def search_products(queryset, text):
+    """
+    Full-text search over the stored vector, with trigram similarity on the
+    name so small typos still match. Rows are annotated with ``search_rank``.
+    """
+    query = SearchQuery(text, search_type='websearch', config=SEARCH_CONFIG)
+    prefix = prefix_query(text)
+    if prefix is not None:
+        query = query | prefix
+    # ts_rank() is a float4; cast so keyset cursors round-trip the value exactly
+    rank = Cast(SearchRank(F('search_vector'), query) + TrigramSimilarity('name', text), FloatField())
+    return queryset.annotate(search_rank=rank).filter(
+        Q(search_vector=query) | Q(name__trigram_similar=text)
+    )
+
+
+def autocomplete(queryset, text, limit=AUTOCOMPLETE_LIMIT):
+    query = prefix_query(text)
+    if query is None:
+        return queryset.none()
+    return queryset.filter(search_vector=query).annotate(
+        search_rank=SearchRank(F('search_vector'), query),
+    ).order_by('-search_rank', 'name')[:limit]
+
+
+class ProductSearchFilter(filters.SearchFilter):
+    """
+    Drop-in replacement for ``SearchFilter`` that keeps the ``?search=``
+    parameter but runs a ranked, GIN-indexed full-text query instead of
+    ``ILIKE`` across a join.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        if not terms:
+            return queryset
+        return search_products(queryset, ' '.join(terms))
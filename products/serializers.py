@@ -1,15 +1,25 @@
 from rest_framework import serializers
+from rest_framework.validators import UniqueValidator
 
-from .models import Category, Product, Order, OrderItem, Cart, Review
+from ecommerce.instrumentation import TimedSerializerMixin
+from .models import Category, Product, Order, OrderItem, Cart, Review, StockReservation
 
 
-class CategorySerializer(serializers.ModelSerializer):
+class ModelSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    """Counts its output time in the request's Server-Timing ``serializer`` entry"""
+
+
+class CategorySerializer(ModelSerializer):
+    # The generated validator queries the default manager, which hides
+    # deactivated categories; their names are still taken in the table
+    name = serializers.CharField(max_length=255, validators=[UniqueValidator(queryset=Category.all_objects.all())])
+
     class Meta:
         model = Category
         fields = '__all__'
 
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(ModelSerializer):
     category_id = serializers.CharField(write_only=True)
     category = serializers.StringRelatedField(read_only=True)
     average_rating = serializers.FloatField(read_only=True)
@@ -31,7 +41,17 @@ class ProductSerializer(serializers.ModelSerializer):
         return Product.objects.create(category=category, **validated_data)
 
 
-class ReviewSerializer(serializers.ModelSerializer):
+class ProductBulkSerializer(ModelSerializer):
+    """Validates one row of a bulk upsert without touching the database"""
+    id = serializers.CharField(max_length=22, required=False)
+    category_id = serializers.CharField(required=False, allow_null=True, allow_blank=True)
+
+    class Meta:
+        model = Product
+        fields = ['id', 'name', 'description', 'price', 'stock', 'category_id', 'is_active']
+
+
+class ReviewSerializer(ModelSerializer):
     user = serializers.StringRelatedField(read_only=True)
     product_id = serializers.PrimaryKeyRelatedField(
         queryset=Product.objects.all(), write_only=True, source='product'
@@ -61,7 +81,7 @@ class ReviewSerializer(serializers.ModelSerializer):
         return review
 
 
-class OrderItemSerializer(serializers.ModelSerializer):
+class OrderItemSerializer(ModelSerializer):
     product = ProductSerializer(read_only=True)
     product_id = serializers.PrimaryKeyRelatedField(
         queryset=Product.objects.all(), source='product', write_only=True
@@ -79,7 +99,7 @@ class OrderItemSerializer(serializers.ModelSerializer):
         return super().create(validated_data)
 
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(ModelSerializer):
     customer = serializers.StringRelatedField(read_only=True)  # Shows customer username
     items = OrderItemSerializer(many=True, read_only=True)  # Displays order items
     total_price = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
@@ -90,7 +110,7 @@ class OrderSerializer(serializers.ModelSerializer):
 
 
 
-class CartSerializer(serializers.ModelSerializer):
+class CartSerializer(ModelSerializer):
     product_id = serializers.CharField(write_only=True)
     product = serializers.StringRelatedField(read_only=True)
     quantity = serializers.IntegerField()
@@ -115,6 +135,10 @@ class CartSerializer(serializers.ModelSerializer):
         except Product.DoesNotExist:
             raise serializers.ValidationError({"product_id": "Invalid product ID."})
 
+        in_cart = Cart.objects.filter(user=user, product=product).values_list('quantity', flat=True).first() or 0
+        if in_cart + quantity > product.stock:
+            raise serializers.ValidationError({"quantity": "Not enough stock."})
+
         cart_item, created = Cart.objects.get_or_create(
             user=user,
             product=product,
@@ -127,3 +151,22 @@ class CartSerializer(serializers.ModelSerializer):
             cart_item.save()
 
         return cart_item
+
+
+class CartSummaryLineSerializer(ModelSerializer):
+    product_id = serializers.CharField(read_only=True)
+    product = serializers.StringRelatedField(read_only=True)
+    unit_price = serializers.DecimalField(source='product.price', max_digits=10, decimal_places=2, read_only=True)
+    line_total = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
+
+    class Meta:
+        model = Cart
+        fields = ['id', 'product_id', 'product', 'quantity', 'unit_price', 'line_total']
+
+
+class StockReservationSerializer(ModelSerializer):
+    product_id = serializers.CharField(read_only=True)
+
+    class Meta:
+        model = StockReservation
+        fields = ['id', 'product_id', 'quantity', 'status', 'expires_at']
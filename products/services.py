@@ -0,0 +1,349 @@
+import logging
+from collections import defaultdict
+from datetime import timedelta
+from itertools import islice
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, IntegrityError, transaction
+from django.db.models import Case, F, PositiveIntegerField, Value, When
+from django.utils import timezone
+
+from .cache import bump_generation, bump_object_versions
+from .models import Category, Order, OrderItem, Product, StockReservation
+from .navigation import NAVIGATION_KEY, apply_product_changes
+from .search import update_search_vectors
+from .serializers import ProductBulkSerializer
+
+logger = logging.getLogger(__name__)
+
+# detail_cache_label of the viewset serving each soft-deletable model
+DETAIL_LABELS = {Product: 'product', Category: 'category'}
+RESERVATION_TTL = getattr(settings, "STOCK_RESERVATION_TTL", 60 * 15)
+BULK_CHUNK_SIZE = getattr(settings, "PRODUCT_BULK_CHUNK_SIZE", 1000)
+BULK_UPDATE_FIELDS = ['name', 'description', 'price', 'stock', 'category', 'is_active', 'updated_at']
+# What products.navigation counts of a product, in Product.stats_state() order
+STATS_FIELDS = ['category_id', 'is_active', 'stock', 'price']
+
+
+class InsufficientStock(Exception):
+    def __init__(self, product):
+        self.product = product
+        super().__init__(f"Not enough stock for {product.name}")
+
+
+class EmptyCart(Exception):
+    pass
+
+
+def _per_product(quantities):
+    """CASE expression mapping product pk to its quantity in ``quantities``"""
+    return Case(
+        *[When(pk=product_id, then=Value(quantity)) for product_id, quantity in quantities.items()],
+        output_field=PositiveIntegerField(),
+    )
+
+
+def _stock_changed(products, sold_out):
+    """Category stats for the live ``products`` that just sold out, or came back in stock"""
+    before, after = (1, 0) if sold_out else (0, 1)
+    apply_product_changes([
+        ((category_id, True, before, price), (category_id, True, after, price))
+        for category_id, price in products.filter(is_active=True).values_list('category_id', 'price')
+    ])
+
+
+def take_stock(product, quantity):
+    """
+    Decrement stock only if enough is left, as one conditional UPDATE.
+
+    No row is read or locked up front; the ``stock >= quantity`` guard is
+    evaluated by the database against the current row, so it can't oversell.
+    Cached product lists are not invalidated here, so the stock they show may
+    lag; this check is what counts. The product's detail entry is refreshed.
+    """
+    if not Product.objects.filter(pk=product.pk, stock__gte=quantity).update(stock=F('stock') - quantity):
+        raise InsufficientStock(product)
+    bump_object_versions('product', [product.pk])
+    _stock_changed(Product.all_objects.filter(pk=product.pk, stock=0), sold_out=True)
+
+
+def take_stock_bulk(quantities, products):
+    """
+    ``take_stock`` for many products in one UPDATE. ``quantities`` maps
+    product pk to quantity; ``products`` maps pk to the instance, for errors.
+    Nothing is taken unless every product has enough.
+    """
+    if not quantities:
+        return
+    amount = _per_product(quantities)
+    with transaction.atomic():
+        taken = Product.objects.filter(pk__in=quantities, stock__gte=amount).update(stock=F('stock') - amount)
+        if taken != len(quantities):
+            transaction.set_rollback(True)
+    if taken != len(quantities):
+        # Same rows as the UPDATE: a deactivated product has nothing to take
+        stock = dict(Product.objects.filter(pk__in=quantities).values_list('pk', 'stock'))
+        short = next((pk for pk, quantity in quantities.items() if stock.get(pk, -1) < quantity), None)
+        # None only if stock came back in between; any product will do then
+        raise InsufficientStock(products[short or next(iter(quantities))])
+    bump_object_versions('product', quantities)
+    _stock_changed(Product.all_objects.filter(pk__in=quantities, stock=0), sold_out=True)
+
+
+def restock(quantities):
+    """Give stock back, one UPDATE for all products in ``quantities``"""
+    if quantities:
+        # Stock held for a product that was deactivated meanwhile still goes back
+        Product.all_objects.filter(pk__in=quantities).update(stock=F('stock') + _per_product(quantities))
+        bump_object_versions('product', quantities)
+        # Stock equal to what was given back means the product was sold out
+        _stock_changed(Product.all_objects.filter(pk__in=quantities, stock=_per_product(quantities)), sold_out=False)
+
+
+@transaction.atomic
+def add_order_item(order, product, quantity):
+    """
+    Add ``quantity`` of ``product`` to ``order`` and grow the order total.
+
+    Both writes are single ``UPDATE ... SET x = x + n`` statements, so
+    concurrent adds to the same order never lose an update. The
+    ``(order, product)`` unique constraint settles the race between two
+    workers inserting the same line. Raises ``InsufficientStock`` without
+    touching the order if the product can't cover ``quantity``.
+    """
+    take_stock(product, quantity)
+    line_total = product.price * quantity
+    lines = OrderItem.objects.filter(order=order, product=product)
+    increment = {'quantity': F('quantity') + quantity, 'price': F('price') + line_total}
+
+    if not lines.update(**increment):
+        try:
+            # Savepoint, so losing the insert race doesn't abort the transaction
+            with transaction.atomic():
+                OrderItem.objects.create(order=order, product=product, quantity=quantity, price=line_total)
+        except IntegrityError:
+            lines.update(**increment)
+
+    Order.objects.filter(pk=order.pk).update(total_price=F('total_price') + line_total)
+    return lines.get()
+
+
+@transaction.atomic
+def reserve_stock(user, product, quantity, ttl=RESERVATION_TTL):
+    take_stock(product, quantity)
+    return StockReservation.objects.create(
+        user=user, product=product, quantity=quantity,
+        expires_at=timezone.now() + timedelta(seconds=ttl),
+    )
+
+
+@transaction.atomic
+def reserve_cart(user, ttl=RESERVATION_TTL):
+    """
+    Hold stock for every line in the user's cart, all or nothing. Any holds
+    the user already has are released first.
+    """
+    release_reservations(StockReservation.objects.filter(user=user))
+    # Fixed product order so two overlapping carts can't deadlock
+    lines = user.cart.select_related('product').order_by('product_id')
+    return [reserve_stock(user, line.product, line.quantity, ttl) for line in lines]
+
+
+@transaction.atomic
+def release_reservations(reservations):
+    """
+    Put the stock of the active reservations in ``reservations`` back, with
+    one UPDATE for all products. Rows another worker is already releasing
+    are skipped. Returns the number of reservations released.
+    """
+    held = list(
+        reservations.filter(status=StockReservation.ACTIVE)
+        .select_for_update(skip_locked=True)
+        .values_list('pk', 'product_id', 'quantity')
+    )
+    if not held:
+        return 0
+
+    totals = defaultdict(int)
+    for _, product_id, quantity in held:
+        totals[product_id] += quantity
+    restock(totals)
+    StockReservation.objects.filter(pk__in=[pk for pk, _, _ in held]).update(status=StockReservation.RELEASED)
+    return len(held)
+
+
+def release_expired_reservations(now=None):
+    expired = StockReservation.objects.filter(expires_at__lte=now or timezone.now())
+    return release_reservations(expired)
+
+
+@transaction.atomic
+def checkout_cart(user):
+    """
+    Turn the user's cart into an order in a fixed number of queries.
+
+    Stock already held by the user's reservations is used first; only the
+    difference is taken (or given back). Items are written with one
+    ``bulk_create`` and the cart is cleared with one DELETE.
+    """
+    lines = list(user.cart.select_related('product').order_by('product_id'))
+    if not lines:
+        raise EmptyCart()
+
+    reservations = StockReservation.objects.filter(user=user, status=StockReservation.ACTIVE)
+    held = defaultdict(int)
+    for product_id, quantity in reservations.select_for_update().values_list('product_id', 'quantity'):
+        held[product_id] += quantity
+
+    products = {line.product_id: line.product for line in lines}
+    needed = {line.product_id: line.quantity - held.get(line.product_id, 0) for line in lines}
+    take_stock_bulk({pk: quantity for pk, quantity in needed.items() if quantity > 0}, products)
+    restock({pk: -quantity for pk, quantity in needed.items() if quantity < 0})
+    reservations.filter(product_id__in=products).update(status=StockReservation.CONFIRMED)
+    release_reservations(reservations.exclude(product_id__in=products))
+
+    items = [
+        OrderItem(product=line.product, quantity=line.quantity, price=line.product.price * line.quantity)
+        for line in lines
+    ]
+    order = Order.objects.create(customer=user, total_price=sum(item.price for item in items))
+    for item in items:
+        item.order = order
+    OrderItem.objects.bulk_create(items)
+    user.cart.all().delete()
+    return order
+
+
+def _write_products(rows, categories):
+    """
+    Upsert ``rows``, ``(supplied fields, product)`` pairs, with one
+    ``INSERT ... ON CONFLICT`` per set of supplied fields, all or nothing.
+    """
+    groups = defaultdict(list)
+    for supplied, product in rows:
+        groups[supplied].append(product)
+    with transaction.atomic():
+        for supplied, group in groups.items():
+            fields = [field for field in BULK_UPDATE_FIELDS if field in supplied or field == 'updated_at']
+            Product.objects.bulk_create(group, update_conflicts=True, unique_fields=['id'], update_fields=fields)
+        # bulk_create skips post_save, so refresh search vectors per category
+        by_category = defaultdict(list)
+        for _, product in rows:
+            by_category[product.category_id].append(product.pk)
+        for category_id, pks in by_category.items():
+            update_search_vectors(Product.all_objects.filter(pk__in=pks), categories.get(category_id, ''))
+
+
+def bulk_upsert_products(rows, chunk_size=BULK_CHUNK_SIZE):
+    """
+    Create or update products from an iterable of dicts, keyed on ``id``.
+
+    Rows are validated and written ``chunk_size`` at a time: one query
+    resolves the chunk's category ids and one ``INSERT ... ON CONFLICT``
+    per set of supplied fields writes it. An existing product only gets the
+    fields its row has; the rest (stock, category, is_active...) are kept.
+    Bad rows are reported and skipped rather than failing the batch, and so
+    is a row repeating an id earlier in its chunk. If the database rejects
+    a chunk, its rows are retried one by one to find the ones at fault.
+    Returns ``(saved, errors)``; errors are ``{"row", "errors"}``.
+    """
+    saved, errors = 0, []
+    rows = enumerate(rows)
+    while chunk := list(islice(rows, chunk_size)):
+        valid, seen = [], {}
+        for index, row in chunk:
+            serializer = ProductBulkSerializer(data=row) if isinstance(row, dict) else None
+            if serializer is None:
+                errors.append({'row': index, 'errors': {'non_field_errors': ['Expected a JSON object.']}})
+            elif not serializer.is_valid():
+                errors.append({'row': index, 'errors': serializer.errors})
+            elif serializer.validated_data.get('id') in seen:
+                # One INSERT ... ON CONFLICT can't write the same row twice
+                first = seen[serializer.validated_data['id']]
+                errors.append({'row': index, 'errors': {'id': [f'Repeats the id of row {first}.']}})
+            else:
+                if serializer.validated_data.get('id'):
+                    seen[serializer.validated_data['id']] = index
+                valid.append((index, serializer.validated_data))
+
+        # An update only writes the fields its row supplies, so existing
+        # products keep their own category (and search vector) otherwise
+        current = {pk: state for pk, *state in Product.all_objects.filter(pk__in=seen).values_list('pk', *STATS_FIELDS)}
+        category_ids = {data['category_id'] for _, data in valid if data.get('category_id')}
+        category_ids |= {state[0] for state in current.values() if state[0]}
+        categories = dict(Category.objects.filter(id__in=category_ids).values_list('id', 'name'))
+
+        pending = []
+        for index, data in valid:
+            supplied = frozenset('category' if field == 'category_id' else field for field in data)
+            if 'category_id' in data:
+                category_id = data.pop('category_id') or None
+                if category_id is not None and category_id not in categories:
+                    errors.append({'row': index, 'errors': {'category_id': ['Invalid category ID.']}})
+                    continue
+            else:
+                category_id = current[data['id']][0] if data.get('id') in current else None
+            product = Product(category_id=category_id, **data)
+            # category_id is already resolved above
+            before = current.get(product.pk)
+            after = tuple(
+                before[position] if before and field not in supplied | {'category_id'} else getattr(product, field)
+                for position, field in enumerate(STATS_FIELDS)
+            )
+            pending.append((index, supplied, product, (before, after)))
+
+        try:
+            _write_products([(supplied, product) for _, supplied, product, _ in pending], categories)
+            written = pending
+        except DatabaseError:
+            written = []
+            for row in pending:
+                index, supplied, product, _ = row
+                try:
+                    _write_products([(supplied, product)], categories)
+                except DatabaseError:
+                    # The database's message may quote SQL and other rows' values
+                    logger.exception("Bulk upsert of row %d failed", index)
+                    errors.append({'row': index, 'errors': {'non_field_errors': ['Could not save this row.']}})
+                else:
+                    written.append(row)
+        saved += len(written)
+        bump_object_versions('product', [product.pk for _, _, product, _ in written])
+        apply_product_changes([change for _, _, _, change in written])
+
+    if saved:
+        # One invalidation for the whole batch
+        bump_generation()
+    errors.sort(key=lambda error: error['row'])
+    return saved, errors
+
+
+def set_active(queryset, active):
+    """
+    Soft-delete (``active=False``) or restore the rows of ``queryset`` with
+    one UPDATE. Rows already in that state are left alone. ``update()``
+    sends no signals, so the cached lists and the affected detail entries
+    are invalidated here. Returns the pks that changed.
+    """
+    model = queryset.model
+    with transaction.atomic():
+        pks = list(queryset.exclude(is_active=active).select_for_update().values_list('pk', flat=True))
+        if pks:
+            changes = {'is_active': active}
+            if hasattr(model, 'updated_at'):
+                changes['updated_at'] = timezone.now()
+            model.all_objects.filter(pk__in=pks).update(**changes)
+    if pks:
+        bump_object_versions(DETAIL_LABELS[model], pks)
+        bump_generation()
+        if model is Product:
+            apply_product_changes([
+                ((category_id, not active, stock, price), (category_id, active, stock, price))
+                for category_id, stock, price in Product.all_objects.filter(pk__in=pks)
+                .values_list('category_id', 'stock', 'price')
+            ])
+        else:
+            # Stats count products whatever their category's state; the menu lists live ones
+            cache.delete(NAVIGATION_KEY)
+    return pks
@@ -0,0 +1,83 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from django.core.cache import cache
+
+from .cache import bump_generation, bump_object_versions, invalidate_cart_count
+from .models import Cart, Category, Product, Review
+from .navigation import NAVIGATION_KEY, apply_product_changes, refresh_category_stats
+from .search import update_search_vectors
+
+
+@receiver([post_save, post_delete], sender=Product)
+@receiver([post_save, post_delete], sender=Category)
+@receiver([post_save, post_delete], sender=Review)
+def invalidate_product_cache(sender, **kwargs):
+    """Any catalog edit makes every cached product page stale"""
+    bump_generation()
+
+
+@receiver(post_save, sender=Product)
+def update_product_search_vector(sender, instance, **kwargs):
+    category_name = instance.category.name if instance.category_id else ''
+    update_search_vectors(Product.all_objects.filter(pk=instance.pk), category_name)
+
+
+@receiver(post_save, sender=Category)
+def update_category_search_vectors(sender, instance, created, **kwargs):
+    if not created:
+        update_search_vectors(Product.all_objects.filter(category=instance), instance.name)
+
+
+@receiver([post_save, post_delete], sender=Cart)
+def invalidate_cart_badge(sender, instance, **kwargs):
+    invalidate_cart_count(instance.user_id)
+
+
+@receiver([post_save, post_delete], sender=Product)
+def bump_product_version(sender, instance, **kwargs):
+    bump_object_versions('product', [instance.pk])
+
+
+@receiver([post_save, post_delete], sender=Review)
+def bump_reviewed_product_version(sender, instance, **kwargs):
+    bump_object_versions('product', [instance.product_id])
+
+
+@receiver([post_save, post_delete], sender=Category)
+def bump_category_version(sender, instance, **kwargs):
+    bump_object_versions('category', [instance.pk])
+
+
+@receiver(post_save, sender=Product)
+def update_category_stats_on_save(sender, instance, created, **kwargs):
+    loaded, state = getattr(instance, '_loaded_stats', None), instance.stats_state()
+    if state is not None and (created or loaded is not None):
+        apply_product_changes([(None if created else loaded, state)])
+    else:
+        # Saved without being loaded first, so what changed is unknown
+        refresh_category_stats({instance.category_id, loaded and loaded[0]})
+    instance._loaded_stats = state
+
+
+@receiver(post_delete, sender=Product)
+def update_category_stats_on_delete(sender, instance, **kwargs):
+    loaded = getattr(instance, '_loaded_stats', None)
+    if loaded is not None:
+        apply_product_changes([(loaded, None)])
+    else:
+        refresh_category_stats({instance.category_id})
+
+
+@receiver(post_save, sender=Category)
+def create_own_stats(sender, instance, created, **kwargs):
+    if created:
+        refresh_category_stats({instance.pk})
+    else:
+        # A rename changes the menu, not the stats
+        cache.delete(NAVIGATION_KEY)
+
+
+@receiver(post_delete, sender=Category)
+def invalidate_navigation(sender, **kwargs):
+    cache.delete(NAVIGATION_KEY)
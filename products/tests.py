@@ -1,3 +1,1606 @@
-from django.test import TestCase
+import base64
+import csv
+import gzip
+import io
+import json
+import marshal
+import os
+import pstats
+import tempfile
+import threading
+import time
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from decimal import Decimal
+
+from datetime import timedelta
+
+from django.db import DatabaseError, connection, connections
+from django.http import HttpResponse
+from django.db.models import Sum
+from django.test import (
+    AsyncRequestFactory, LiveServerTestCase, RequestFactory, TestCase, TransactionTestCase, override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from benchmarks.compare import NotComparable, compare as compare_runs
+from benchmarks.load import api_endpoints, run_load
+from benchmarks.seed import (
+    ID_PREFIX, clear as clear_benchmark, is_seeded, parse_scale, plan, seed as seed_benchmark,
+    user_id as benchmark_user_id,
+)
+from ecommerce.cache_backends import TieredCache
+from ecommerce.db import lift_for_migrations, no_statement_timeout, restore_after_migrations
+from ecommerce.db_router import STICKY_COOKIE, ReplicaMiddleware, ReplicaRouter, sticky_key
+from ecommerce.instrumentation import InstrumentationMiddleware, install_query_hook, reset_metrics, route_metrics
+from login.models import CustomUser
+from . import async_views, cache as product_cache, export, services
+from .importer import InvalidRow, clean_row
+from .navigation import navigation, rebuild_category_stats
+from .models import (
+    Cart, Category, CategoryStats, Product, Order, OrderItem, RequestProfile, Review, StockReservation,
+)
+from .views import ReviewViewSet
+from .services import (
+    InsufficientStock, add_order_item, bulk_upsert_products, checkout_cart, release_expired_reservations,
+    release_reservations, reserve_stock, set_active, take_stock,
+)
+
+
+class ProductRatingQueryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.category = Category.objects.create(name="Books")
+        self.users = [
+            CustomUser.objects.create_user(username=f"user{i}", email=f"user{i}@example.com", password="pass")
+            for i in range(3)
+        ]
+
+    def make_products(self, count):
+        for i in range(count):
+            product = Product.objects.create(name=f"Product {i}", price=10 + i, stock=5, category=self.category)
+            for rating, user in zip([3, 4, 5], self.users):
+                Review.objects.create(user=user, product=product, rating=rating)
+
+    def list_query_count(self):
+        cache.clear()
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get("/api/products/")
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_list_query_count_does_not_grow_with_products(self):
+        self.make_products(2)
+        small = self.list_query_count()
+        self.make_products(10)
+        self.assertEqual(self.list_query_count(), small)
+
+    def test_list_returns_annotated_ratings(self):
+        self.make_products(1)
+        with self.assertNumQueries(1):
+            response = self.client.get("/api/products/?count=false")
+        item = response.data["results"][0]
+        self.assertEqual(item["average_rating"], 4.0)
+        self.assertEqual(item["review_count"], 3)
+
+    def test_retrieve_uses_single_query(self):
+        self.make_products(1)
+        product = Product.objects.get()
+        with self.assertNumQueries(1):
+            response = self.client.get(f"/api/products/{product.id}/")
+        self.assertEqual(response.data["review_count"], 3)
+
+    def test_list_pages_through_the_index(self):
+        # A GROUP BY over products would aggregate the whole catalog before the LIMIT
+        self.make_products(3)
+        for query, index in [("", "product_active_created"), ("&ordering=price", "product_active_price")]:
+            with CaptureQueriesContext(connection) as ctx:
+                self.client.get(f"/api/products/?count=false{query}")
+            sql = ctx.captured_queries[0]["sql"]
+            self.assertNotIn('GROUP BY "products_product"', sql)
+            with connection.cursor() as cursor:
+                # The test tables are tiny; make the planner show what it would do on a large one
+                cursor.execute("SET enable_seqscan = off")
+                try:
+                    cursor.execute(f"EXPLAIN {sql}")
+                    plan = "\n".join(row[0] for row in cursor.fetchall())
+                finally:
+                    cursor.execute("RESET enable_seqscan")
+            # Read in index order and stopped at the LIMIT, no sort of every live product
+            self.assertIn(index, plan)
+            self.assertNotIn("Sort", plan)
+
+    def test_unreviewed_product_rates_zero(self):
+        Product.objects.create(name="Lonely", price=1, category=self.category)
+        response = self.client.get("/api/products/")
+        self.assertEqual(response.data["results"][0]["average_rating"], 0)
+        self.assertEqual(response.data["results"][0]["review_count"], 0)
+
+
+class ProductListCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.category = Category.objects.create(name="Games")
+        self.product = Product.objects.create(name="Chess", price=20, stock=3, category=self.category)
+
+    def test_second_request_is_served_from_cache(self):
+        self.client.get("/api/products/")
+        with self.assertNumQueries(0):
+            response = self.client.get("/api/products/")
+        self.assertEqual(response.data["results"][0]["name"], "Chess")
+        stats = product_cache.cache_stats()
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["misses"], 1)
+
+    def test_product_edit_invalidates_cached_list(self):
+        self.client.get("/api/products/")
+        self.product.name = "Go"
+        self.product.save()
+        response = self.client.get("/api/products/")
+        self.assertEqual(response.data["results"][0]["name"], "Go")
+
+    def test_category_and_review_edits_invalidate(self):
+        generation = product_cache.get_generation()
+        self.category.name = "Board games"
+        self.category.save()
+        user = CustomUser.objects.create_user(username="rev", email="rev@example.com", password="pass")
+        Review.objects.create(user=user, product=self.product, rating=5)
+        self.assertGreater(product_cache.get_generation(), generation + 1)
+        self.assertGreaterEqual(product_cache.cache_stats()["invalidations"], 2)
+
+    def test_delete_invalidates_cached_list(self):
+        self.client.get("/api/products/")
+        self.product.delete()
+        self.assertEqual(self.client.get("/api/products/").data["results"], [])
+
+
+class StampedeProtectionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_concurrent_misses_rebuild_once(self):
+        rebuilds = []
+        results = []
+        barrier = threading.Barrier(8)
+
+        def rebuild():
+            rebuilds.append(1)
+            time.sleep(0.3)
+            return ["fresh"]
+
+        def worker():
+            barrier.wait()
+            results.append(product_cache.get_or_rebuild("hot-key", rebuild, timeout=60))
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(rebuilds), 1)
+        self.assertEqual(results, [["fresh"]] * 8)
+
+    def test_expired_entry_is_served_stale_during_rebuild(self):
+        product_cache.get_or_rebuild("hot-key", lambda: "old", timeout=60)
+        entry = cache.get("hot-key")
+        entry["fresh_until"] = time.time() - 1
+        cache.set("hot-key", entry)
+        # Another worker holds the rebuild lock
+        cache.add("hot-key:lock", "other-worker")
+
+        result = product_cache.get_or_rebuild("hot-key", lambda: "new", timeout=60)
+        self.assertEqual(result, "old")
+        self.assertEqual(product_cache.cache_stats()["stale"], 1)
+
+        cache.delete("hot-key:lock")
+        self.assertEqual(product_cache.get_or_rebuild("hot-key", lambda: "new", timeout=60), "new")
+
+    def test_category_list_is_cached(self):
+        admin = CustomUser.objects.create_superuser(username="admin", email="admin@example.com", password="pass")
+        client = APIClient()
+        client.force_authenticate(admin)
+        Category.objects.create(name="Toys")
+        client.get("/api/categories/")
+        with self.assertNumQueries(0):
+            response = client.get("/api/categories/")
+        self.assertEqual(response.data["results"][0]["name"], "Toys")
+        self.assertEqual(response["Cache-Control"], "public, max-age=3600")
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.category = Category.objects.create(name="Tools")
+        # Duplicate prices make the id tie-breaker matter
+        for i in range(7):
+            Product.objects.create(name=f"Tool {i}", price=10 + i // 2, stock=1, category=self.category)
+
+    def walk(self, url):
+        names = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            names.extend(item["name"] for item in response.data["results"])
+            url = response.data["next"]
+        return names
+
+    def test_walks_every_row_once_in_price_order(self):
+        names = self.walk("/api/products/?ordering=price&page_size=2")
+        expected = list(Product.objects.order_by("price", "pk").values_list("name", flat=True))
+        self.assertEqual(names, expected)
+
+    def test_descending_order_and_previous_link(self):
+        first = self.client.get("/api/products/?ordering=-price&page_size=3")
+        second = self.client.get(first.data["next"])
+        back = self.client.get(second.data["previous"])
+        self.assertEqual(back.data["results"], first.data["results"])
+        self.assertIsNone(first.data["previous"])
+
+    def test_count_opt_out(self):
+        response = self.client.get("/api/products/?page_size=2")
+        self.assertEqual(response.data["count"], 7)
+        response = self.client.get("/api/products/?page_size=2&count=false")
+        self.assertNotIn("count", response.data)
+
+    def test_unknown_ordering_falls_back_to_default(self):
+        names = self.walk("/api/products/?ordering=stock&page_size=3")
+        expected = list(Product.objects.order_by("-created_at", "-pk").values_list("name", flat=True))
+        self.assertEqual(names, expected)
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.client.get("/api/products/?cursor=not-a-cursor")
+        self.assertEqual(response.status_code, 404)
+
+    def test_tampered_cursor_is_rejected(self):
+        def tampered(ordering, value):
+            cursor = {"f": ordering.lstrip("-"), "d": ordering.startswith("-"), "v": value, "pk": "x", "r": False}
+            encoded = base64.urlsafe_b64encode(json.dumps(cursor).encode()).decode()
+            return self.client.get(f"/api/products/?ordering={ordering}&cursor={encoded}")
+
+        for ordering, value in [("price", "cheap"), ("-created_at", "yesterday"), ("price", None), ("name", [1])]:
+            self.assertEqual(tampered(ordering, value).status_code, 404, (ordering, value))
+        self.assertEqual(tampered("price", "11.00").status_code, 200)
+
+    def test_count_leaves_out_the_ratings(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get("/api/products/?page_size=2")
+        count_sql = next(query["sql"] for query in ctx.captured_queries if "COUNT(*)" in query["sql"])
+        self.assertNotIn("products_review", count_sql)
+
+    def test_orders_are_paginated(self):
+        user = CustomUser.objects.create_user(username="buyer", email="buyer@example.com", password="pass")
+        for _ in range(3):
+            Order.objects.create(customer=user)
+        self.client.force_authenticate(user)
+        response = self.client.get("/api/orders/?page_size=2")
+        self.assertEqual(len(response.data["results"]), 2)
+        self.assertEqual(response.data["count"], 3)
+        self.assertIsNotNone(response.data["next"])
+
+
+class ProductSearchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        cables = Category.objects.create(name="Cables")
+        audio = Category.objects.create(name="Audio")
+        Product.objects.create(name="Wireless headphones", price=99, category=audio,
+                               description="Noise cancelling over-ear")
+        Product.objects.create(name="USB cable", price=5, category=cables,
+                               description="Works with wireless chargers")
+        Product.objects.create(name="Speaker stand", price=30, category=audio)
+
+    def search(self, term):
+        response = self.client.get("/api/products/", {"search": term})
+        self.assertEqual(response.status_code, 200)
+        return [item["name"] for item in response.data["results"]]
+
+    def test_name_matches_rank_above_description_matches(self):
+        self.assertEqual(self.search("wireless"), ["Wireless headphones", "USB cable"])
+
+    def test_category_name_is_searchable(self):
+        self.assertCountEqual(self.search("audio"), ["Wireless headphones", "Speaker stand"])
+
+    def test_typo_tolerance(self):
+        self.assertIn("Speaker stand", self.search("speakr"))
+
+    def test_prefix_autocomplete(self):
+        response = self.client.get("/api/products/autocomplete/", {"q": "headph"})
+        self.assertEqual([item["name"] for item in response.data], ["Wireless headphones"])
+
+    def test_category_rename_refreshes_vectors(self):
+        category = Category.objects.get(name="Cables")
+        category.name = "Connectors"
+        category.save()
+        self.assertEqual(self.search("connectors"), ["USB cable"])
+
+    def test_search_results_paginate(self):
+        first = self.client.get("/api/products/", {"search": "audio", "page_size": 1})
+        second = self.client.get(first.data["next"])
+        names = [first.data["results"][0]["name"], second.data["results"][0]["name"]]
+        self.assertCountEqual(names, ["Wireless headphones", "Speaker stand"])
+
+
+class OrderItemTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username="buyer", email="buyer@example.com", password="pass")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.order = Order.objects.create(customer=self.user)
+        self.product = Product.objects.create(name="Mug", price=Decimal("4.50"), stock=10)
+
+    def add(self, quantity):
+        return self.client.post("/api/order-items/", {
+            "order_id": self.order.id, "product_id": self.product.id, "quantity": quantity,
+        })
+
+    def test_repeated_adds_merge_into_one_line(self):
+        self.assertEqual(self.add(2).status_code, 201)
+        response = self.add(3)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["quantity"], 5)
+        self.assertEqual(OrderItem.objects.get().price, Decimal("22.50"))
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.total_price, Decimal("22.50"))
+
+    def test_rejects_non_positive_quantity(self):
+        self.assertEqual(self.add(0).status_code, 400)
+        self.assertFalse(OrderItem.objects.exists())
+
+
+class ConcurrentOrderItemTests(TransactionTestCase):
+    writers = 8
+    adds_per_writer = 5
+
+    def test_concurrent_adds_keep_totals_exact(self):
+        user = CustomUser.objects.create_user(username="buyer", email="buyer@example.com", password="pass")
+        order = Order.objects.create(customer=user)
+        products = [Product.objects.create(name=f"P{i}", price=Decimal("1.25"), stock=100) for i in range(2)]
+        barrier = threading.Barrier(self.writers)
+        errors = []
+
+        def writer(product):
+            try:
+                barrier.wait()
+                for _ in range(self.adds_per_writer):
+                    add_order_item(order, product, 2)
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=writer, args=(products[i % 2],)) for i in range(self.writers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        adds = self.writers * self.adds_per_writer
+        self.assertEqual(OrderItem.objects.count(), 2)
+        self.assertEqual(sum(OrderItem.objects.values_list("quantity", flat=True)), adds * 2)
+        order.refresh_from_db()
+        self.assertEqual(order.total_price, Decimal("1.25") * 2 * adds)
+
+
+class StockReservationTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username="buyer", email="buyer@example.com", password="pass")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.lamp = Product.objects.create(name="Lamp", price=30, stock=3)
+        self.desk = Product.objects.create(name="Desk", price=200, stock=1)
+
+    def test_reserve_never_oversells(self):
+        reserve_stock(self.user, self.lamp, 2)
+        with self.assertRaises(InsufficientStock):
+            reserve_stock(self.user, self.lamp, 2)
+        self.lamp.refresh_from_db()
+        self.assertEqual(self.lamp.stock, 1)
+
+    def test_order_item_checks_stock(self):
+        order = Order.objects.create(customer=self.user)
+        response = self.client.post("/api/order-items/", {
+            "order_id": order.id, "product_id": self.desk.id, "quantity": 2,
+        })
+        self.assertEqual(response.status_code, 400)
+        self.desk.refresh_from_db()
+        self.assertEqual(self.desk.stock, 1)
+
+    def test_cart_rejects_more_than_stock(self):
+        response = self.client.post("/api/carts/", {"product_id": self.lamp.id, "quantity": 4})
+        self.assertEqual(response.status_code, 400)
+
+    def test_checkout_names_the_deactivated_product(self):
+        Cart.objects.create(user=self.user, product=self.lamp, quantity=1)
+        Cart.objects.create(user=self.user, product=self.desk, quantity=1)
+        set_active(Product.objects.filter(pk=self.desk.pk), False)
+        with self.assertRaises(InsufficientStock) as raised:
+            checkout_cart(self.user)
+        self.assertEqual(raised.exception.product, self.desk)
+        self.assertEqual(Product.objects.get(pk=self.lamp.pk).stock, 3)
+
+    def test_cart_reservation_is_all_or_nothing(self):
+        Cart.objects.create(user=self.user, product=self.lamp, quantity=2)
+        Cart.objects.create(user=self.user, product=self.desk, quantity=1)
+        self.desk.stock = 0
+        self.desk.save()
+
+        response = self.client.post("/api/carts/reserve/")
+        self.assertEqual(response.status_code, 409)
+        self.lamp.refresh_from_db()
+        self.assertEqual(self.lamp.stock, 3)
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_expired_reservations_return_to_stock(self):
+        Cart.objects.create(user=self.user, product=self.lamp, quantity=2)
+        Cart.objects.create(user=self.user, product=self.desk, quantity=1)
+        response = self.client.post("/api/carts/reserve/")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data), 2)
+
+        self.assertEqual(release_expired_reservations(), 0)
+        self.assertEqual(release_expired_reservations(timezone.now() + timedelta(hours=1)), 2)
+        self.lamp.refresh_from_db()
+        self.desk.refresh_from_db()
+        self.assertEqual((self.lamp.stock, self.desk.stock), (3, 1))
+        self.assertFalse(StockReservation.objects.filter(status=StockReservation.ACTIVE).exists())
+
+    def test_reserving_again_replaces_previous_holds(self):
+        Cart.objects.create(user=self.user, product=self.lamp, quantity=2)
+        self.client.post("/api/carts/reserve/")
+        self.client.post("/api/carts/reserve/")
+        self.lamp.refresh_from_db()
+        self.assertEqual(self.lamp.stock, 1)
+
+
+class CheckoutTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username="buyer", email="buyer@example.com", password="pass")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.products = [Product.objects.create(name=f"Item {i}", price=Decimal("2.50"), stock=5) for i in range(3)]
+
+    def fill_cart(self, quantity=2):
+        for product in self.products:
+            Cart.objects.create(user=self.user, product=product, quantity=quantity)
+
+    def test_checkout_creates_order_and_clears_cart(self):
+        self.fill_cart()
+        response = self.client.post("/api/carts/checkout/")
+        self.assertEqual(response.status_code, 201)
+        order = Order.objects.get()
+        self.assertEqual(order.total_price, Decimal("15.00"))
+        self.assertEqual(order.items.count(), 3)
+        self.assertFalse(Cart.objects.exists())
+        self.assertEqual(set(Product.objects.values_list("stock", flat=True)), {3})
+
+    def test_checkout_query_count_is_constant(self):
+        self.fill_cart()
+        with CaptureQueriesContext(connection) as small:
+            checkout_cart(self.user)
+        self.products += [Product.objects.create(name=f"More {i}", price=1, stock=5) for i in range(10)]
+        self.fill_cart(quantity=1)
+        with CaptureQueriesContext(connection) as large:
+            checkout_cart(self.user)
+        self.assertEqual(len(large.captured_queries), len(small.captured_queries))
+
+    def test_checkout_uses_reservations(self):
+        self.fill_cart()
+        self.client.post("/api/carts/reserve/")
+        Cart.objects.filter(product=self.products[0]).update(quantity=1)
+        self.assertEqual(self.client.post("/api/carts/checkout/").status_code, 201)
+        stock = dict(Product.objects.values_list("pk", "stock"))
+        self.assertEqual([stock[product.pk] for product in self.products], [4, 3, 3])
+        self.assertEqual(
+            set(StockReservation.objects.values_list("status", flat=True)), {StockReservation.CONFIRMED}
+        )
+
+    def test_checkout_is_atomic_when_stock_runs_out(self):
+        self.fill_cart()
+        Product.objects.filter(pk=self.products[2].pk).update(stock=1)
+        response = self.client.post("/api/carts/checkout/")
+        self.assertEqual(response.status_code, 409)
+        self.assertIn("Item 2", response.data["error"])
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(Cart.objects.count(), 3)
+        self.assertEqual(Product.objects.get(pk=self.products[0].pk).stock, 5)
+
+    def test_empty_cart(self):
+        self.assertEqual(self.client.post("/api/carts/checkout/").status_code, 400)
+
+
+class ProductBulkUpsertTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        admin = CustomUser.objects.create_superuser(username="admin", email="admin@example.com", password="pass")
+        self.client = APIClient()
+        self.client.force_authenticate(admin)
+        self.category = Category.objects.create(name="Garden")
+        self.existing = Product.objects.create(name="Rake", price=12, stock=1, category=self.category)
+
+    def test_upserts_and_reports_bad_rows(self):
+        rows = [
+            {"id": self.existing.id, "name": "Steel rake", "price": "14.00", "stock": 4,
+             "category_id": self.category.id},
+            {"name": "Hose", "price": "20.00", "stock": 2, "category_id": self.category.id},
+            {"name": "No price", "stock": 1},
+            {"name": "Bad category", "price": "1.00", "stock": 1, "category_id": "missing"},
+        ]
+        response = self.client.post("/api/products/bulk/?chunk_size=2", rows, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["saved"], 2)
+        self.assertEqual([error["row"] for error in response.data["errors"]], [2, 3])
+        self.existing.refresh_from_db()
+        self.assertEqual((self.existing.name, self.existing.stock), ("Steel rake", 4))
+        self.assertTrue(Product.objects.filter(name="Hose", category=self.category).exists())
+
+    def test_partial_row_keeps_other_fields(self):
+        set_active(Product.all_objects.filter(pk=self.existing.pk), False)
+        rows = [{"id": self.existing.id, "name": "Steel rake", "price": "14.00"}]
+        response = self.client.post("/api/products/bulk/", rows, format="json")
+        self.assertEqual(response.data, {"saved": 1, "errors": []})
+        product = Product.all_objects.get(pk=self.existing.pk)
+        self.assertEqual((product.name, product.price), ("Steel rake", Decimal("14.00")))
+        self.assertEqual((product.stock, product.category, product.is_active), (1, self.category, False))
+        # Still found under its category's name
+        self.assertTrue(Product.all_objects.filter(pk=product.pk, search_vector="garden").exists())
+
+    def test_repeated_id_in_a_chunk_is_reported(self):
+        rows = [
+            {"id": self.existing.id, "name": "Steel rake", "price": "14.00"},
+            {"id": self.existing.id, "name": "Iron rake", "price": "15.00"},
+        ]
+        response = self.client.post("/api/products/bulk/", rows, format="json")
+        self.assertEqual(response.data["saved"], 1)
+        self.assertEqual(response.data["errors"], [{"row": 1, "errors": {"id": ["Repeats the id of row 0."]}}])
+        self.assertEqual(Product.objects.get(pk=self.existing.pk).name, "Steel rake")
+
+    def test_database_error_fails_only_its_row(self):
+        real = services.update_search_vectors
+
+        def update_search_vectors(products, category_name):
+            if products.filter(name="Broken").exists():
+                raise DatabaseError('relation "secret" does not exist')
+            return real(products, category_name)
+
+        rows = [{"name": name, "price": "1.00", "stock": 1} for name in ("Hose", "Broken", "Shears")]
+        with mock.patch.object(services, "update_search_vectors", update_search_vectors), \
+                self.assertLogs("products.services", "ERROR"):
+            response = self.client.post("/api/products/bulk/", rows, format="json")
+        self.assertEqual(response.data["saved"], 2)
+        self.assertEqual(response.data["errors"],
+                         [{"row": 1, "errors": {"non_field_errors": ["Could not save this row."]}}])
+        self.assertEqual(set(Product.objects.values_list("name", flat=True)), {"Rake", "Hose", "Shears"})
+
+    def test_ndjson_stream(self):
+        body = "\n".join([
+            json.dumps({"name": "Shovel", "price": "9.99", "stock": 3}),
+            "not json",
+            json.dumps({"name": "Trowel", "price": "3.50", "stock": 8, "category_id": self.category.id}),
+        ])
+        response = self.client.post("/api/products/bulk/", body, content_type="application/x-ndjson")
+        self.assertEqual(response.data["saved"], 2)
+        self.assertEqual(response.data["errors"][0]["row"], 1)
+
+    def test_category_lookup_is_one_query_per_chunk(self):
+        rows = [{"name": f"Seed {i}", "price": "1.00", "stock": 1, "category_id": self.category.id} for i in range(50)]
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.post("/api/products/bulk/", rows, format="json")
+        category_queries = [q for q in ctx.captured_queries if 'FROM "products_category"' in q["sql"]]
+        self.assertEqual(len(category_queries), 1)
+
+    def test_batch_invalidates_cache_once_and_is_searchable(self):
+        generation = product_cache.get_generation()
+        rows = [{"name": f"Watering can {i}", "price": "5.00", "stock": 1} for i in range(5)]
+        self.client.post("/api/products/bulk/", rows, format="json")
+        self.assertEqual(product_cache.get_generation(), generation + 1)
+        response = self.client.get("/api/products/", {"search": "watering"})
+        self.assertEqual(len(response.data["results"]), 5)
+
+    def test_requires_admin(self):
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.post("/api/products/bulk/", [], format="json").status_code, 401)
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        admin = self.admin = CustomUser.objects.create_superuser(username="admin", email="admin@example.com",
+                                                                 password="pass")
+        self.client = APIClient()
+        self.client.force_authenticate(admin)
+        category = Category.objects.create(name="Kitchen")
+        self.products = [Product.objects.create(name=f"Pan {i}", price=15, stock=2, category=category)
+                         for i in range(3)]
+        order = Order.objects.create(customer=admin, total_price=30)
+        OrderItem.objects.create(order=order, product=self.products[0], quantity=2, price=30)
+        Review.objects.create(user=admin, product=self.products[1], rating=4, comment="Solid")
+
+    def export(self, path):
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b"".join(response.streaming_content)
+
+    def test_products_ndjson(self):
+        lines = self.export("/api/export/products/").decode().splitlines()
+        rows = [json.loads(line) for line in lines]
+        self.assertEqual(sorted(row["name"] for row in rows), ["Pan 0", "Pan 1", "Pan 2"])
+        self.assertEqual(rows[0]["category"], "Kitchen")
+
+    def test_orders_include_items(self):
+        row = json.loads(self.export("/api/export/orders/"))
+        self.assertEqual(row["customer"], "admin")
+        self.assertEqual(row["items"], [{"product_id": self.products[0].id, "quantity": 2, "price": "30.00"}])
+
+    def test_reviews_csv_gzip(self):
+        body = gzip.decompress(self.export("/api/export/reviews/?output=csv&gzip=1"))
+        rows = list(csv.DictReader(io.StringIO(body.decode())))
+        self.assertEqual([(row["user"], row["rating"], row["comment"]) for row in rows], [("admin", "4", "Solid")])
+
+    def test_export_reads_in_a_transaction(self):
+        depths = []
+
+        def rows():
+            depths.append(len(connection.atomic_blocks))
+            yield from export.product_rows()
+
+        outside = len(connection.atomic_blocks)
+        with mock.patch.dict(export.EXPORTS, {"products": (rows, export.EXPORTS["products"][1])}):
+            self.export("/api/export/products/")
+        self.assertEqual(depths, [outside + 1])
+
+    async def test_asgi_export_streams(self):
+        produced = []
+
+        def rows():
+            for row in export.product_rows():
+                produced.append(row["id"])
+                yield row
+
+        token = await sync_to_async(lambda: str(RefreshToken.for_user(self.admin).access_token))()
+        buffered = export.buffered
+        # One block per row, so the first one can be sent before the others are read
+        with mock.patch.dict(export.EXPORTS, {"products": (rows, export.EXPORTS["products"][1])}), \
+                mock.patch.object(export, "buffered", lambda chunks: buffered(chunks, size=1)):
+            response = await self.async_client.get("/api/export/products/", headers={"Authorization": f"Bearer {token}"})
+            self.assertTrue(response.is_async)
+            blocks = aiter(response.streaming_content)
+            first = json.loads(await anext(blocks))
+            self.assertEqual(produced, [first["id"]])
+            rest = [json.loads(block) async for block in blocks]
+        self.assertEqual(len(rest), 2)
+
+    def test_unknown_export(self):
+        self.assertEqual(self.client.get("/api/export/users/").status_code, 404)
+        self.assertEqual(self.client.get("/api/export/products/?output=xml").status_code, 400)
+
+    def test_management_command(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "products.csv")
+            call_command("export_data", "products", output="csv", file=path)
+            with open(path) as exported:
+                self.assertEqual(len(list(csv.DictReader(exported))), 3)
+
+
+class ImportCatalogTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.existing = Product.objects.create(name="Old kettle", price=10, stock=1)
+
+    def write(self, name, text):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, "w") as out:
+            out.write(text)
+        return path
+
+    def test_csv_import_upserts_and_creates_categories(self):
+        path = self.write("catalog.csv", (
+            "id,name,description,price,stock,category\n"
+            f"{self.existing.id},Electric kettle,1.7 litres,24.99,7,Kitchen\n"
+            ",Toaster,,19.50,3,Kitchen\n"
+            ",Broken,,abc,1,Kitchen\n"
+            ",Lamp,,9,2,Lighting\n"
+        ))
+        call_command("import_catalog", path, batch_size=2, stdout=io.StringIO(), stderr=io.StringIO())
+
+        self.existing.refresh_from_db()
+        self.assertEqual((self.existing.name, self.existing.stock), ("Electric kettle", 7))
+        self.assertEqual(self.existing.category.name, "Kitchen")
+        self.assertEqual(Product.objects.count(), 3)
+        self.assertEqual(set(Category.objects.values_list("name", flat=True)), {"Kitchen", "Lighting"})
+        self.assertFalse(os.path.exists(path + ".checkpoint"))
+        # Loaded rows get a search vector in the same statement
+        response = APIClient().get("/api/products/", {"search": "toaster"})
+        self.assertEqual([item["name"] for item in response.data["results"]], ["Toaster"])
+
+    def test_ndjson_resumes_from_checkpoint(self):
+        lines = [json.dumps({"name": f"Mug {i}", "price": "3.00", "stock": 1}) for i in range(5)]
+        path = self.write("catalog.ndjson", "\n".join(lines))
+        with open(path + ".checkpoint", "w") as checkpoint:
+            json.dump({"offset": 3}, checkpoint)
+
+        out = io.StringIO()
+        call_command("import_catalog", path, stdout=out)
+        self.assertIn("Resuming after row 3", out.getvalue())
+        self.assertEqual(
+            sorted(Product.objects.filter(name__startswith="Mug").values_list("name", flat=True)), ["Mug 3", "Mug 4"]
+        )
+
+    def test_duplicate_ids_keep_last_row(self):
+        path = self.write("catalog.ndjson", "\n".join([
+            json.dumps({"id": "dup", "name": "First", "price": "1", "stock": 1}),
+            json.dumps({"id": "dup", "name": "Second", "price": "2", "stock": 2}),
+        ]))
+        call_command("import_catalog", path, stdout=io.StringIO())
+        self.assertEqual(Product.objects.get(pk="dup").name, "Second")
+
+    def test_rows_of_the_wrong_type_are_rejected(self):
+        for row, message in [
+            ({"name": 123, "price": "1"}, "name must be a string"),
+            ({"name": "Mug", "price": "1", "category": 5}, "category must be a string"),
+            ({"name": "Mug", "price": "1", "description": ["big"]}, "description must be a string"),
+            ({"name": "Mug", "price": "1", "stock": 2.9}, "stock is not an integer"),
+            ({"name": "Mug", "price": "1", "stock": "2.9"}, "stock is not an integer"),
+            ({"name": "Mug", "price": "1", "stock": True}, "stock is not an integer"),
+        ]:
+            with self.assertRaisesMessage(InvalidRow, message):
+                clean_row(row)
+        self.assertEqual(clean_row({"name": "Mug", "price": "1", "stock": 2.0})[4], 2)
+
+        # One bad row doesn't stop the import
+        path = self.write("catalog.ndjson", "\n".join([
+            json.dumps({"name": 123, "price": "1", "stock": 1}),
+            json.dumps({"name": "Cup", "price": "2", "stock": 1, "category": 5}),
+            json.dumps({"name": "Bowl", "price": "3", "stock": 4}),
+        ]))
+        call_command("import_catalog", path, stdout=io.StringIO(), stderr=io.StringIO())
+        self.assertTrue(Product.objects.filter(name="Bowl", stock=4).exists())
+        self.assertFalse(Product.objects.filter(name="Cup").exists())
+
+
+class OrderSerializationQueryTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username="buyer", email="buyer@example.com", password="pass")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.category = Category.objects.create(name="Stationery")
+
+    def make_orders(self, count, items=3):
+        for _ in range(count):
+            order = Order.objects.create(customer=self.user)
+            for i in range(items):
+                product = Product.objects.create(name=f"Pen {i}", price=2, stock=5, category=self.category)
+                Review.objects.create(user=self.user, product=product, rating=4)
+                OrderItem.objects.create(order=order, product=product, quantity=1, price=2)
+
+    def list_query_count(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get("/api/orders/")
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries), response
+
+    def test_order_list_query_count_is_constant(self):
+        self.make_orders(1)
+        small, _ = self.list_query_count()
+        self.make_orders(5, items=4)
+        large, response = self.list_query_count()
+        self.assertEqual(large, small)
+        # count, orders, items, products
+        self.assertEqual(large, 4)
+        item = response.data["results"][0]["items"][0]["product"]
+        self.assertEqual((item["category"], item["average_rating"], item["review_count"]), ("Stationery", 4.0, 1))
+        self.assertEqual(response.data["results"][0]["customer"], "buyer")
+
+    def test_order_retrieve_query_count(self):
+        self.make_orders(1, items=5)
+        order = Order.objects.get()
+        with self.assertNumQueries(3):
+            response = self.client.get(f"/api/orders/{order.id}/")
+        self.assertEqual(len(response.data["items"]), 5)
+
+
+class CartSummaryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user(username="buyer", email="buyer@example.com", password="pass")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def fill(self, lines):
+        for i in range(lines):
+            product = Product.objects.create(name=f"Sock {i:02d}", price=Decimal("1.50"), stock=100)
+            Cart.objects.create(user=self.user, product=product, quantity=i + 1)
+
+    def test_summary_is_one_query(self):
+        self.fill(50)
+        with self.assertNumQueries(1):
+            response = self.client.get("/api/carts/summary/")
+        self.assertEqual(len(response.data["items"]), 50)
+        self.assertEqual(response.data["item_count"], sum(range(1, 51)))
+        self.assertEqual(response.data["subtotal"], Decimal("1.50") * sum(range(1, 51)))
+        self.assertEqual(response.data["items"][1]["line_total"], "3.00")
+
+    def test_empty_summary(self):
+        response = self.client.get("/api/carts/summary/")
+        self.assertEqual((response.data["items"], response.data["item_count"]), ([], 0))
+
+    def test_cart_list_query_count_is_constant(self):
+        self.fill(2)
+        with CaptureQueriesContext(connection) as small:
+            self.client.get("/api/carts/")
+        Cart.objects.all().delete()
+        self.fill(30)
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.get("/api/carts/")
+        self.assertEqual(len(large.captured_queries), len(small.captured_queries))
+        totals = {line["product"]: line["total_price"] for line in response.data}
+        self.assertEqual(totals["Sock 02"], Decimal("4.50"))
+
+    def test_count_is_cached_and_invalidated(self):
+        self.fill(3)
+        self.assertEqual(self.client.get("/api/carts/count/").data["count"], 6)
+        with self.assertNumQueries(0):
+            self.client.get("/api/carts/count/")
+        Cart.objects.first().delete()
+        self.assertLess(self.client.get("/api/carts/count/").data["count"], 6)
+
+
+class TieredCacheTests(TestCase):
+    def make_node(self, **options):
+        """A TieredCache over the shared tier, as another worker process would have"""
+        options = {"L2": "shared", "L1_MAX_ENTRIES": 3, "L1_TIMEOUT": 60,
+                   "L1_BYPASS": ["bypass:"], "COMPRESS_MIN_BYTES": 100, **options}
+        return TieredCache("", {"OPTIONS": options})
+
+    def setUp(self):
+        cache.clear()
+
+    def test_second_node_reads_through_shared_tier(self):
+        node_a, node_b = self.make_node(), self.make_node()
+        node_a.set("page", {"results": [1, 2, 3]})
+        self.assertEqual(node_b.get("page"), {"results": [1, 2, 3]})
+        self.assertEqual(node_b.get("page"), {"results": [1, 2, 3]})
+        self.assertEqual(node_b.metrics()["l2_hits"], 1)
+        self.assertEqual(node_b.metrics()["l1_hits"], 1)
+
+    def test_large_values_are_compressed(self):
+        node = self.make_node()
+        value = ["product"] * 500
+        node.set("big", value)
+        self.assertEqual(node.metrics()["compressed"], 1)
+        self.assertGreater(node.metrics()["bytes_saved"], 0)
+        self.assertEqual(self.make_node().get("big"), value)
+
+    def test_l1_is_bounded(self):
+        node = self.make_node()
+        for i in range(5):
+            node.set(f"key{i}", i)
+        self.assertEqual(node.metrics()["l1_entries"], 3)
+        self.assertEqual(node.metrics()["l1_evictions"], 2)
+        self.assertEqual(node.get("key0"), 0)  # still in L2
+
+    def test_bypass_keys_are_always_read_from_shared_tier(self):
+        node_a, node_b = self.make_node(), self.make_node()
+        node_a.set("bypass:generation", 1)
+        self.assertEqual(node_b.get("bypass:generation"), 1)
+        node_a.incr("bypass:generation")
+        self.assertEqual(node_b.get("bypass:generation"), 2)
+        self.assertEqual(node_b.metrics().get("l1_hits", 0), 0)
+
+    def test_incr_and_add_invalidate_l1(self):
+        node = self.make_node()
+        node.set("counter", 1)
+        self.assertEqual(node.incr("counter", 5), 6)
+        self.assertEqual(node.get("counter"), 6)
+        self.assertFalse(node.add("counter", 0))
+
+    def test_msgpack_serializer(self):
+        try:
+            import msgpack  # noqa: F401
+        except ImportError:
+            self.skipTest("msgpack is not installed")
+        node = self.make_node(SERIALIZER="msgpack")
+        node.set("page", {"results": ["a" * 200]})
+        self.assertEqual(self.make_node(SERIALIZER="msgpack").get("page"), {"results": ["a" * 200]})
+
+    def test_msgpack_keeps_model_values(self):
+        try:
+            import msgpack  # noqa: F401
+        except ImportError:
+            self.skipTest("msgpack is not installed")
+        category = Category.objects.create(name="Lamps")
+        Product.objects.create(name="Desk lamp", price=Decimal("12.50"), stock=3, category=category)
+        menu = navigation()
+        self.assertIsInstance(menu[0]["min_price"], Decimal)
+        values = {"menu": menu, "at": timezone.now(), "day": timezone.localdate(), "id": CustomUser().pk}
+        self.make_node(SERIALIZER="msgpack").set("values", values)
+        self.assertEqual(self.make_node(SERIALIZER="msgpack").get("values"), values)
+        with self.assertRaises(TypeError):
+            self.make_node(SERIALIZER="msgpack").set("other", {1, 2})
+
+        default = settings.CACHES["default"]
+        msgpack_default = {**default, "OPTIONS": {**default["OPTIONS"], "SERIALIZER": "msgpack"}}
+        with self.settings(CACHES={**settings.CACHES, "default": msgpack_default}):
+            cache.clear()
+            for _ in range(2):  # Stored, then read back
+                response = self.client.get("/api/categories/navigation/")
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.json()[0]["name"], "Lamps")
+
+    def test_default_cache_is_tiered(self):
+        self.assertIsInstance(caches["default"], TieredCache)
+
+    def test_detail_versions_skip_the_local_tier(self):
+        other_worker = TieredCache("", settings.CACHES["default"])
+        key = product_cache.object_version_key("product", "abc")
+        product_cache.bump_object_versions("product", ["abc"])
+        before = other_worker.get(key)
+        product_cache.bump_object_versions("product", ["abc"])
+        self.assertGreater(other_worker.get(key), before)
+        # Detail bodies are checked against the versions, so they may stay local
+        other_worker.set(product_cache.detail_cache_key("product", "abc"), {"name": "Lamp"})
+        self.assertEqual(other_worker.metrics()["l1_entries"], 1)
+
+
+class DetailCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.category = Category.objects.create(name="Bikes")
+        self.product = Product.objects.create(name="Roadster", price=500, stock=2, category=self.category)
+        self.url = f"/api/products/{self.product.id}/"
+
+    def test_second_retrieve_skips_the_database(self):
+        first = self.client.get(self.url)
+        self.assertTrue(first["ETag"].startswith('"'))
+        self.assertIn("Last-Modified", first)
+        with self.assertNumQueries(0):
+            second = self.client.get(self.url)
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(second["ETag"], first["ETag"])
+
+    def test_if_none_match_returns_304(self):
+        etag = self.client.get(self.url)["ETag"]
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH='"other"').status_code, 200)
+
+    def test_if_modified_since_returns_304(self):
+        last_modified = self.client.get(self.url)["Last-Modified"]
+        response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+    def test_product_review_and_category_changes_refresh_detail(self):
+        etag = self.client.get(self.url)["ETag"]
+        user = CustomUser.objects.create_user(username="rider", email="rider@example.com", password="pass")
+        Review.objects.create(user=user, product=self.product, rating=5)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["review_count"], 1)
+
+        self.category.name = "Bicycles"
+        self.category.save()
+        self.assertEqual(self.client.get(self.url).data["category"], "Bicycles")
+
+        stock = self.client.get(self.url).data["stock"]
+        reserve_stock(user, self.product, 1)
+        self.assertEqual(self.client.get(self.url).data["stock"], stock - 1)
+
+    def test_deleted_product_is_not_served(self):
+        self.client.get(self.url)
+        self.product.delete()
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+    def test_category_detail_is_cached(self):
+        admin = CustomUser.objects.create_superuser(username="admin", email="admin@example.com", password="pass")
+        self.client.force_authenticate(admin)
+        url = f"/api/categories/{self.category.id}/"
+        etag = self.client.get(url)["ETag"]
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.category.description = "Two wheels"
+        self.category.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).data["description"], "Two wheels")
+
+
+class SoftDeleteTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.admin = CustomUser.objects.create_superuser(username="admin", email="admin@example.com", password="pass")
+        self.category = Category.objects.create(name="Lamps")
+        self.lamp = Product.objects.create(name="Desk lamp", price=30, stock=5, category=self.category)
+        self.bulb = Product.objects.create(name="Bulb", price=2, stock=50, category=self.category)
+
+    def names(self, url="/api/products/"):
+        return sorted(row["name"] for row in self.client.get(url).data["results"])
+
+    def test_delete_deactivates_and_invalidates_cached_list(self):
+        self.assertEqual(self.names(), ["Bulb", "Desk lamp"])
+        self.client.get(f"/api/products/{self.lamp.id}/")
+        self.client.force_authenticate(self.admin)
+        self.assertEqual(self.client.delete(f"/api/products/{self.lamp.id}/").status_code, 204)
+
+        self.assertEqual(self.names(), ["Bulb"])
+        self.assertEqual(self.client.get(f"/api/products/{self.lamp.id}/").status_code, 404)
+        self.assertEqual(self.client.get("/api/products/?search=desk").data["results"], [])
+        self.assertFalse(Product.all_objects.get(pk=self.lamp.pk).is_active)
+
+    def test_bulk_delete_and_restore(self):
+        self.client.force_authenticate(self.admin)
+        self.names()
+        response = self.client.post(
+            "/api/products/bulk-delete/", {"ids": [self.lamp.id, self.bulb.id]}, format="json"
+        )
+        self.assertEqual(sorted(response.data["deactivated"]), sorted([self.lamp.id, self.bulb.id]))
+        self.assertEqual(self.names(), [])
+
+        response = self.client.post("/api/products/bulk-restore/", {"ids": [self.lamp.id]}, format="json")
+        self.assertEqual(response.data["restored"], [self.lamp.id])
+        self.assertEqual(self.names(), ["Desk lamp"])
+        self.assertEqual(
+            self.client.post("/api/products/bulk-delete/", {"ids": "nope"}, format="json").status_code, 400
+        )
+
+    def test_bulk_endpoints_are_admin_only(self):
+        user = CustomUser.objects.create_user(username="shopper", email="shopper@example.com", password="pass")
+        self.client.force_authenticate(user)
+        response = self.client.post("/api/products/bulk-delete/", {"ids": [self.lamp.id]}, format="json")
+        self.assertEqual(response.status_code, 403)
+        self.assertTrue(Product.objects.filter(pk=self.lamp.pk).exists())
+
+    def test_category_with_live_products_is_kept(self):
+        self.client.force_authenticate(self.admin)
+        empty = Category.objects.create(name="Empty")
+        response = self.client.post(
+            "/api/categories/bulk-delete/", {"ids": [self.category.id, empty.id]}, format="json"
+        )
+        self.assertEqual(response.data["deactivated"], [empty.id])
+        self.assertEqual(self.names("/api/categories/"), ["Lamps"])
+        self.assertEqual(self.client.delete(f"/api/categories/{self.category.id}/").status_code, 400)
+
+        Product.objects.filter(category=self.category).update(is_active=False)
+        self.assertEqual(self.client.delete(f"/api/categories/{self.category.id}/").status_code, 204)
+        self.assertTrue(Category.all_objects.filter(pk=self.category.pk).exists())
+
+    def test_orders_still_show_deactivated_products(self):
+        user = CustomUser.objects.create_user(username="shopper", email="shopper@example.com", password="pass")
+        order = Order.objects.create(customer=user)
+        add_order_item(order, self.lamp, 1)
+        Product.objects.filter(pk=self.lamp.pk).update(is_active=False)
+        self.client.force_authenticate(user)
+        item = self.client.get(f"/api/orders/{order.id}/").data["items"][0]
+        self.assertEqual(item["product"]["name"], "Desk lamp")
+
+    def test_deactivated_rows_keep_their_unique_names(self):
+        set_active(Category.objects.filter(pk=self.category.pk), False)
+        self.client.force_authenticate(self.admin)
+        response = self.client.post("/api/categories/", {"name": "Lamps"}, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("name", response.data)
+        with self.assertRaises(ValidationError):
+            Category(name="Lamps").full_clean()
+
+    def test_admin_and_dumps_see_deactivated_rows(self):
+        set_active(Product.objects.filter(pk=self.lamp.pk), False)
+        set_active(Category.objects.filter(pk=self.category.pk), False)
+        self.client.force_login(self.admin)
+        form = self.client.get(f"/admin/products/product/{self.bulb.pk}/change/").context["adminform"].form
+        self.assertIn(self.category, form.fields["category"].queryset)
+
+        out = io.StringIO()
+        call_command("dumpdata", "products.category", "products.product", use_base_manager=True, stdout=out)
+        dumped = {row["pk"] for row in json.loads(out.getvalue())}
+        self.assertLessEqual({self.category.pk, self.lamp.pk}, dumped)
+
+
+class CategoryStatsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.tools = Category.objects.create(name="Tools")
+        self.garden = Category.objects.create(name="Garden")
+        self.hammer = Product.objects.create(name="Hammer", price=12, stock=3, category=self.tools)
+        self.saw = Product.objects.create(name="Saw", price=30, stock=0, category=self.tools)
+
+    def stats(self, category):
+        return CategoryStats.objects.get(category=category)
+
+    def test_counts_follow_product_changes(self):
+        stats = self.stats(self.tools)
+        self.assertEqual((stats.active_count, stats.in_stock_count), (2, 1))
+        self.assertEqual((stats.min_price, stats.max_price), (Decimal("12.00"), Decimal("30.00")))
+
+        self.saw.category = self.garden
+        self.saw.save()
+        self.assertEqual(self.stats(self.tools).active_count, 1)
+        self.assertEqual(self.stats(self.garden).active_count, 1)
+
+        set_active(Product.objects.filter(pk=self.hammer.pk), False)
+        stats = self.stats(self.tools)
+        self.assertEqual((stats.active_count, stats.min_price), (0, None))
+
+    def test_selling_out_and_restocking_update_in_stock_count(self):
+        user = CustomUser.objects.create_user(username="builder", email="builder@example.com", password="pass")
+        reservation = reserve_stock(user, self.hammer, 3)
+        self.assertEqual(self.stats(self.tools).in_stock_count, 0)
+        release_reservations(StockReservation.objects.filter(pk=reservation.pk))
+        self.assertEqual(self.stats(self.tools).in_stock_count, 1)
+
+    def test_navigation_is_one_cached_query(self):
+        with self.assertNumQueries(1):
+            menu = self.client.get("/api/categories/navigation/").data
+        self.assertEqual([row["name"] for row in menu], ["Garden", "Tools"])
+        self.assertEqual(menu[1]["active_count"], 2)
+        with self.assertNumQueries(0):
+            self.client.get("/api/categories/navigation/")
+
+        Product.objects.create(name="Rake", price=8, stock=1, category=self.garden)
+        menu = self.client.get("/api/categories/navigation/").data
+        self.assertEqual((menu[0]["active_count"], menu[0]["min_price"]), (1, Decimal("8.00")))
+
+    def test_incremental_updates_match_a_recount(self):
+        rake = Product.objects.create(name="Rake", price=5, stock=2, category=self.garden)
+        self.hammer.price = 50  # The old minimum leaves the range
+        self.hammer.save()
+        self.saw.stock = 4
+        self.saw.save()
+        rake.category = self.tools
+        rake.save()
+        Product.objects.get(pk=self.saw.pk).delete()
+        set_active(Product.objects.filter(pk=self.hammer.pk), False)
+        take_stock(rake, 2)
+        bulk_upsert_products([
+            {"id": self.hammer.pk, "name": "Hammer", "price": "7.00"},
+            {"name": "Hoe", "price": "9.00", "stock": 1, "category_id": self.garden.pk},
+        ])
+        set_active(Product.all_objects.filter(pk=self.hammer.pk), True)
+
+        incremental = {(row.category_id, row.active_count, row.in_stock_count, row.min_price, row.max_price)
+                       for row in CategoryStats.objects.all()}
+        rebuild_category_stats()
+        recounted = {(row.category_id, row.active_count, row.in_stock_count, row.min_price, row.max_price)
+                     for row in CategoryStats.objects.all()}
+        self.assertEqual(incremental, recounted)
+        self.assertIn((self.tools.pk, 2, 1, Decimal("5.00"), Decimal("7.00")), recounted)
+
+    def test_saving_a_product_does_not_recount_its_category(self):
+        product = Product.objects.get(pk=self.hammer.pk)
+        product.stock = 0
+        with CaptureQueriesContext(connection) as ctx:
+            product.save()
+        stats_sql = [query["sql"] for query in ctx.captured_queries if "products_categorystats" in query["sql"]]
+        self.assertEqual(len(stats_sql), 1)
+        self.assertNotIn("COUNT(", stats_sql[0])
+        self.assertEqual(self.stats(self.tools).in_stock_count, 0)
+
+    def test_rebuild_command_fixes_drift(self):
+        CategoryStats.objects.all().update(active_count=99)
+        call_command("rebuild_category_stats", stdout=io.StringIO())
+        self.assertEqual(self.stats(self.tools).active_count, 2)
+        self.assertEqual(self.stats(self.garden).active_count, 0)
+
+
+class AsyncReadViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name="Kettles")
+        self.products = [
+            Product.objects.create(name=f"Kettle {i}", price=20 + i, stock=5, category=self.category)
+            for i in range(3)
+        ]
+        self.admin = CustomUser.objects.create_superuser(username="admin", email="admin@example.com", password="pass")
+        self.factory = AsyncRequestFactory()
+
+    def bearer(self, user):
+        return {"Authorization": f"Bearer {RefreshToken.for_user(user).access_token}"}
+
+    async def test_product_list_matches_sync_and_shares_its_cache(self):
+        response = await async_views.product_list(self.factory.get("/api/products/", {"ordering": "price"}))
+        self.assertEqual(response.status_code, 200)
+        body = json.loads(response.content)
+        self.assertEqual([row["name"] for row in body["results"]], ["Kettle 0", "Kettle 1", "Kettle 2"])
+        self.assertEqual(body["count"], 3)
+
+        sync_response = await sync_to_async(APIClient().get)("/api/products/", {"ordering": "price"})
+        self.assertEqual(json.loads(sync_response.content), body)
+        self.assertEqual((await sync_to_async(product_cache.cache_stats)())["hits"], 1)
+
+    async def test_product_detail_etag_and_404(self):
+        product = self.products[0]
+        url = f"/api/products/{product.id}/"
+        response = await async_views.product_detail(self.factory.get(url), pk=product.id)
+        self.assertEqual(json.loads(response.content)["name"], "Kettle 0")
+        request = self.factory.get(url, headers={"If-None-Match": response["ETag"]})
+        self.assertEqual((await async_views.product_detail(request, pk=product.id)).status_code, 304)
+
+        sync_response = await sync_to_async(APIClient().get)(url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(sync_response.status_code, 304)
+        missing = await async_views.product_detail(self.factory.get("/api/products/x/"), pk="x" * 22)
+        self.assertEqual(missing.status_code, 404)
+
+    async def test_category_list_checks_permissions(self):
+        response = await async_views.category_list(self.factory.get("/api/categories/"))
+        self.assertEqual(response.status_code, 401)
+        headers = await sync_to_async(self.bearer)(self.admin)
+        response = await async_views.category_list(self.factory.get("/api/categories/", headers=headers))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)["results"][0]["name"], "Kettles")
+        self.assertEqual(response["Cache-Control"], "public, max-age=3600")
+
+    async def test_review_list_and_write_fallback(self):
+        headers = await sync_to_async(self.bearer)(self.admin)
+        request = self.factory.post(
+            "/api/reviews/", {"product_id": self.products[0].id, "rating": 4, "comment": "Quick"}, content_type="application/json", headers=headers,
+        )
+        self.assertEqual((await async_views.review_list(request)).status_code, 201)
+        response = await async_views.review_list(self.factory.get("/api/reviews/"))
+        self.assertEqual(json.loads(response.content)["results"][0]["rating"], 4)
+
+
+class InstrumentationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        reset_metrics()
+        # The test database connection was opened before any middleware was
+        # loaded, so it never went through connection_created
+        install_query_hook(connection)
+        self.client = APIClient()
+        category = Category.objects.create(name="Lamps")
+        for i in range(3):
+            Product.objects.create(name=f"Lamp {i}", price=10 + i, stock=5, category=category)
+
+    def timing(self, response):
+        return dict(
+            (entry.split(";", 1) + [""])[:2] for entry in response["Server-Timing"].split(", ")
+        )
+
+    def test_server_timing_reports_queries_and_cache(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get("/api/products/")
+        timing = self.timing(response)
+        self.assertIn(f'desc="{len(ctx.captured_queries)} queries"', timing["db"])
+        self.assertEqual(timing["cache"], 'desc="hits=0 misses=1"')
+        self.assertIn("total", timing)
+
+        timing = self.timing(self.client.get("/api/products/"))
+        self.assertEqual(timing["cache"], 'desc="hits=1 misses=0"')
+        self.assertIn('desc="0 queries"', timing["db"])
+
+    def test_metrics_endpoint_aggregates_per_route(self):
+        self.client.get("/api/products/")
+        self.client.get("/api/products/")
+        self.assertEqual(self.client.get("/api/metrics/").status_code, 401)
+
+        admin = CustomUser.objects.create_user(username="admin", email="admin@example.com", password="pass",
+                                               is_staff=True)
+        self.client.force_authenticate(admin)
+        routes = self.client.get("/api/metrics/").json()["routes"]
+        stats = routes["GET api/products/$"]
+        self.assertEqual(stats["count"], 2)
+        self.assertEqual(sum(stats["duration_buckets"].values()), 2)
+        self.assertEqual(sum(stats["query_buckets"].values()), 2)
+        self.assertEqual((stats["cache_hits"], stats["cache_misses"]), (1, 1))
+        self.assertGreater(stats["serializer_ms"], 0)
+
+        self.assertEqual(self.client.delete("/api/metrics/").status_code, 204)
+        self.assertNotIn("GET api/products/$", self.client.get("/api/metrics/").json()["routes"])
+
+    def test_repeated_statements_are_logged(self):
+        def n_plus_one(request):
+            for product in Product.objects.all():
+                Category.objects.get(pk=product.category_id)
+            return HttpResponse()
+
+        with self.settings(N_PLUS_ONE_THRESHOLD=3), self.assertLogs("ecommerce.instrumentation", "WARNING") as logs:
+            response = InstrumentationMiddleware(n_plus_one)(RequestFactory().get("/"))
+        self.assertIn("ran 3 times", logs.output[0])
+        self.assertIn('n-plus-one;desc="1 statements repeated"', response["Server-Timing"])
+        self.assertEqual(route_metrics()["GET <unmatched>"]["n_plus_one"], 1)
+
+    def test_can_be_switched_off(self):
+        with self.settings(INSTRUMENTATION_ENABLED=False):
+            response = APIClient().get("/api/products/")
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("Server-Timing", response)
+        self.assertEqual(route_metrics(), {})
+
+    async def test_async_requests_are_measured(self):
+        response = await self.async_client.get("/api/products/")
+        self.assertEqual(response.status_code, 200)
+        timing = self.timing(response)
+        self.assertNotIn('desc="0 queries"', timing["db"])
+        self.assertEqual(timing["cache"], 'desc="hits=0 misses=1"')
+
+
+class DatabaseConnectionTests(TestCase):
+    def test_statement_timeout_is_set(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT current_setting('statement_timeout')")
+            self.assertEqual(cursor.fetchone()[0], f"{settings.DB_STATEMENT_TIMEOUT_MS // 1000}s")
+
+    def test_maintenance_work_runs_without_timeout(self):
+        def timeout():
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT current_setting('statement_timeout')")
+                return cursor.fetchone()[0]
+
+        with no_statement_timeout():
+            self.assertEqual(timeout(), "0")
+        self.assertEqual(timeout(), "30s")
+
+        lift_for_migrations(using="default")
+        self.assertEqual(timeout(), "0")
+        restore_after_migrations(using="default")
+        self.assertEqual(timeout(), "30s")
+
+    def test_metrics_report_connection_mode(self):
+        admin = CustomUser.objects.create_user(username="admin", email="admin@example.com", password="pass",
+                                               is_staff=True)
+        client = APIClient()
+        client.force_authenticate(admin)
+        database = client.get("/api/metrics/").json()["databases"]["default"]
+        self.assertEqual(database["mode"], settings.DB_CONNECTIONS)
+        if settings.DB_CONNECTIONS == "pool":
+            self.assertEqual(database["pool_max"], settings.DB_POOL["max_size"])
+            self.assertGreaterEqual(database["requests_num"], 1)
+
+
+@override_settings(DB_REPLICAS=["replica"])
+class ReplicaRoutingTests(TransactionTestCase):
+    """
+    ``replica`` is a second Postgres database that only gets rows when a
+    test calls ``replicate()``: a replica lagging behind until told otherwise.
+    """
+    client_class = APIClient
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Added once the test case is set up: the test runner only knows the
+        # databases in settings
+        conf = {key: settings.DATABASES["default"][key] for key in ("ENGINE", "USER", "PASSWORD", "HOST", "PORT")}
+        conf.update(NAME="ecommerce_replica", TEST={"NAME": "test_ecommerce_replica"})
+        settings.DATABASES["replica"] = connections.configure_settings(
+            {"default": settings.DATABASES["default"], "replica": conf}
+        )["replica"]
+        cls.databases = cls.databases | {"replica"}
+        # The router keeps migrations off replicas
+        with override_settings(DB_REPLICAS=[]):
+            connections["replica"].creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+
+    @classmethod
+    def tearDownClass(cls):
+        connections["replica"].creation.destroy_test_db("ecommerce_replica", verbosity=0)
+        del connections["replica"]
+        del settings.DATABASES["replica"]
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user(username="shopper", email="shopper@example.com", password="pass")
+        self.category = Category.objects.create(name="Lamps")
+        self.product = Product.objects.create(name="Desk lamp", price=10, stock=5, category=self.category)
+
+    def tearDown(self):
+        # TransactionTestCase only flushes the tables the router lets it migrate
+        with override_settings(DB_REPLICAS=[]):
+            call_command("flush", database="replica", interactive=False, inhibit_post_migrate=True, verbosity=0)
+
+    def replicate(self):
+        """Let the replica catch up with the primary"""
+        for model in (CustomUser, Category, Product, Review):
+            rows = list(model._base_manager.using("default"))
+            model._base_manager.using("replica").bulk_create(rows, ignore_conflicts=True)
+
+    def bearer(self, user):
+        return {"Authorization": f"Bearer {RefreshToken.for_user(user).access_token}"}
+
+    def reviews(self, client=None, **kwargs):
+        return (client or self.client).get("/api/reviews/", **kwargs).json()["results"]
+
+    def test_catalog_reads_come_from_a_replica(self):
+        Review.objects.create(user=self.user, product=self.product, rating=5, comment="Bright")
+        self.assertEqual(self.reviews(), [])
+        self.replicate()
+        self.assertEqual([review["comment"] for review in self.reviews()], ["Bright"])
+
+    def test_writer_reads_their_own_writes(self):
+        headers = self.bearer(self.user)
+        # Validating the product runs on the primary too: the replica doesn't have it
+        response = self.client.post("/api/reviews/", {"product_id": self.product.pk, "rating": 4, "comment": "Fine"},
+                                    format="json", headers=headers)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.cookies[STICKY_COOKIE]["max-age"], settings.DB_REPLICA_STICKY_SECONDS)
+
+        # Token clients are recognised without the cookie
+        self.client.cookies.clear()
+        self.assertEqual(len(self.reviews(headers=headers)), 1)
+        browser = APIClient()
+        browser.cookies[STICKY_COOKIE] = "1"
+        self.assertEqual(len(self.reviews(browser)), 1)
+        self.assertEqual(self.reviews(APIClient()), [])
+
+        cache.delete(sticky_key(self.user.pk))
+        self.assertEqual(self.reviews(headers=headers), [])
+
+    def test_cache_rebuilds_read_the_primary_while_replicas_lag(self):
+        # The product was just created, so the page is built from the primary
+        self.assertEqual(len(self.client.get("/api/products/").json()["results"]), 1)
+        cache.set(product_cache.CHANGED_KEY, time.time() - settings.DB_REPLICA_STICKY_SECONDS - 1, timeout=None)
+        self.assertEqual(self.client.get("/api/products/", {"ordering": "price"}).json()["results"], [])
+        self.assertEqual(self.client.get(f"/api/products/{self.product.pk}/").status_code, 404)
+
+    def test_views_can_opt_out(self):
+        Review.objects.create(user=self.user, product=self.product, rating=5, comment="Bright")
+        request = RequestFactory().get("/api/reviews/")
+        for replica_reads, expected in [(True, 0), (False, 1)]:
+            view = ReplicaMiddleware(ReviewViewSet.as_view({"get": "list"}, replica_reads=replica_reads))
+            self.assertEqual(len(view(request).data["results"]), expected)
+        # The cached menu is always built from the primary
+        menu = self.client.get("/api/categories/navigation/").json()
+        self.assertEqual([category["name"] for category in menu], ["Lamps"])
+
+    def test_router_outside_requests(self):
+        router = ReplicaRouter()
+        self.assertIsNone(router.db_for_read(Product))
+        self.assertEqual(router.db_for_write(Product), "default")
+        self.assertFalse(router.allow_migrate("replica", "products"))
+        self.assertIsNone(router.allow_migrate("default", "products"))
+
+
+class ProfilingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.admin = CustomUser.objects.create_user(username="admin", email="admin@example.com", password="pass",
+                                                    is_staff=True)
+        self.user = CustomUser.objects.create_user(username="shopper", email="shopper@example.com", password="pass")
+        category = Category.objects.create(name="Lamps")
+        Product.objects.create(name="Desk lamp", price=10, stock=5, category=category)
+
+    def bearer(self, user):
+        return {"Authorization": f"Bearer {RefreshToken.for_user(user).access_token}"}
+
+    def test_staff_header_profiles_request(self):
+        response = self.client.get("/api/products/", headers={"X-Profile": "1", **self.bearer(self.admin)})
+        self.assertEqual(response.status_code, 200)
+        profile = RequestProfile.objects.get(pk=response["X-Profile-Id"])
+        self.assertEqual((profile.route, profile.trigger, profile.user), ("api/products/$", "requested", self.admin))
+        self.assertTrue(profile.filename.startswith("api-products-"))
+        self.assertIn("cumulative", profile.summary)
+        functions = marshal.loads(bytes(profile.stats))
+        self.assertTrue(any(name == "list" for _, _, name in functions))
+
+    def test_header_from_non_staff_is_ignored(self):
+        response = self.client.get("/api/products/", headers={"X-Profile": "1", **self.bearer(self.user)})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("X-Profile-Id", response)
+        response = self.client.get("/api/products/", headers={"X-Profile": "1"})
+        self.assertNotIn("X-Profile-Id", response)
+        self.assertFalse(RequestProfile.objects.exists())
+
+    def test_sampling_is_rate_limited(self):
+        with self.settings(PROFILING_SAMPLE_RATE=1.0, PROFILING_MAX_PER_MINUTE=2):
+            responses = [self.client.get("/api/products/") for _ in range(4)]
+            # Only API paths are sampled
+            self.client.get("/admin/login/")
+        self.assertEqual(["X-Profile-Id" in response for response in responses], [True, True, False, False])
+        self.assertEqual(RequestProfile.objects.filter(trigger="sampled").count(), 2)
+
+    def test_admin_lists_and_downloads_profiles(self):
+        profile_id = self.client.get(
+            "/api/products/", headers={"X-Profile": "1", **self.bearer(self.admin)}
+        )["X-Profile-Id"]
+        self.admin.is_superuser = True
+        self.admin.save()
+        self.client.force_login(self.admin)
+        self.assertContains(self.client.get("/admin/products/requestprofile/"), "api/products/$")
+        response = self.client.get(f"/admin/products/requestprofile/{profile_id}/download/")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(".pstats", response["Content-Disposition"])
+        with tempfile.NamedTemporaryFile(suffix=".pstats") as dump:
+            dump.write(response.content)
+            dump.flush()
+            self.assertGreater(pstats.Stats(dump.name).total_calls, 0)
+
+    async def test_async_requests_can_be_profiled(self):
+        with self.settings(PROFILING_SAMPLE_RATE=1.0):
+            response = await self.async_client.get("/api/products/")
+        self.assertEqual(response.status_code, 200)
+        profile = await RequestProfile.objects.aget(pk=response["X-Profile-Id"])
+        # The sync view ran in a worker thread, and that is where it was traced
+        functions = {name for _, _, name in marshal.loads(bytes(profile.stats))}
+        self.assertLessEqual({"list", "get_queryset"}, functions)
+
+
+class BenchmarkSeedTests(TestCase):
+    def snapshot(self):
+        return (
+            list(Product.all_objects.filter(pk__startswith=ID_PREFIX).order_by("pk")
+                 .values_list("pk", "name", "price", "stock", "category_id", "created_at")),
+            list(Review.objects.filter(pk__startswith=ID_PREFIX).order_by("pk")
+                 .values_list("user_id", "product_id", "rating")),
+            list(Order.objects.filter(pk__startswith=ID_PREFIX).order_by("pk")
+                 .values_list("customer_id", "total_price")),
+            list(OrderItem.objects.filter(order__id__startswith=ID_PREFIX).order_by("pk")
+                 .values_list("product_id", "quantity", "price")),
+        )
+
+    def test_scale_parsing(self):
+        self.assertEqual(parse_scale("10k"), 10_000)
+        self.assertEqual(parse_scale("1M"), 1_000_000)
+        self.assertEqual(parse_scale(2500), 2500)
+        self.assertEqual(plan("10k")["users"], 1000)
+        with self.assertRaises(ValueError):
+            parse_scale("lots")
+
+    def test_seed_is_deterministic_and_clear_keeps_real_data(self):
+        category = Category.objects.create(name="Real")
+        real = Product.objects.create(name="Real lamp", price=10, stock=1, category=category)
+
+        counts = seed_benchmark(300, seed=7)
+        self.assertEqual(Product.all_objects.filter(pk__startswith=ID_PREFIX).count(), counts["products"])
+        self.assertEqual(OrderItem.objects.filter(order__id__startswith=ID_PREFIX).count(), counts["order_items"])
+        self.assertEqual(Cart.objects.filter(pk__startswith=ID_PREFIX).count(), counts["carts"])
+        self.assertEqual(CustomUser.objects.filter(email__endswith="@bench.invalid").count(), counts["users"])
+        self.assertTrue(is_seeded(300, 7))
+        self.assertFalse(is_seeded(300, 8))
+        stats = CategoryStats.objects.filter(category__id__startswith=ID_PREFIX)
+        self.assertEqual(stats.aggregate(total=Sum("active_count"))["total"], 300)
+        self.assertTrue(Product.objects.filter(pk__startswith=ID_PREFIX, search_vector__isnull=False).exists())
+        order = Order.objects.filter(pk__startswith=ID_PREFIX).first()
+        self.assertEqual(order.total_price, sum(item.price * item.quantity for item in order.items.all()))
+        first = self.snapshot()
+
+        clear_benchmark()
+        self.assertFalse(Product.all_objects.filter(pk__startswith=ID_PREFIX).exists())
+        self.assertFalse(CustomUser.objects.filter(email__endswith="@bench.invalid").exists())
+        self.assertTrue(Product.objects.filter(pk=real.pk).exists())
+
+        seed_benchmark(300, seed=7)
+        self.assertEqual(self.snapshot(), first)
+
+    def test_compare_flags_regressions(self):
+        def run(rps, p95, queries, errors=0):
+            summary = {"rps": rps, "p50_ms": 10, "p95_ms": p95, "p99_ms": 50, "queries_per_request": queries,
+                       "errors": errors}
+            return {"meta": {"scale": 10_000, "seed": 1, "concurrency": 8}, "endpoints": {"products-list": summary}}
+
+        baseline = run(100, 20, 3)
+        self.assertEqual(compare_runs(run(95, 21, 3.2), baseline), [])
+        problems = compare_runs(run(80, 30, 5, errors=2), baseline)
+        self.assertEqual(len(problems), 4)
+        self.assertTrue(any("queries per request" in problem for problem in problems))
+        with self.assertRaises(NotComparable):
+            compare_runs(run(100, 20, 3), {**baseline, "meta": {**baseline["meta"], "concurrency": 16}})
+
+
+class BenchmarkLoadTests(LiveServerTestCase):
+    def test_load_covers_every_route(self):
+        seed_benchmark(200, seed=1)
+        users = CustomUser.objects.filter(pk__in=[benchmark_user_id(n) for n in range(2)])
+        tokens = [str(RefreshToken.for_user(user).access_token) for user in users]
+        results = run_load(self.live_server_url, api_endpoints(200, seed=1), concurrency=2, duration=1.5,
+                           tokens=tokens)
+        for name, summary in results["endpoints"].items():
+            self.assertEqual(summary["errors"], 0, name)
+        busy = [summary for summary in results["endpoints"].values() if summary["requests"]]
+        self.assertTrue(busy)
+        self.assertTrue(all(summary["queries_per_request"] is not None for summary in busy))
+        self.assertLessEqual(results["total"]["p50_ms"], results["total"]["p99_ms"])
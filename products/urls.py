@@ -1,8 +1,9 @@
-from django.urls import path, include
+from django.conf import settings
+from django.urls import path, include, re_path
 from rest_framework.routers import DefaultRouter
 
 from . import views
-from .views import CategoryViewSet, ProductViewSet, OrderViewSet, CartViewSet, OrderItemViewSet
+from .views import CategoryViewSet, ProductViewSet, OrderViewSet, CartViewSet, OrderItemViewSet, ExportView
 
 router = DefaultRouter()
 router.register(r'categories', CategoryViewSet,basename='categories')
@@ -15,6 +16,19 @@ router.register(r'reviews', views.ReviewViewSet, basename='reviews')
 
 urlpatterns = [
     path('api/', include(router.urls)),
+    path('api/export/<str:kind>/', ExportView.as_view(), name='export'),
 
 
 ]
+
+if settings.ASYNC_READ_VIEWS:
+    from . import async_views
+
+    # Checked before the router; the detail pattern only matches generated
+    # 22-character ids so it never shadows actions like products/autocomplete/
+    urlpatterns = [
+        path('api/products/', async_views.product_list),
+        re_path(r'^api/products/(?P<pk>[0-9A-Za-z]{22})/$', async_views.product_detail),
+        path('api/categories/', async_views.category_list),
+        path('api/reviews/', async_views.review_list),
+    ] + urlpatterns
@@ -1,31 +1,86 @@
-import hashlib
+from decimal import Decimal
+from types import GeneratorType
 
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import viewsets, filters, status, permissions
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from ecommerce.db_router import ReplicaReadsMixin
 
 from . import serializers
+from . import cache as product_cache
+from .export import EXPORTS, FORMATS, astream_export, stream_export
+from .navigation import navigation
 from .models import Category, Product, Order, OrderItem, Cart, Review
 from .serializers import CategorySerializer, ProductSerializer, OrderSerializer, CartSerializer, OrderItemSerializer, \
-    ReviewSerializer
+    ReviewSerializer, StockReservationSerializer, CartSummaryLineSerializer
 
-from rest_framework.permissions import IsAuthenticatedOrReadOnly
+from rest_framework.permissions import AllowAny, IsAuthenticatedOrReadOnly
 from rest_framework.decorators import action
-from django.core.cache import cache
-
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.exceptions import ValidationError
+from rest_framework.parsers import JSONParser
+
+from .pagination import KeysetPagination
+from .search import ProductSearchFilter, autocomplete
+from .parsers import NDJSONParser
+from .services import (
+    BULK_CHUNK_SIZE, EmptyCart, InsufficientStock, add_order_item, bulk_upsert_products, checkout_cart, reserve_cart,
+    set_active,
+)
 from rest_framework.permissions import IsAdminUser  # Add this
 
-class CategoryViewSet(viewsets.ModelViewSet):
+
+class SoftDeleteMixin:
+    """
+    DELETE deactivates the object instead of removing it, and admins get
+    ``bulk-delete``/``bulk-restore`` actions taking ``{"ids": [...]}``.
+    """
+
+    def perform_destroy(self, instance):
+        set_active(type(instance).objects.filter(pk=instance.pk), False)
+
+    def deletable(self, queryset):
+        """Narrow ``queryset`` to the rows bulk-delete may deactivate"""
+        return queryset
+
+    def requested_ids(self, request):
+        ids = request.data.get('ids') if isinstance(request.data, dict) else None
+        if not isinstance(ids, list) or not all(isinstance(pk, str) for pk in ids):
+            raise ValidationError({"ids": "Expected a list of ids."})
+        return ids
+
+    @action(detail=False, methods=['post'], url_path='bulk-delete', permission_classes=[IsAdminUser])
+    def bulk_delete(self, request):
+        model = self.get_queryset().model
+        ids = self.requested_ids(request)
+        deactivated = set_active(self.deletable(model.objects.filter(pk__in=ids)), False)
+        return Response({"deactivated": deactivated})
+
+    @action(detail=False, methods=['post'], url_path='bulk-restore', permission_classes=[IsAdminUser])
+    def bulk_restore(self, request):
+        model = self.get_queryset().model
+        restored = set_active(model.all_objects.filter(pk__in=self.requested_ids(request)), True)
+        return Response({"restored": restored})
+
+
+class CategoryViewSet(ReplicaReadsMixin, SoftDeleteMixin, product_cache.CachedListMixin,
+                      product_cache.CachedDetailMixin, viewsets.ModelViewSet):
     """Manage product categories"""
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
     permission_classes = [IsAdminUser]  # Only admin users should manage categories
-    pagination_class = PageNumberPagination
+    pagination_class = KeysetPagination
     filter_backends = [filters.SearchFilter]
     search_fields = ['name']
+    ordering = ['name']
+    cache_prefix = 'categories'
+    detail_cache_label = 'category'
 
     # Override list to add caching headers
     def list(self, request, *args, **kwargs):
@@ -41,36 +96,67 @@ class CategoryViewSet(viewsets.ModelViewSet):
                 {"error": "Cannot delete category with associated products"},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        category.delete()
+        self.perform_destroy(category)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    def deletable(self, queryset):
+        # Same rule as destroy(): only categories without live products
+        return queryset.exclude(products__is_active=True)
+
+    # The menu is cached until the next category change, so build it from the primary
+    @action(detail=False, methods=['get'], permission_classes=[AllowAny], replica_reads=False)
+    def navigation(self, request):
+        """Storefront menu: live categories with product counts and price range"""
+        return Response(navigation())
+
 
 
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(ReplicaReadsMixin, SoftDeleteMixin, product_cache.CachedListMixin,
+                     product_cache.CachedDetailMixin, viewsets.ModelViewSet):
     """Manage products"""
-    queryset = Product.objects.select_related('category').all()
+    queryset = Product.objects.select_related('category').with_ratings()
     serializer_class = ProductSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
-    search_fields = ['name', 'description', 'category__name']
+    filter_backends = [DjangoFilterBackend, ProductSearchFilter, filters.OrderingFilter]
+    search_fields = ['name', 'description', 'category__name']  # Weighted in products.search
     filterset_fields = ['price', 'stock', 'category']
     ordering_fields = ['price', 'created_at', 'name']
-    pagination_class = PageNumberPagination
-
-
-    def list(self, request, *args, **kwargs):
-        # Create a safe cache key
-        params = request.query_params.urlencode()
-        params_hash = hashlib.md5(params.encode('utf-8')).hexdigest()
-        cache_key = f'products_{params_hash}'
-
-        cached_data = cache.get(cache_key)
-        if cached_data is not None:  # Explicit None check
-            return Response(cached_data)
-
-        response = super().list(request, *args, **kwargs)
-        cache.set(cache_key, response.data, timeout=60 * 15)  # Cache for 15 minutes
-        return response
+    ordering = ['-created_at']
+    pagination_class = KeysetPagination
+    cache_prefix = 'products'
+    detail_cache_label = 'product'
+
+    def get_cache_dependencies(self, instance):
+        # The detail shows the category name, so a rename must refresh it
+        dependencies = [('product', instance.pk)]
+        if instance.category_id:
+            dependencies.append(('category', instance.category_id))
+        return dependencies
+
+    @action(detail=False, methods=['get'])
+    def autocomplete(self, request):
+        products = autocomplete(Product.objects.all(), request.query_params.get('q', ''))
+        return Response([{'id': product.id, 'name': product.name} for product in products])
+
+    @action(detail=False, methods=['post'], permission_classes=[IsAdminUser], parser_classes=[JSONParser, NDJSONParser])
+    def bulk(self, request):
+        """Create or update many products from a JSON list or an NDJSON stream"""
+        rows = request.data
+        if not isinstance(rows, (list, GeneratorType)):
+            return Response({"error": "Expected a list of products"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            chunk_size = max(1, int(request.query_params.get('chunk_size', BULK_CHUNK_SIZE)))
+        except ValueError:
+            return Response({"error": "chunk_size must be an integer"}, status=status.HTTP_400_BAD_REQUEST)
+        saved, errors = bulk_upsert_products(rows, chunk_size)
+        return Response({"saved": saved, "errors": errors})
+
+    @action(detail=False, methods=['get'], url_path='cache-stats', permission_classes=[IsAdminUser])
+    def cache_stats(self, request):
+        stats = product_cache.cache_stats()
+        if hasattr(cache, 'metrics'):
+            stats['tiers'] = cache.metrics()
+        return Response(stats)
 
 
     # Add validation for product creation
@@ -80,11 +166,13 @@ class ProductViewSet(viewsets.ModelViewSet):
         serializer.save()
 
 
-class ReviewViewSet(viewsets.ModelViewSet):
+class ReviewViewSet(ReplicaReadsMixin, viewsets.ModelViewSet):
     """Manage product reviews"""
-    queryset = Review.objects.select_related('user', 'product').all()
+    queryset = Review.objects.select_related('user', 'product').filter(product__is_active=True)
     serializer_class = ReviewSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    pagination_class = KeysetPagination
+    ordering = ['-created_at']
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
@@ -95,9 +183,11 @@ class OrderViewSet(viewsets.ModelViewSet):
     queryset = Order.objects.all()
     serializer_class = OrderSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
+    ordering = ['-created_at']
 
     def get_queryset(self):
-        return Order.objects.filter(customer=self.request.user)
+        return Order.objects.filter(customer=self.request.user).with_items()
 
     def perform_create(self, serializer):
         """Create an order with the logged-in user"""
@@ -110,10 +200,10 @@ class OrderItemViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        return OrderItem.objects.filter(order__customer=self.request.user)
+        return OrderItem.objects.filter(order__customer=self.request.user).with_product()
 
     def retrieve(self, request, pk=None, *args, **kwargs):
-        order = get_object_or_404(Order, pk=pk, customer=request.user)
+        order = get_object_or_404(Order.objects.with_items(), pk=pk, customer=request.user)
         serializer = OrderSerializer(order)
         return Response(serializer.data)
 
@@ -124,33 +214,16 @@ class OrderItemViewSet(viewsets.ModelViewSet):
 
     def perform_create(self, serializer):
         order_id = self.request.data.get('order_id')
-        product_id = self.request.data.get('product_id')
-        quantity = int(self.request.data.get('quantity', 1))  # ensure it's an int
-
-        # Get order and product
         order = get_object_or_404(Order, id=order_id, customer=self.request.user)
-        product = get_object_or_404(Product, id=product_id)
-
-        # Check if item already exists in this order
-        existing_item = OrderItem.objects.filter(order=order, product=product).first()
 
-        if existing_item:
-            # Update quantity and price
-            existing_item.quantity += quantity
-            existing_item.price += product.price * quantity
-            existing_item.save()
+        quantity = serializer.validated_data['quantity']
+        if quantity < 1:
+            raise ValidationError({"quantity": "Quantity must be at least 1."})
 
-            # Also update order total
-            order.total_price += product.price * quantity
-            order.save()
-        else:
-            # New order item
-            item_price = product.price * quantity
-            serializer.save(order=order, product=product, quantity=quantity, price=item_price)
-
-            # Update order total
-            order.total_price += item_price
-            order.save()
+        try:
+            serializer.instance = add_order_item(order, serializer.validated_data['product'], quantity)
+        except InsufficientStock as exc:
+            raise ValidationError({"quantity": str(exc)})
 
 
 class CartViewSet(viewsets.ModelViewSet):
@@ -160,13 +233,77 @@ class CartViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        return Cart.objects.filter(user=self.request.user)
+        return Cart.objects.filter(user=self.request.user).with_totals()
+
+    @action(detail=False, methods=['get'])
+    def summary(self, request):
+        """Lines with their totals, the subtotal and the item count in one query"""
+        lines = list(self.get_queryset().order_by('product__name', 'pk'))
+        return Response({
+            "items": CartSummaryLineSerializer(lines, many=True).data,
+            "subtotal": lines[0].subtotal if lines else Decimal('0.00'),
+            "item_count": lines[0].item_count if lines else 0,
+        })
+
+    @action(detail=False, methods=['get'])
+    def count(self, request):
+        """Cheap item count for the header badge"""
+        return Response({"count": product_cache.cart_count(request.user)})
 
     def perform_create(self, serializer):
         """Ensure the cart belongs to the authenticated user"""
         serializer.save(user=self.request.user)
 
+    @action(detail=False, methods=['post'])
+    def reserve(self, request):
+        """Hold stock for the whole cart until the reservations expire"""
+        try:
+            reservations = reserve_cart(request.user)
+        except InsufficientStock as exc:
+            return Response({"error": str(exc)}, status=status.HTTP_409_CONFLICT)
+        return Response(StockReservationSerializer(reservations, many=True).data, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=['post'])
+    def checkout(self, request):
+        """Place an order for everything in the cart and empty it"""
+        try:
+            order = checkout_cart(request.user)
+        except EmptyCart:
+            return Response({"error": "Cart is empty"}, status=status.HTTP_400_BAD_REQUEST)
+        except InsufficientStock as exc:
+            return Response({"error": str(exc)}, status=status.HTTP_409_CONFLICT)
+        order = Order.objects.with_items().get(pk=order.pk)
+        return Response(OrderSerializer(order).data, status=status.HTTP_201_CREATED)
+
     def destroy(self, request, *args, **kwargs):
         cart = get_object_or_404(Cart, user=self.request.user,pk=kwargs['pk'])
         cart.delete()
-        return Response("Cart deleted successfully",status=status.HTTP_204_NO_CONTENT)
\ No newline at end of file
+        return Response("Cart deleted successfully",status=status.HTTP_204_NO_CONTENT)
+
+
+class ExportView(APIView):
+    """Stream products, orders or reviews as NDJSON or CSV, optionally gzipped"""
+    permission_classes = [IsAdminUser]
+
+    def dispatch(self, request, *args, **kwargs):
+        # The Django request: DRF's wrapper doesn't say which handler it came from
+        self.asgi = isinstance(request, ASGIRequest)
+        return super().dispatch(request, *args, **kwargs)
+
+    def get(self, request, kind):
+        if kind not in EXPORTS:
+            return Response({"error": f"Unknown export {kind}"}, status=status.HTTP_404_NOT_FOUND)
+        output = request.query_params.get('output', 'ndjson')
+        if output not in FORMATS:
+            return Response({"error": f"output must be one of {', '.join(FORMATS)}"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        gzip = request.query_params.get('gzip', '').lower() in ('1', 'true')
+
+        filename = f"{kind}.{output}"
+        stream = astream_export if self.asgi else stream_export
+        response = StreamingHttpResponse(
+            stream(kind, output, gzip),
+            content_type='application/gzip' if gzip else FORMATS[output],
+        )
+        response['Content-Disposition'] = f'attachment; filename="{filename}{".gz" if gzip else ""}"'
+        return response